@@ -0,0 +1,147 @@
+"""
+Checkpoints.py implements incremental checkpoints of the model during training.
+
+Every CHECKPOINT_EVERY encounters PPA_Learn writes a checkpoint segment: A model file (refer to ModelFile.py) that
+holds only the states added or updated since the previous segment, with the index of the last completed
+encounter in its header. Segments are numbered and never modified once written, and every file is written to a
+temporary file and renamed, so a crash leaves either a whole segment or none.
+
+Compaction folds the segments, in order, into a single model: A state in a later segment replaces the same state
+in the earlier ones. Training resumes from the encounter after the last one recorded in the checkpoints (a parallel
+run from the first encounter of the batch it was interrupted in, refer to rollbackCheckpoints()); run:
+    python3 -m PPA.Checkpoints -d <checkpoints directory> -o <model.ppa>
+to compact the checkpoints of a training run into a model file.
+"""
+from PPA.ModelFile import *
+import glob
+
+# Name of the compacted model that replaces the segments folded into it.
+CHECKPOINT_BASE = 'base.ppa'
+
+
+def segmentPaths(checkpoint_dir):
+    """
+    Paths of the checkpoint segments in a directory, in the order they were written.
+    """
+    return sorted(glob.glob(os.path.join(checkpoint_dir, 'segment-*.ppa')))
+
+
+def writeSegment(model_store: ModelStore, checkpoint_dir, last_encounter, training_number=None):
+    """
+    Write the states updated since the last segment to a new segment.
+    :param model_store: The model being trained: Its changes are cleared once the segment is written (refer to
+                        ModelStore.changes()). If the write fails they are kept for the next segment.
+    :param checkpoint_dir: Directory of the checkpoints of this training run.
+    :param last_encounter: Index of the last encounter whose knowledge is in the model.
+    :param training_number: Number of the training run, recorded in the header (refer to checkpointTrainingNumber()).
+    :return: Path to the new segment.
+    """
+    os.makedirs(checkpoint_dir, exist_ok=True)
+    segments = segmentPaths(checkpoint_dir)
+    segment_index = int(os.path.basename(segments[-1])[8:-4]) + 1 if segments else 0
+    segment_path = os.path.join(checkpoint_dir, f'segment-{segment_index:06d}.ppa')
+
+    changes = model_store.changes()
+    saveModelFile(changes, segment_path,
+                  {'segment': segment_index, 'last_encounter': last_encounter, 'training_number': training_number})
+    model_store.clearChanges(changes.models)
+    return segment_path
+
+
+def checkpointPaths(checkpoint_dir):
+    """
+    Paths of the compacted base model (if any) and of the segments of a directory, in the order they fold.
+    """
+    base_path = os.path.join(checkpoint_dir, CHECKPOINT_BASE)
+    return ([base_path] if os.path.exists(base_path) else []) + segmentPaths(checkpoint_dir)
+
+
+def checkpointTrainingNumber(checkpoint_dir):
+    """
+    Number of the training run the checkpoints of a directory belong to, read from their headers.
+    :return: The training number or None if the checkpoints do not record it (written by older versions).
+    """
+    for path in checkpointPaths(checkpoint_dir):
+        training_number = ColumnarModel(path).header.get('training_number')
+        if training_number is not None:
+            return training_number
+    return None
+
+
+def rollbackCheckpoints(checkpoint_dir, last_encounter):
+    """
+    Delete the segments with knowledge of the encounters after last_encounter (e.g. a partly learned batch of
+    encounters, refer to PARALLEL_BATCH_SIZE). The compacted base model is kept.
+    :return: Number of segments deleted.
+    """
+    deleted = 0
+    # Latest segments first: A crash in between leaves the segments of a prefix of the training run.
+    for segment_path in reversed(segmentPaths(checkpoint_dir)):
+        if ColumnarModel(segment_path).header['last_encounter'] > last_encounter:
+            os.remove(segment_path)
+            deleted += 1
+    return deleted
+
+
+def lastCheckpointedEncounter(checkpoint_dir):
+    """
+    Index of the last encounter recorded in the checkpoints of a directory or -1 if there are no checkpoints.
+    """
+    return max((ColumnarModel(path).header['last_encounter'] for path in checkpointPaths(checkpoint_dir)), default=-1)
+
+
+def loadCheckpoints(checkpoint_dir):
+    """
+    Fold the compacted base model and the segments of a directory into a single model.
+    :return: Tuple (ModelStore, index of the last completed encounter or -1 if there are no checkpoints).
+    """
+    model_store = ModelStore()
+    last_encounter = -1
+
+    for path in checkpointPaths(checkpoint_dir):
+        checkpoint = loadModel(path)
+        # Every segment holds whole states: The latest copy of a state replaces the previous ones.
+        for stateActionQN in checkpoint.values():
+            model_store.add(stateActionQN)
+        model_store.solved_encounters |= checkpoint.solved_encounters
+        last_encounter = max(last_encounter, checkpoint.header['last_encounter'])
+
+    # Everything loaded is already checkpointed.
+    model_store.popChanges()
+    return model_store, last_encounter
+
+
+def compactCheckpoints(checkpoint_dir):
+    """
+    Fold the segments of a directory into its base model and delete them.
+    :return: Tuple (ModelStore, index of the last completed encounter).
+    """
+    segments = segmentPaths(checkpoint_dir)
+    model_store, last_encounter = loadCheckpoints(checkpoint_dir)
+    if segments:
+        # The new base is in place before the segments are removed: A crash in between only repeats work.
+        saveModelFile(model_store, os.path.join(checkpoint_dir, CHECKPOINT_BASE),
+                      {'segment': None, 'last_encounter': last_encounter,
+                       'training_number': checkpointTrainingNumber(checkpoint_dir)})
+        for segment_path in segments:
+            os.remove(segment_path)
+
+    return model_store, last_encounter
+
+
+"""
+Main method: Compact the checkpoints of a training run.
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Compact the checkpoint segments of a training run.")
+    parser.add_argument('-d', action="store", dest="CHECKPOINT_DIR", required=True)
+    parser.add_argument('-o', action="store", dest="OUTPUT_MODEL", default=None,
+                        help="Also save the compacted model to this model file.")
+    args = parser.parse_args()
+
+    Learned_Model, last_encounter = compactCheckpoints(args.CHECKPOINT_DIR)
+    if args.OUTPUT_MODEL is not None:
+        saveModelFile(Learned_Model, args.OUTPUT_MODEL)
+    print("STATES MODELED: ", len(Learned_Model))
+    print("LAST ENCOUNTER: ", last_encounter)
@@ -2,6 +2,61 @@ import numpy as np
 from PPA.Global_constants import *
 
 
+def stateRadices(distance_bins=DISTANCE_BINS, angle_bins=ANGLE_BINS, speed_bins=SPEED_BINS):
+    """
+    Number of bins of every discrete feature in the order of DiscreteLocalState.as_numpy().
+    These are the radices used to pack the 7 bins of a discrete state into a single integer code.
+    """
+    return np.array([distance_bins, angle_bins, speed_bins, speed_bins,
+                     distance_bins, angle_bins, angle_bins], dtype=np.int64)
+
+
+def statePlaces(radices):
+    """
+    Place value of every feature in a mixed-radix code: The product of the radices of the less significant features.
+    """
+    return np.cumprod(np.append(1, radices[:0:-1]))[::-1]
+
+
+# Radices of the discrete state codes for the discretization set in Global_constants.
+STATE_RADICES = stateRadices()
+
+
+def packStateBins(bins, radices=STATE_RADICES):
+    """
+    Pack the bins of discrete states into mixed-radix integer codes (the first feature is the most significant).
+    :param bins: A list or (7,) array of bins or a (N,7) array with the bins of N discrete states.
+    :param radices: Number of bins of every feature, refer to stateRadices().
+    :return: An int code for a single state or a (N,) np.int64 array of codes.
+    """
+    if isinstance(bins, list) or np.ndim(bins) == 1:
+        # Single state: pure python arithmetic is faster than numpy for 7 numbers.
+        code = 0
+        for b, radix in zip(list(bins), radices.tolist()):
+            b = int(b)
+            if b < 0 or b >= radix:
+                raise ValueError(f'Bin {b} out of range for a feature with {radix} bins.')
+            code = code * radix + b
+        return code
+
+    bins = np.asarray(bins).astype(np.int64)
+    if np.any(bins < 0) or np.any(bins >= radices):
+        raise ValueError('Bins out of range for the discretization radices.')
+
+    return bins @ statePlaces(radices)
+
+
+def unpackStateCode(code, radices=STATE_RADICES):
+    """
+    Unpack mixed-radix integer codes into the bins of the discrete states.
+    :param code: A single code or an array of codes generated by packStateBins().
+    :param radices: Number of bins of every feature, refer to stateRadices().
+    :return: A (7,) array of bins for a single code or a (N,7) array for N codes.
+    """
+    codes = np.asarray(code, dtype=np.int64)
+    return (codes[..., np.newaxis] // statePlaces(radices)) % radices
+
+
 class DiscreteLocalState:
     """
         Represents a local state after discretization.
@@ -28,7 +83,9 @@ class DiscreteLocalState:
         self.angle_rel_vel_neg_rel_posBIN = a_r_v_p_bin
 
     def as_numpy(self):
-        ""
+        """
+            The bins of this discrete state as a numpy array.
+        """
         return np.array([self.dis_ownship_destBIN,
                          self.theta_destintation_ownshipBIN,
                          self.ownship_velBIN,
@@ -38,6 +95,21 @@ class DiscreteLocalState:
                          self.angle_rel_vel_neg_rel_posBIN
                          ])
 
+    def code(self):
+        """
+            The bins of this discrete state packed into a single integer, refer to packStateBins().
+        """
+        return packStateBins(self.as_numpy())
+
+    @staticmethod
+    def fromCode(code):
+        """
+            Generate the discrete state packed into an integer code by DiscreteLocalState.code().
+        """
+        d_o_bin, t_d_o_bin, o_v_bin, i_v_bin, d_i_o_bin, t_i_o_bin, a_r_v_p_bin = \
+            unpackStateCode(code).astype(np.float64)
+        return DiscreteLocalState(d_o_bin, d_i_o_bin, t_d_o_bin, t_i_o_bin, a_r_v_p_bin, o_v_bin, i_v_bin)
+
     def __str__(self):
         """
             A string representation of this discrete state.
@@ -4,49 +4,30 @@ Discretizers.py implements methods to discretize a local state.
 
 from PPA.Global_constants import *
 from PPA.DiscreteLocalState import *
+from PPA.UniformDiscretizer import *
 import numpy as np
-# Refer to sklearn pre-processing KBinsDiscretizer for details about discretization.
-from sklearn.preprocessing import KBinsDiscretizer
 
 
-def setUpdiscretizers():
+def setUpdiscretizers(distance_bins=DISTANCE_BINS, angle_bins=ANGLE_BINS, speed_bins=SPEED_BINS):
     """
     Generate and return a set of discretizers for every feature type.
     Discretizer for Distance features.
     Discretizer for Angle features.
     Discretizer for Speed features.
+    :param distance_bins, angle_bins, speed_bins: Number of bins of every feature type (default: Global_constants.py).
     :return: A set of discretizer objects.
     """
 
-    # Generate the range of integer values for features: Defines all values to consider in discretization.
-    # Depends on the MAX and MIN values set in Global_constants.py
-    range_distance = (
-        np.array([[x for x in range(MIN_DISTANCE, MAX_DISTANCE + 1)]])).T
-    range_angle = (np.array([[x for x in range(MIN_ANGLE, MAX_ANGLE + 1)]])).T
-    range_speed = (np.array([[x for x in range(MIN_SPEED, MAX_SPEED + 1)]])).T
-
     # Set the number of bins to use for every feature type.
     """
         The number of bins used for every feature type directly influences the performance of the algorithm
         both in training time (larger state space)  and quality of maneuvers.
     """
-    distance_bins = DISTANCE_BINS
-    angle_bins = ANGLE_BINS
-    speed_bins = SPEED_BINS
-
-    # Generate the discretizer objects using KBinsDiscretizer module.
-    # Refer to sklearn KBinsDiscretizers documentation for discretizer types and options.
-    distance_discretizer = KBinsDiscretizer(
-        n_bins=distance_bins, encode='ordinal', strategy='uniform')
-    angle_discretizer = KBinsDiscretizer(
-        n_bins=angle_bins, encode='ordinal', strategy='uniform')
-    speed_discretizer = KBinsDiscretizer(
-        n_bins=speed_bins, encode='ordinal', strategy='uniform')
-
-    # Fit the values for each range into bins using the discretization objects.
-    distance_discretizer.fit(range_distance)
-    angle_discretizer.fit(range_angle)
-    speed_discretizer.fit(range_speed)
+    # Generate the discretizer objects: Uniform bins over the range of values of every feature type.
+    # Depends on the MAX and MIN values set in Global_constants.py
+    distance_discretizer = UniformDiscretizer(MIN_DISTANCE, MAX_DISTANCE, distance_bins)
+    angle_discretizer = UniformDiscretizer(MIN_ANGLE, MAX_ANGLE, angle_bins)
+    speed_discretizer = UniformDiscretizer(MIN_SPEED, MAX_SPEED, speed_bins)
 
     # Compute the discrete state space size. Total of 7 features: 2 distance features, 3 angles features, 2 speed.
     space_size = (distance_bins**2) * (angle_bins**3) * (speed_bins**2)
@@ -65,49 +46,78 @@ def discretizeLocalState(local_state, distance_discretizer, angle_discretizer, s
     :return: A discrete state object.
     """
 
-    # Vector set of distance features
-    LocalStateVectorDistances = [
-        local_state.distance_ownship_destination,
-        local_state.distance_int_own
-    ]
-    # Vector set of Angle features
-    LocalStateVectorAngles = [
-        local_state.theta_destintation_ownship,
-        local_state.theta_int_own_track,
-        local_state.angle_rel_vel_neg_rel_pos
-    ]
-    # Vector set of Speed features
-    LocalStateVectorSpeeds = [
-        local_state.ownship_vel,
-        local_state.intruder_vel
-    ]
-
-    # Discretize features of the local state using the specified discretizers generated in setUpdiscretizers().
-    # Returns np.arrays with the bins.
-    distance_bins = distance_discretizer.transform(
-        (np.array([LocalStateVectorDistances])).T)
-    angle_bins = angle_discretizer.transform(
-        (np.array([LocalStateVectorAngles])).T)
-    speed_bins = speed_discretizer.transform(
-        (np.array([LocalStateVectorSpeeds])).T)
-
     # distance ownship to destination bin
-    d_o_bin = distance_bins.T[0][0]
+    d_o_bin = distance_discretizer.bin(local_state.distance_ownship_destination)
     # Distance intruder to ownship bin
-    d_i_o_bin = distance_bins.T[0][1]
+    d_i_o_bin = distance_discretizer.bin(local_state.distance_int_own)
 
     # Angle ownship heading to destination bin.
-    t_d_o_bin = angle_bins.T[0][0]
+    t_d_o_bin = angle_discretizer.bin(local_state.theta_destintation_ownship)
     # Angle Intruder heading relative to ownship heading bin.
-    t_i_o_bin = angle_bins.T[0][1]
-    a_r_v_p_bin = angle_bins.T[0][2]
+    t_i_o_bin = angle_discretizer.bin(local_state.theta_int_own_track)
+    a_r_v_p_bin = angle_discretizer.bin(local_state.angle_rel_vel_neg_rel_pos)
 
     # Speed bins for ownship and intruder.
-    o_v_bin = speed_bins.T[0][0]
-    i_v_bin = speed_bins.T[0][1]
+    o_v_bin = speed_discretizer.bin(local_state.ownship_vel)
+    i_v_bin = speed_discretizer.bin(local_state.intruder_vel)
 
     # Generate the discrete local state object.
     discreteLocalState = DiscreteLocalState(
         d_o_bin, d_i_o_bin, t_d_o_bin, t_i_o_bin, a_r_v_p_bin, o_v_bin, i_v_bin)
 
     return discreteLocalState
+
+
+def discretizeLocalStateCode(local_state, distance_discretizer, angle_discretizer, speed_discretizer):
+    """
+    Given a local state find the integer code of its discretized version: Refer to discretizeLocalState() and
+    DiscreteLocalState.code().
+    :return: The discrete state packed into an int.
+    """
+    # Bins in the order of DiscreteLocalState.as_numpy().
+    bins = [distance_discretizer.bin(local_state.distance_ownship_destination),
+            angle_discretizer.bin(local_state.theta_destintation_ownship),
+            speed_discretizer.bin(local_state.ownship_vel),
+            speed_discretizer.bin(local_state.intruder_vel),
+            distance_discretizer.bin(local_state.distance_int_own),
+            angle_discretizer.bin(local_state.theta_int_own_track),
+            angle_discretizer.bin(local_state.angle_rel_vel_neg_rel_pos)]
+
+    return packStateBins(bins, discretizersRadices(distance_discretizer, angle_discretizer, speed_discretizer))
+
+
+def discretizersRadices(distance_discretizer, angle_discretizer, speed_discretizer):
+    """
+    Radices of the discrete state codes generated with a set of discretizers: Refer to stateRadices().
+    """
+    return stateRadices(distance_discretizer.n_bins, angle_discretizer.n_bins, speed_discretizer.n_bins)
+
+
+def discretizeFeatures(features, distance_discretizer, angle_discretizer, speed_discretizer):
+    """
+    Discretize the features of N local states at once.
+    :param features: (N,7) array of local state features in the order of LocalState.as_numpy().
+    :return: (N,7) array of bins in the order of DiscreteLocalState.as_numpy().
+    """
+    features = np.asarray(features, dtype=np.float64)
+    bins = np.empty(features.shape)
+
+    # Distance features: distance ownship to destination and distance intruder to ownship.
+    bins[..., [0, 4]] = distance_discretizer.bins(features[..., [0, 4]])
+    # Angle features: angle to destination, angle intruder to ownship track and angle of relative velocity.
+    bins[..., [1, 5, 6]] = angle_discretizer.bins(features[..., [1, 5, 6]])
+    # Speed features: ownship and intruder speeds.
+    bins[..., [2, 3]] = speed_discretizer.bins(features[..., [2, 3]])
+
+    return bins
+
+
+def discretizeFeatureCodes(features, distance_discretizer, angle_discretizer, speed_discretizer):
+    """
+    Discretize the features of N local states at once and pack them into integer codes.
+    :param features: (N,7) array of local state features in the order of LocalState.as_numpy().
+    :return: (N,) np.int64 array of discrete state codes.
+    """
+    bins = discretizeFeatures(features, distance_discretizer, angle_discretizer, speed_discretizer)
+    return packStateBins(bins.reshape(-1, 7),
+                         discretizersRadices(distance_discretizer, angle_discretizer, speed_discretizer))
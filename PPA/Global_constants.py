@@ -7,6 +7,17 @@ import os
 TIME_INCREMENT = 10.0
 # Seconds that each action will run for (During testing)
 TEST_TIME_INCREMENT = 10.0
+# Number of times every action is repeated (a macro-action) during training: MCTS expansion, rollouts and the
+# trajectories constructed while learning take one closed form step of TRAINING_MACRO_STEPS * TIME_INCREMENT seconds
+# (refer to stepMacroState()). Penalties and discounts still count every TIME_INCREMENT step. 1 = single steps.
+TRAINING_MACRO_STEPS = 1
+# Number of times every action is repeated when constructing trajectories during testing.
+TEST_MACRO_STEPS = 1
+# Adaptive time steps for MCTS rollouts and test trajectories: Every action is repeated as many steps as the aircraft
+# need to lose the well clear at their maximum closing speed, up to ADAPTIVE_MAX_STEPS (refer to adaptiveStepCount()).
+# Replaces TRAINING_MACRO_STEPS in rollouts and TEST_MACRO_STEPS in test trajectories. False = fixed steps.
+ADAPTIVE_TIME_STEP = False
+ADAPTIVE_MAX_STEPS = 10
 
 DESTINATION_STATE = [0, 0]      # Coordinates of the destination.
 
@@ -41,16 +52,59 @@ Each iteration of MCTS includes: selection, expansion, simulation.
 Refer to MCTS.py for more details.
 """
 MCTS_ITERATIONS = 10000
+# Number of random rollouts launched from the expanded node on every MCTS iteration. The rollouts run in lockstep
+# as numpy arrays and their average discounted reward is back-propagated. 1 = a single scalar rollout.
+ROLLOUTS_PER_SIMULATION = 1
+# Number of random steps of every rollout: After them the rollout flies straight (NO_TURN) and its final state is
+# computed in closed form instead of step by step (refer to straightFlightOutcome()). None = every action is random.
+# This changes the rollout policy, it is not an exact speedup: The random policy would keep turning after the horizon,
+# so the rollout values are biased toward the value of straight flight. Lower horizons are faster and more biased.
+ROLLOUT_TURN_HORIZON = None
 # Every MCTS_CUT iterations try to construct a trajectory. If it is successful then move to the next training encounter.
 # If a cut is not desired set MCTS_CUT = 1. Then every MCTS will go for MCTS_ITERATIONS.
 MCTS_CUT = 500
 
+# Store the Monte Carlo Tree in preallocated arrays (MCTSArena.py) instead of one object per node (MCTS.py).
+MCTS_ARENA = False
+# Root-parallel MCTS: Number of worker processes that grow independent trees of the same encounter (refer to
+# PPA_Learn.learnRootParallel()). 1 = a single tree in the training process.
+ROOT_PARALLEL_WORKERS = 1
+# Number of training encounters whose trees grow in lockstep in a single process, with the rollouts of all the trees
+# run as one numpy batch (refer to LockstepMCTS.py). A batch runs until its longest rollout ends: It pays off from
+# groups of about 16 encounters. 1 = one encounter at a time.
+LOCKSTEP_ENCOUNTERS = 1
+# Maximum number of discrete states in the transposition table of rollout values shared by the MCTS nodes of a
+# training encounter (refer to TranspositionTable.py). Every encounter starts with an empty table. The least recently
+# used state is evicted when it is full. Not used by -rp and -ls. None = no table: Every new node runs its own rollouts.
+TRANSPOSITION_TABLE_SIZE = None
+# Rollout values a discrete state needs in the transposition table before new nodes take their mean instead of
+# running rollouts.
+TRANSPOSITION_MIN_VISITS = 8
+# Maximum number of MCST nodes kept after every harvest of the tree (every MCTS_CUT iterations): The subtrees of the
+# least visited nodes are collapsed into their roots (refer to MCST.prune()). Not used with MCTS_ARENA.
+# None = the tree keeps every expanded node until the encounter ends.
+MCTS_NODE_BUDGET = None
+
 UCB1_C = 3                      # UCB1 Exploration term.
 GAMMA = 0.9                     # Discount Factor.
 
 # Max number of actions that can be taken when simulating for Performance.
 EPISODE_LENGTH = None
 
+# Every CHECKPOINT_EVERY training encounters write a checkpoint segment with the states updated since the last one
+# (refer to Checkpoints.py). None = the model is only saved at the end of training.
+CHECKPOINT_EVERY = 10
+
+# With -w the encounters are learned in batches of PARALLEL_BATCH_SIZE consecutive encounters: Every encounter of a
+# batch builds on the model as it stood before the batch. The batches do not depend on the number of workers, so a
+# seed trains the same model with any -w > 1. At most PARALLEL_BATCH_SIZE workers are busy and the workers wait for
+# the slowest encounter of a batch before the next one starts: Use at least as many encounters as workers (best a
+# multiple of the number of workers). It must be a multiple of CHECKPOINT_EVERY.
+PARALLEL_BATCH_SIZE = 40
+
+# Maximum number of (state, action, reward) tuples in every chunk of a replay log (refer to ReplayLog.py).
+REPLAY_CHUNK_SIZE = 100000
+
 # Directory Paths:
 # Set of Training Encounters.
 TRAINING_SET = 'PPA/Training Encounters/Test_Encounter_Geometries2.csv'
@@ -24,6 +24,19 @@ class LocalState:
         self.theta_int_own_track = theta_io
         self.angle_rel_vel_neg_rel_pos = psi_io_nr_io
 
+    def as_numpy(self):
+        """
+        The 7 features of this local state as a numpy array in the order used by discretizeFeatures().
+        """
+        return np.array([self.distance_ownship_destination,
+                         self.theta_destintation_ownship,
+                         self.ownship_vel,
+                         self.intruder_vel,
+                         self.distance_int_own,
+                         self.theta_int_own_track,
+                         self.angle_rel_vel_neg_rel_pos
+                         ])
+
     # Return a string representation of a LocalState object.
     def __str__(self):
         return f"""
@@ -121,6 +134,80 @@ def convertAbsToLocal(absolute_encounter):
     return local_state
 
 
+def rowNorms(vectors):
+    """
+    Norm of every row of a (N,2) array. Computed with the same dot product LA.norm uses for a single vector.
+    """
+    return np.sqrt(np.matmul(vectors[:, np.newaxis, :], vectors[:, :, np.newaxis])[:, 0, 0])
+
+
+def convertAbsToLocalBatch(ownship_pos, intruder_pos, ownship_vel, intruder_vel):
+    """
+    Vectorized convertAbsToLocal(): Convert N absolute states to their local features at once.
+    :param ownship_pos: (N,2) array of ownship positions [x, y].
+    :param intruder_pos: (N,2) array of intruder positions [x, y].
+    :param ownship_vel: (N,2) array of ownship velocities [v_x, v_y].
+    :param intruder_vel: (N,2) array of intruder velocities [v_x, v_y].
+    :return: (N,7) array of local features in the order of LocalState.as_numpy().
+    """
+    ownship_pos = np.asarray(ownship_pos, dtype=np.float64)
+    intruder_pos = np.asarray(intruder_pos, dtype=np.float64)
+    ownship_vel = np.asarray(ownship_vel, dtype=np.float64)
+    intruder_vel = np.asarray(intruder_vel, dtype=np.float64)
+
+    features = np.empty((len(ownship_pos), 7))
+
+    # [0,0] - [ownship_x, ownship_y].
+    dest_ownship_vector = np.array(DESTINATION_STATE) - ownship_pos
+    # distance to the destination at [0,0].
+    features[:, 0] = rowNorms(dest_ownship_vector)
+
+    theta_destintation_ownship_abs = np.degrees(
+        np.arctan2(dest_ownship_vector[:, 0], dest_ownship_vector[:, 1]))
+    # ownship vel w.r.t y axis.
+    psi_o = np.degrees(np.arctan2(ownship_vel[:, 0], ownship_vel[:, 1]))
+
+    # Convert the angle to angle between dest_ownship_vector and ownship_vel: (-180, 180].
+    theta_destintation_ownship = theta_destintation_ownship_abs - psi_o
+    theta_destintation_ownship[theta_destintation_ownship > 180] -= 360
+    theta_destintation_ownship[theta_destintation_ownship <= -180] += 360
+    features[:, 1] = theta_destintation_ownship
+
+    # speed of ownship and speed of the intruder.
+    features[:, 2] = rowNorms(ownship_vel)
+    features[:, 3] = rowNorms(intruder_vel)
+
+    intruder_pos_relative_ownship = intruder_pos - ownship_pos
+    # distance intruder and ownship.
+    features[:, 4] = rowNorms(intruder_pos_relative_ownship)
+
+    # intruder angle w.r.t y axis.
+    theta_int_own_orig = np.degrees(np.arctan2(
+        intruder_pos_relative_ownship[:, 0], intruder_pos_relative_ownship[:, 1]))
+    # angle of the intruder pos w.r.t ownship's ground track: [-180, 180].
+    theta_intruder_own_track = theta_int_own_orig - psi_o
+    theta_intruder_own_track[theta_intruder_own_track < -180] += 360
+    theta_intruder_own_track[theta_intruder_own_track > 180] -= 360
+    features[:, 5] = theta_intruder_own_track
+
+    # Angle between -intruder_pos_relative_ownship and intruder_vel_relative_ownship (refer to convertAbsToLocal).
+    intruder_vel_relative_ownship = intruder_vel - ownship_vel
+    psi_io_rel_vel = np.degrees(np.arctan2(
+        intruder_vel_relative_ownship[:, 0], intruder_vel_relative_ownship[:, 1]))
+    angle_rel_vel_neg_rel_pos = psi_io_rel_vel - (theta_int_own_orig - 180)
+    angle_rel_vel_neg_rel_pos[angle_rel_vel_neg_rel_pos <= -180] += 360
+    angle_rel_vel_neg_rel_pos[angle_rel_vel_neg_rel_pos > 180] -= 360
+    features[:, 6] = angle_rel_vel_neg_rel_pos
+
+    return features
+
+
+# Squared final state distances: Terminal checks compare squared distances to avoid square roots.
+DESTINATION_DIST_ERROR_SQUARED = DESTINATION_DIST_ERROR**2
+ABANDON_STATE_ERROR_SQUARED = ABANDON_STATE_ERROR**2
+DWC_DIST_SQUARED = DWC_DIST**2
+
+
 def isTerminalState(state: State):
     """
     Is a Local State terminal?
@@ -131,15 +218,274 @@ def isTerminalState(state: State):
         LODWC_REWARD = -0.3.
 
     Otherwise return 0 for a non-final states.
+    The result is cached on the state: Checking a state again is free.
     """
-    local_state = convertAbsToLocal(state)
+    if state.terminal is not None:
+        return state.terminal
+
+    # Only the distance to the destination and the distance between aircraft are needed.
+    own_x, own_y = state.ownship_pos.tolist()
+    int_x, int_y = state.intruder_pos.tolist()
+    dest_x = DESTINATION_STATE[0] - own_x
+    dest_y = DESTINATION_STATE[1] - own_y
+    distance_ownship_destination_squared = dest_x * dest_x + dest_y * dest_y
+    int_own_x = int_x - own_x
+    int_own_y = int_y - own_y
+    distance_int_own_squared = int_own_x * int_own_x + int_own_y * int_own_y
 
-    if local_state.distance_ownship_destination <= DESTINATION_DIST_ERROR:
+    if distance_ownship_destination_squared <= DESTINATION_DIST_ERROR_SQUARED:
         # Close enough to the destination, reward it.
-        return DESTINATION_STATE_REWARD
-    if local_state.distance_ownship_destination > ABANDON_STATE_ERROR:
-        return ABANDON_STATE_REWARD     # Too far from destination, penalty.
-    if local_state.distance_int_own < DWC_DIST:
-        return LODWC_REWARD     # Lost of well clear.
+        state.terminal = DESTINATION_STATE_REWARD
+    elif distance_ownship_destination_squared > ABANDON_STATE_ERROR_SQUARED:
+        state.terminal = ABANDON_STATE_REWARD     # Too far from destination, penalty.
+    elif distance_int_own_squared < DWC_DIST_SQUARED:
+        state.terminal = LODWC_REWARD     # Lost of well clear.
+    else:
+        state.terminal = 0
+
+    return state.terminal
+
+
+def terminalCodes(ownship_pos, intruder_pos):
+    """
+    Vectorized isTerminalState(): Terminal codes of N states.
+    :param ownship_pos: (N,2) array of ownship positions.
+    :param intruder_pos: (N,2) array of intruder positions.
+    :return: (N,) array with the reward of every final state and 0 for non-final states.
+    """
+    dest_ownship_vector = np.array(DESTINATION_STATE) - ownship_pos
+    distance_ownship_destination_squared = np.sum(dest_ownship_vector * dest_ownship_vector, axis=1)
+    intruder_pos_relative_ownship = intruder_pos - ownship_pos
+    distance_int_own_squared = np.sum(intruder_pos_relative_ownship * intruder_pos_relative_ownship, axis=1)
+
+    # Same precedence as isTerminalState(): Destination, abandon, lost of well clear.
+    codes = np.zeros(len(ownship_pos))
+    codes[distance_int_own_squared < DWC_DIST_SQUARED] = LODWC_REWARD
+    codes[distance_ownship_destination_squared > ABANDON_STATE_ERROR_SQUARED] = ABANDON_STATE_REWARD
+    codes[distance_ownship_destination_squared <= DESTINATION_DIST_ERROR_SQUARED] = DESTINATION_STATE_REWARD
+    return codes
+
+
+def stepState(state: State, action, TIME):
+    """
+    Take an action from a state and check whether the new state is final in one call.
+    :return: (new state, terminal code of the new state): Refer to getNewState() and isTerminalState().
+    """
+    new_state = getNewState(state, action, TIME)
+    return new_state, isTerminalState(new_state)
+
+
+def stepMacroStates(ownship_pos, intruder_pos, ownship_vel, intruder_vel, actions, steps, TIME):
+    """
+    Repeat an action steps times (a macro-action) from N states in closed form (refer to macroStepMatrices()).
+    Every state stops at the first final state it reaches: The intermediate states are checked with terminalCodes().
+    :param ownship_pos: (N,2) array of ownship positions, the same for the other arguments.
+    :param actions: (N,) array of action indices (refer to ACTION_INDEX).
+    :return: Tuple (new ownship positions, new intruder positions, new ownship velocities,
+             (N,) array with the terminal codes of the new states, (N,) array with the number of steps taken).
+    """
+    rotations, displacements = macroStepMatrices(steps, TIME)
+    count = len(actions)
+    # Positions after every step: (N, steps, 2).
+    ownship_positions = ownship_pos[:, np.newaxis] + np.einsum('nkij,nj->nki', displacements[actions], ownship_vel)
+    intruder_positions = (intruder_pos[:, np.newaxis]
+                          + np.arange(1, steps + 1)[np.newaxis, :, np.newaxis] * (intruder_vel * TIME)[:, np.newaxis])
+    codes = terminalCodes(ownship_positions.reshape(-1, 2), intruder_positions.reshape(-1, 2)).reshape(count, steps)
+
+    final = codes != 0
+    last = np.where(final.any(axis=1), final.argmax(axis=1), steps - 1)
+    rows = np.arange(count)
+    new_ownship_vel = np.einsum('nij,nj->ni', rotations[actions, last], ownship_vel)
+    return (ownship_positions[rows, last], intruder_positions[rows, last], new_ownship_vel,
+            codes[rows, last], last + 1)
+
+
+def stepMacroState(state: State, action, TIME, steps):
+    """
+    Repeat an action up to steps times in one call, stopping at the first final state: Refer to stepMacroStates().
+    With steps = 1 this is stepState().
+    :return: (new state, terminal code of the new state, number of steps taken).
+    """
+    if steps == 1:
+        new_state, terminal_code = stepState(state, action, TIME)
+        return new_state, terminal_code, 1
+
+    # Same as stepMacroStates() for a single state with float arithmetic: Cheaper than numpy for a single state.
+    own_x, own_y = state.ownship_pos.tolist()
+    own_vx, own_vy = state.ownship_vel.tolist()
+    int_x, int_y = state.intruder_pos.tolist()
+    int_vx, int_vy = state.intruder_vel.tolist()
+    dest_x0, dest_y0 = DESTINATION_STATE
+    taken = 0
+    for (r00, r01, r10, r11), (m00, m01, m10, m11) in macroStepCoefficients(steps, TIME)[ACTION_INDEX[action]]:
+        taken += 1
+        new_x = own_x + m00 * own_vx + m01 * own_vy
+        new_y = own_y + m10 * own_vx + m11 * own_vy
+        new_int_x = int_x + taken * TIME * int_vx
+        new_int_y = int_y + taken * TIME * int_vy
+        # Stop at the first final state: Refer to isTerminalState().
+        dest_x, dest_y = dest_x0 - new_x, dest_y0 - new_y
+        distance_ownship_destination_squared = dest_x * dest_x + dest_y * dest_y
+        int_own_x, int_own_y = new_int_x - new_x, new_int_y - new_y
+        if (distance_ownship_destination_squared <= DESTINATION_DIST_ERROR_SQUARED
+                or distance_ownship_destination_squared > ABANDON_STATE_ERROR_SQUARED
+                or int_own_x * int_own_x + int_own_y * int_own_y < DWC_DIST_SQUARED):
+            break
+
+    new_state = State(np.array([new_x, new_y]), np.array([new_int_x, new_int_y]),
+                      np.array([r00 * own_vx + r01 * own_vy, r10 * own_vx + r11 * own_vy]),
+                      np.array(state.intruder_vel))
+    return new_state, isTerminalState(new_state), taken
+
+
+def getNewMacroState(state: State, action, TIME, steps):
+    """
+    The state reached repeating an action up to steps times: Refer to stepMacroState().
+    With steps = 1 this is getNewState().
+    """
+    if steps == 1:
+        return getNewState(state, action, TIME)
+    return stepMacroState(state, action, TIME, steps)[0]
+
+
+def adaptiveStepCount(state: State, TIME, max_steps=ADAPTIVE_MAX_STEPS):
+    """
+    Number of steps of the next action with adaptive time steps (refer to ADAPTIVE_TIME_STEP): The number of steps
+    the aircraft need to lose the well clear flying towards each other at their maximum closing speed (the sum of
+    their speeds), between 1 and max_steps. The action is repeated with stepMacroState(), so the step grows with the
+    separation and no loss of well clear can happen before the next decision.
+    """
+    own_x, own_y = state.ownship_pos.tolist()
+    int_x, int_y = state.intruder_pos.tolist()
+    own_vx, own_vy = state.ownship_vel.tolist()
+    int_vx, int_vy = state.intruder_vel.tolist()
+    closing_speed = math.hypot(own_vx, own_vy) + math.hypot(int_vx, int_vy)
+    if closing_speed == 0:
+        return max_steps
+    steps = int((math.hypot(int_x - own_x, int_y - own_y) - DWC_DIST) // (closing_speed * TIME))
+    return max(1, min(max_steps, steps))
+
+
+def adaptiveStepCounts(ownship_pos, intruder_pos, ownship_vel, intruder_vel, TIME, max_steps=ADAPTIVE_MAX_STEPS):
+    """
+    Vectorized adaptiveStepCount(): (N,) array with the number of steps of the next action of N states.
+    """
+    closing_speed = np.hypot(ownship_vel[:, 0], ownship_vel[:, 1]) + np.hypot(intruder_vel[:, 0], intruder_vel[:, 1])
+    separation = np.hypot(intruder_pos[:, 0] - ownship_pos[:, 0], intruder_pos[:, 1] - ownship_pos[:, 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        steps = np.floor_divide(separation - DWC_DIST, closing_speed * TIME)
+    steps[closing_speed == 0] = max_steps
+    return np.clip(steps, 1, max_steps).astype(np.int64)
+
+
+def firstStepInside(a, b, c, strict):
+    """
+    First step k >= 1 where the quadratic a*k^2 + b*k + c is below 0 (<= 0 if not strict), with a > 0.
+    Vectorized over arrays of coefficients.
+    :return: Array with the first step or inf if the quadratic never goes below 0 at a step k >= 1.
+    """
+    discriminant = b * b - 4 * a * c
+    root = np.sqrt(np.maximum(discriminant, 0))
+    low = (-b - root) / (2 * a)
+    high = (-b + root) / (2 * a)
+    # First integer in the interval of negative values (open interval if strict).
+    step = np.maximum(1, np.floor(low) + 1 if strict else np.ceil(low))
+    inside = (discriminant >= 0) & ((step < high) if strict else (step <= high))
+    return np.where(inside, step, np.inf)
+
+
+def straightFlightOutcomes(ownship_pos, intruder_pos, ownship_vel, intruder_vel, TIME):
+    """
+    Outcome of flying straight (NO_TURN at every step) from N non-final states, computed in closed form.
+    Both aircraft fly at constant velocity so after k steps the squared distance to the destination and the
+    squared distance between the aircraft are quadratics in k: The first step that reaches the destination, the
+    abandon distance or the well clear distance is found solving them instead of stepping (same precedence as
+    isTerminalState() when several happen at the same step). The result matches stepping with getNewState() and
+    isTerminalState() up to floating point rounding at the boundaries.
+    :param ownship_pos: (N,2) array of ownship positions, the same for the other arguments.
+    :param TIME: How long every step goes for.
+    :return: Tuple ((N,) array with the number of steps to the final state, (N,) array with its terminal code).
+             The number of steps is inf (with code 0) if the ownship does not move: It never reaches a final state.
+    """
+    dest_ownship_vector = np.array(DESTINATION_STATE) - ownship_pos
+    ownship_disp = ownship_vel * TIME
+    intruder_pos_relative_ownship = intruder_pos - ownship_pos
+    relative_disp = (intruder_vel - ownship_vel) * TIME
+
+    # |dest_ownship_vector - k * ownship_disp|^2 = a_d k^2 + b_d k + c_d
+    a_d = np.sum(ownship_disp * ownship_disp, axis=1)
+    b_d = -2 * np.sum(dest_ownship_vector * ownship_disp, axis=1)
+    c_d = np.sum(dest_ownship_vector * dest_ownship_vector, axis=1)
+    # |intruder_pos_relative_ownship + k * relative_disp|^2 = a_r k^2 + b_r k + c_r
+    a_r = np.sum(relative_disp * relative_disp, axis=1)
+    b_r = 2 * np.sum(intruder_pos_relative_ownship * relative_disp, axis=1)
+    c_r = np.sum(intruder_pos_relative_ownship * intruder_pos_relative_ownship, axis=1)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        destination = firstStepInside(a_d, b_d, c_d - DESTINATION_DIST_ERROR_SQUARED, strict=False)
+        # Inside the abandon distance until the step after the larger root.
+        abandon = np.floor((-b_d + np.sqrt(np.maximum(b_d * b_d - 4 * a_d * (c_d - ABANDON_STATE_ERROR_SQUARED), 0)))
+                           / (2 * a_d)) + 1
+        lodwc = firstStepInside(a_r, b_r, c_r - DWC_DIST_SQUARED, strict=True)
+    moving = a_d > 0
+    destination = np.where(moving, destination, np.inf)
+    abandon = np.where(moving, np.maximum(abandon, 1), np.inf)
+    # The aircraft keep their separation if they fly in formation.
+    lodwc = np.where(a_r > 0, lodwc, np.inf)
+
+    steps = np.minimum(np.minimum(destination, abandon), lodwc)
+    codes = np.where(destination == steps, DESTINATION_STATE_REWARD,
+                     np.where(abandon == steps, ABANDON_STATE_REWARD, LODWC_REWARD))
+    codes[np.isinf(steps)] = 0
+    return steps, codes
+
+
+def straightFlightOutcome(state: State, TIME):
+    """
+    Outcome of flying straight from a non-final state: The scalar version of straightFlightOutcomes().
+    :return: Tuple (number of steps to the final state, terminal code of the final state).
+    """
+    own_x, own_y = state.ownship_pos.tolist()
+    int_x, int_y = state.intruder_pos.tolist()
+    own_vx, own_vy = state.ownship_vel.tolist()
+    int_vx, int_vy = state.intruder_vel.tolist()
+    dest_x, dest_y = DESTINATION_STATE[0] - own_x, DESTINATION_STATE[1] - own_y
+    disp_x, disp_y = own_vx * TIME, own_vy * TIME
+    rel_x, rel_y = int_x - own_x, int_y - own_y
+    rel_disp_x, rel_disp_y = (int_vx - own_vx) * TIME, (int_vy - own_vy) * TIME
+
+    a_d = disp_x * disp_x + disp_y * disp_y
+    if a_d == 0:
+        # The ownship does not move.
+        return math.inf, 0
+    b_d = -2 * (dest_x * disp_x + dest_y * disp_y)
+    c_d = dest_x * dest_x + dest_y * dest_y
+
+    destination = math.inf
+    discriminant = b_d * b_d - 4 * a_d * (c_d - DESTINATION_DIST_ERROR_SQUARED)
+    if discriminant >= 0:
+        root = math.sqrt(discriminant)
+        step = max(1, math.ceil((-b_d - root) / (2 * a_d)))
+        if step <= (-b_d + root) / (2 * a_d):
+            destination = step
+    # Inside the abandon distance until the step after the larger root.
+    root = math.sqrt(max(b_d * b_d - 4 * a_d * (c_d - ABANDON_STATE_ERROR_SQUARED), 0))
+    abandon = max(1, math.floor((-b_d + root) / (2 * a_d)) + 1)
+
+    lodwc = math.inf
+    a_r = rel_disp_x * rel_disp_x + rel_disp_y * rel_disp_y
+    if a_r > 0:
+        b_r = 2 * (rel_x * rel_disp_x + rel_y * rel_disp_y)
+        discriminant = b_r * b_r - 4 * a_r * (rel_x * rel_x + rel_y * rel_y - DWC_DIST_SQUARED)
+        if discriminant >= 0:
+            root = math.sqrt(discriminant)
+            step = max(1, math.floor((-b_r - root) / (2 * a_r)) + 1)
+            if step < (-b_r + root) / (2 * a_r):
+                lodwc = step
 
-    return 0
+    # Same precedence as isTerminalState().
+    if destination <= abandon and destination <= lodwc:
+        return destination, DESTINATION_STATE_REWARD
+    if abandon <= lodwc:
+        return abandon, ABANDON_STATE_REWARD
+    return lodwc, LODWC_REWARD
@@ -0,0 +1,66 @@
+"""
+LockstepMCTS.py implements an MCTS engine that grows the trees of many encounters in lockstep.
+
+Most of the cost of an MCTS iteration is Python overhead per call, not arithmetic. LockstepMCTS keeps one
+ArenaMCST per encounter and runs the iterations of all the trees together: Every round selects and expands one
+leaf per tree, then simulates all the expanded leaves with a single batch of lockstep rollouts (refer to
+batchRollouts()), ROLLOUTS_PER_SIMULATION rollouts per leaf, and back-propagates the value of every leaf in its
+tree. The rollouts of all the encounters cost about as many numpy calls as the rollouts of a single encounter.
+PPA_Learn learns from LOCKSTEP_ENCOUNTERS encounters at a time with it.
+"""
+
+from PPA.MCTSArena import *
+
+
+class LockstepMCTS:
+    """
+    A set of ArenaMCST trees, one per encounter, advanced in lockstep.
+    """
+
+    def __init__(self, states):
+        """
+        :param states: Initial state of every encounter.
+        """
+        self.trees = [ArenaMCST(state) for state in states]
+
+    def iterate(self, tree_indices=None):
+        """
+        Run one MCTS iteration (selection, expansion, simulation and back-propagation) of several trees.
+        :param tree_indices: Indices of the trees to advance (None: all the trees).
+        """
+        trees = self.trees if tree_indices is None else [self.trees[i] for i in tree_indices]
+        if not trees:
+            return
+
+        # Selection and Expansion: One leaf per tree.
+        for tree in trees:
+            tree.expansion(tree.selection())
+
+        # Simulation of all the leaves in one batch, then Back-propagation in every tree.
+        for tree, value in zip(trees, self.simulationValues(trees).tolist()):
+            tree.backpropagate(value)
+
+    @staticmethod
+    def simulationValues(trees):
+        """
+        Discounted reward estimate of the last expanded node of every tree: The average of ROLLOUTS_PER_SIMULATION
+        rollouts per node, all the rollouts run in a single batchRollouts() call.
+        :return: (len(trees),) array of values.
+        """
+        nodes = [tree.lastExpandedState for tree in trees]
+        ownship_pos = np.array([tree.ownship_pos[node] for tree, node in zip(trees, nodes)])
+        intruder_pos = np.array([tree.intruder_pos[node] for tree, node in zip(trees, nodes)])
+        ownship_vel = np.array([tree.ownship_vel[node] for tree, node in zip(trees, nodes)])
+        intruder_vel = np.array([tree.intruder_vel for tree in trees])
+
+        states = StateBatch(np.repeat(ownship_pos, ROLLOUTS_PER_SIMULATION, axis=0),
+                            np.repeat(intruder_pos, ROLLOUTS_PER_SIMULATION, axis=0),
+                            np.repeat(ownship_vel, ROLLOUTS_PER_SIMULATION, axis=0),
+                            np.repeat(intruder_vel, ROLLOUTS_PER_SIMULATION, axis=0))
+        return batchRollouts(states).reshape(len(trees), ROLLOUTS_PER_SIMULATION).mean(axis=1)
+
+    def __getitem__(self, tree_index):
+        return self.trees[tree_index]
+
+    def __len__(self):
+        return len(self.trees)
@@ -8,6 +8,240 @@ the details explained here: https://towardsdatascience.com/monte-carlo-tree-sear
 import random
 from PPA.LocalState import *
 import math
+import sys
+
+# Bit mask of a MCST node whose 3 children are expanded (bit i = child of action index i, refer to ACTION_INDEX).
+ALL_EXPANDED = 0b111
+# Action indices of the children not expanded yet, in ascending order, indexed by the expanded bit mask.
+UNTRIED_ACTIONS = tuple(tuple(action for action in range(3) if not mask >> action & 1) for mask in range(8))
+
+
+def rolloutMacroSteps(steps, macro_steps):
+    """
+    Number of steps of the next rollout action (refer to TRAINING_MACRO_STEPS): A macro-action does not go past
+    EPISODE_LENGTH.
+    :param steps: Number of steps taken so far.
+    :param macro_steps: Number of steps of the action without the EPISODE_LENGTH limit (e.g. adaptiveStepCount()).
+    """
+    if EPISODE_LENGTH is None:
+        return macro_steps
+    return max(1, min(macro_steps, EPISODE_LENGTH - steps))
+
+
+def rollout(simState: State):
+    """
+    Run a random simulation (rollout) from a state until a final state is reached.
+    Every random action is repeated TRAINING_MACRO_STEPS times (or adaptiveStepCount() times with ADAPTIVE_TIME_STEP):
+    Penalties and discounts count every step.
+    After ROLLOUT_TURN_HORIZON random actions the rollout flies straight and jumps to its final state in closed form
+    (refer to straightFlightOutcome()): Only the discount of the skipped steps is applied. The horizon changes the
+    rollout policy (no more turns), it does not only skip the steps the random policy would take.
+    :param simState: State where the simulation starts.
+    :return: The discounted reward of the simulation.
+    """
+
+    # Initial reward for this MCTS node.
+    Q = 0
+    # Total Discount.
+    discount_factor = GAMMA
+
+    # Number of steps (actions) taken.
+    steps = 0
+    while True:
+        if ROLLOUT_TURN_HORIZON is not None and steps >= ROLLOUT_TURN_HORIZON:
+            # No more turns: NO_TURN until a final state, no penalty.
+            straight_steps, state_Q = straightFlightOutcome(simState, TIME_INCREMENT)
+            if EPISODE_LENGTH is not None and steps + straight_steps > EPISODE_LENGTH:
+                # The episode ends before the final state.
+                discount_factor *= GAMMA ** (EPISODE_LENGTH - steps - 1)
+            else:
+                Q += state_Q
+                discount_factor *= GAMMA ** (straight_steps - 1)
+            break
+
+        rand_num = random.random()
+
+        # Select a random action from this state.
+        if rand_num < 0.33:
+            action = 'NO_TURN'
+            # No penalty for NO_TURN action.
+        elif rand_num < 0.66:
+            # TURN_LEFT.
+            action = 'LEFT'
+            # penalize for turning.
+            Q += TURN_ACTION_REWARD
+        else:
+            # TURN_RIGHT.
+            action = 'RIGHT'
+            # penalize for turning.
+            Q += TURN_ACTION_REWARD
+
+        # Take the action and check if the new state is final.
+        macro_steps = adaptiveStepCount(simState, TIME_INCREMENT) if ADAPTIVE_TIME_STEP else TRAINING_MACRO_STEPS
+        simState, state_Q, taken = stepMacroState(simState, action, TIME_INCREMENT,
+                                                  rolloutMacroSteps(steps, macro_steps))
+        steps += taken
+        if taken > 1:
+            # The rest of the steps of the macro-action.
+            if action != 'NO_TURN':
+                Q += TURN_ACTION_REWARD * (taken - 1)
+            discount_factor *= GAMMA ** (taken - 1)
+        # Non-zero means simState is terminal (refer to isTerminalState).
+        if state_Q is not 0:
+            # Compute Reward/Score and back-propagate.
+            Q += state_Q
+            break   # End simulation.
+
+        # If there is a limit in the number of actions that can be taken enforce it.
+        if EPISODE_LENGTH is not None and steps >= EPISODE_LENGTH:
+            break
+
+        discount_factor *= GAMMA
+
+    return discount_factor*Q
+
+
+# Cosine and sine of the ownship velocity rotation of the rollout actions: 0 = NO_TURN, 1 = LEFT, 2 = RIGHT.
+ROLLOUT_COS = np.array([1.0, COS_TURN, COS_TURN])
+ROLLOUT_SIN = np.array([0.0, SIN_TURN, -SIN_TURN])
+# Action index of the rollout actions (refer to ACTION_INDEX).
+ROLLOUT_ACTION_INDEX = np.array([ACTION_INDEX['NO_TURN'], ACTION_INDEX['LEFT'], ACTION_INDEX['RIGHT']])
+
+
+def batchRollouts(states: StateBatch):
+    """
+    Run one random simulation (rollout) from every state of a StateBatch in lockstep: Refer to rollout().
+    Rollouts that reach a final state are masked out while the rest keep going.
+    Every step is the getNewState() and isTerminalState() arithmetic written on 1-D numpy arrays of the
+    x and y components: A few numpy calls advance all the rollouts. After ROLLOUT_TURN_HORIZON random actions the
+    rollouts still running fly straight and jump to their final states in closed form (refer to
+    straightFlightOutcomes()): A change of the rollout policy, refer to rollout().
+    With TRAINING_MACRO_STEPS > 1 or ADAPTIVE_TIME_STEP every step is a macro-action taken with stepMacroStates().
+    :param states: States where the simulations start.
+    :return: (N,) array with the discounted reward of every simulation.
+    """
+    count = len(states)
+    Q = np.zeros(count)
+    discount_factor = np.full(count, GAMMA)
+
+    # Reward and discount of the rollouts that have not reached a final state, and their indices.
+    active = np.arange(count)
+    active_Q = np.zeros(count)
+    active_discount = np.full(count, GAMMA)
+    own_x, own_y = states.ownship_pos[:, 0].copy(), states.ownship_pos[:, 1].copy()
+    own_vx, own_vy = states.ownship_vel[:, 0].copy(), states.ownship_vel[:, 1].copy()
+    int_x, int_y = states.intruder_pos[:, 0].copy(), states.intruder_pos[:, 1].copy()
+    int_vx, int_vy = states.intruder_vel[:, 0].copy(), states.intruder_vel[:, 1].copy()
+
+    # Number of steps (actions) taken.
+    steps = 0
+    while len(active) > 0:
+        if ROLLOUT_TURN_HORIZON is not None and steps >= ROLLOUT_TURN_HORIZON:
+            # No more turns: NO_TURN until a final state, no penalty.
+            straight_steps, state_Q = straightFlightOutcomes(np.column_stack((own_x, own_y)),
+                                                             np.column_stack((int_x, int_y)),
+                                                             np.column_stack((own_vx, own_vy)),
+                                                             np.column_stack((int_vx, int_vy)), TIME_INCREMENT)
+            if EPISODE_LENGTH is not None:
+                # The episode ends before the final state of the rollouts that need too many steps.
+                cut = steps + straight_steps > EPISODE_LENGTH
+                state_Q[cut] = 0
+                straight_steps = np.where(cut, EPISODE_LENGTH - steps, straight_steps)
+            Q[active] = active_Q + state_Q
+            discount_factor[active] = active_discount * GAMMA ** (straight_steps - 1)
+            break
+
+        rand_num = np.random.random(len(active))
+
+        # Select a random action for every rollout: Same probabilities as rollout().
+        actions = (rand_num >= 0.33).astype(np.intp) + (rand_num >= 0.66)
+        # penalize for turning.
+        active_Q += (actions != 0) * TURN_ACTION_REWARD
+
+        if TRAINING_MACRO_STEPS == 1 and not ADAPTIVE_TIME_STEP:
+            # Take the actions: Rotate the ownship velocities and move both aircraft.
+            cos_theta = ROLLOUT_COS[actions]
+            sin_theta = ROLLOUT_SIN[actions]
+            new_vx = cos_theta * own_vx - sin_theta * own_vy
+            new_vy = sin_theta * own_vx + cos_theta * own_vy
+            own_x += 0.5 * (new_vx + own_vx) * TIME_INCREMENT
+            own_y += 0.5 * (new_vy + own_vy) * TIME_INCREMENT
+            own_vx, own_vy = new_vx, new_vy
+            int_x += int_vx * TIME_INCREMENT
+            int_y += int_vy * TIME_INCREMENT
+            steps += 1
+
+            # Check which new states are final (refer to isTerminalState).
+            dest_x = DESTINATION_STATE[0] - own_x
+            dest_y = DESTINATION_STATE[1] - own_y
+            distance_ownship_destination_squared = dest_x * dest_x + dest_y * dest_y
+            int_own_x = int_x - own_x
+            int_own_y = int_y - own_y
+            distance_int_own_squared = int_own_x * int_own_x + int_own_y * int_own_y
+
+            destination = distance_ownship_destination_squared <= DESTINATION_DIST_ERROR_SQUARED
+            abandon = distance_ownship_destination_squared > ABANDON_STATE_ERROR_SQUARED
+            lodwc = distance_int_own_squared < DWC_DIST_SQUARED
+            finished = destination | abandon | lodwc
+        else:
+            # Take the macro-actions in closed form: Refer to stepMacroStates().
+            own_pos, int_pos = np.column_stack((own_x, own_y)), np.column_stack((int_x, int_y))
+            own_vel, int_vel = np.column_stack((own_vx, own_vy)), np.column_stack((int_vx, int_vy))
+            if ADAPTIVE_TIME_STEP:
+                # The rollouts run in lockstep: Take the smallest adaptive step of the rollouts.
+                macro_steps = rolloutMacroSteps(
+                    steps, int(adaptiveStepCounts(own_pos, int_pos, own_vel, int_vel, TIME_INCREMENT).min()))
+            else:
+                macro_steps = rolloutMacroSteps(steps, TRAINING_MACRO_STEPS)
+            own_pos, int_pos, own_vel, codes, taken = stepMacroStates(
+                own_pos, int_pos, own_vel, int_vel, ROLLOUT_ACTION_INDEX[actions], macro_steps, TIME_INCREMENT)
+            own_x, own_y, own_vx, own_vy = own_pos[:, 0], own_pos[:, 1], own_vel[:, 0], own_vel[:, 1]
+            int_x, int_y = int_pos[:, 0], int_pos[:, 1]
+            # The rest of the steps of the macro-actions.
+            active_Q += (actions != 0) * TURN_ACTION_REWARD * (taken - 1)
+            active_discount *= GAMMA ** (taken - 1)
+            steps += macro_steps
+
+            destination = codes == DESTINATION_STATE_REWARD
+            abandon = codes == ABANDON_STATE_REWARD
+            finished = codes != 0
+
+        if finished.any():
+            # Add the final reward: Same precedence as isTerminalState().
+            state_Q = np.where(destination, DESTINATION_STATE_REWARD,
+                               np.where(abandon, ABANDON_STATE_REWARD, LODWC_REWARD))
+            Q[active[finished]] = active_Q[finished] + state_Q[finished]
+            discount_factor[active[finished]] = active_discount[finished]
+
+            # Mask the finished rollouts out.
+            running = ~finished
+            active, active_Q, active_discount = active[running], active_Q[running], active_discount[running]
+            own_x, own_y, own_vx, own_vy = own_x[running], own_y[running], own_vx[running], own_vy[running]
+            int_x, int_y, int_vx, int_vy = int_x[running], int_y[running], int_vx[running], int_vy[running]
+
+        # If there is a limit in the number of actions that can be taken enforce it.
+        if EPISODE_LENGTH is not None and steps >= EPISODE_LENGTH:
+            Q[active] = active_Q
+            discount_factor[active] = active_discount
+            break
+
+        active_discount *= GAMMA
+
+    return discount_factor * Q
+
+
+def simulationValue(state: State):
+    """
+    Discounted reward estimate of a state: The average of ROLLOUTS_PER_SIMULATION random rollouts.
+    """
+    if ROLLOUTS_PER_SIMULATION == 1:
+        return rollout(state)
+
+    states = StateBatch(np.tile(state.ownship_pos, (ROLLOUTS_PER_SIMULATION, 1)),
+                        np.tile(state.intruder_pos, (ROLLOUTS_PER_SIMULATION, 1)),
+                        np.tile(state.ownship_vel, (ROLLOUTS_PER_SIMULATION, 1)),
+                        np.tile(state.intruder_vel, (ROLLOUTS_PER_SIMULATION, 1)))
+    return float(np.mean(batchRollouts(states)))
 
 
 class MCST_State:
@@ -18,23 +252,28 @@ class MCST_State:
             2. Q: The average expected discounted sum of rewards from this node down the tree.
             3. N: The number of times this node has been selected.
             4. dirty_bit: Whether or not this node was updated on a given iteration of MCTS.
+            5. children: The child nodes indexed by action (refer to ACTION_INDEX).
+            6. expanded: Bit mask of the expanded children (refer to UNTRIED_ACTIONS).
+        Nodes have no __dict__: The tree holds one node per expansion.
     """
 
+    __slots__ = ('state', 'Q', 'N', 'log_N', 'dirty_bit', 'children', 'expanded')
+
     def __init__(self, state: State):
         # State properties
         self.state = state
         self.Q = 0
         self.N = 0
+        # log(N), kept up to date by back-propagation for the UCB1 formula.
+        self.log_N = 0.0
 
         # Dirty == 1 if this state was updated during simulations.
         self.dirty_bit = 0
 
-        # Pointers to children states based on the available actions.
-        self.turn_left = None
-        self.turn_right = None
-        self.no_turn = None
-        # How many child states of this node have been expanded.
-        self.visited_child_count = 0
+        # Children states based on the available actions: [LEFT, NO_TURN, RIGHT].
+        self.children = [None, None, None]
+        # Bit i == 1 once the child of action index i is expanded.
+        self.expanded = 0
 
     def updateQN(self, New_Q):
         """
@@ -75,10 +314,17 @@ class MCST:
     Simulation, and Back-propagation.
     """
 
-    def __init__(self, state):
+    def __init__(self, state, transposition_table=None, node_budget=None):
         # Set the MCST initial state.
         self.root = MCST_State(state)
         self.root.N = 1
+        self.root.log_N = 0.0
+        # Maximum number of nodes kept after a harvest (refer to prune()). None = the tree is never pruned.
+        self.node_budget = node_budget
+        # Number of nodes in the tree, the most it ever had and the number of nodes pruned.
+        self.node_count = 1
+        self.peak_nodes = 1
+        self.evicted_nodes = 0
         # Every iteration there is a sequence of selections that lead to an unknown state to be expanded. Keep track
         # Keep track of (state, action) pairs along the path to a final state.
         self.visitedStatesPath = [self.root]
@@ -88,6 +334,8 @@ class MCST:
         # Sequence of  stats,action,rewards tuples to be used for the model: Refer to README for more details.
         # List of 3 elements tuples (state,action,reward).
         self.state_action_reward = []
+        # Rollout values shared by discrete state (refer to TranspositionTable.py). None = every node runs rollouts.
+        self.transposition_table = transposition_table
 
     def clearStatesPath(self):
         """
@@ -99,12 +347,8 @@ class MCST:
         """
         The best action to take from this node is the one with the most simulations based on UCB1.
         """
-        simulations_count = [self.root.turn_left.N,
-                             self.root.no_turn.N, self.root.turn_right.N]
-        action_type = ['LEFT', 'NO_TURN', 'RIGHT']
-        action = action_type[simulations_count.index(max(simulations_count))]
-
-        return action
+        simulations_count = [child.N for child in self.root.children]
+        return ACTION_NAMES[simulations_count.index(max(simulations_count))]
 
     def selection(self):
         """
@@ -115,36 +359,22 @@ class MCST:
 
         # We only run selection on nodes that have the 3 children expanded.
         # While a given state node has been expanded, select a child using UCB1.
-        # LEFT, NO_TURN and RIGHT child states have been expanded.
-        while mcst_node.visited_child_count == 3:
-
-            # Exploration term:
-            c = UCB1_C
+        while mcst_node.expanded == ALL_EXPANDED:
+            left, no_turn, right = mcst_node.children
+            log_N = mcst_node.log_N
 
             # Explore or exploit? UCB1 formula.
-            UCB1_left = mcst_node.turn_left.Q + c * \
-                math.sqrt((math.log(mcst_node.N) / mcst_node.turn_left.N))
-
-            UCB1_right = mcst_node.turn_right.Q + c * \
-                math.sqrt((math.log(mcst_node.N) / mcst_node.turn_right.N))
-
-            UCB1_no_turn = mcst_node.no_turn.Q + c * \
-                math.sqrt((math.log(mcst_node.N) / mcst_node.no_turn.N))
-
-            values = [UCB1_no_turn, UCB1_left, UCB1_right]
-
-            nextChildIndex = values.index(
-                max(UCB1_no_turn, UCB1_left, UCB1_right))
-
-            if nextChildIndex is 0:
-                # Select no_turn child.
-                mcst_node = mcst_node.no_turn
-            elif nextChildIndex is 1:
-                # Select left child.
-                mcst_node = mcst_node.turn_left
+            UCB1_left = left.Q + UCB1_C * math.sqrt(log_N / left.N)
+            UCB1_right = right.Q + UCB1_C * math.sqrt(log_N / right.N)
+            UCB1_no_turn = no_turn.Q + UCB1_C * math.sqrt(log_N / no_turn.N)
+
+            # Ties are broken in the order NO_TURN, LEFT, RIGHT.
+            if UCB1_no_turn >= UCB1_left and UCB1_no_turn >= UCB1_right:
+                mcst_node = no_turn
+            elif UCB1_left >= UCB1_right:
+                mcst_node = left
             else:
-                # Select right child.
-                mcst_node = mcst_node.turn_right
+                mcst_node = right
 
             # Add selected node to the Visited States Path.
             self.visitedStatesPath.append(mcst_node)
@@ -158,81 +388,30 @@ class MCST:
         Node picked to expand is set as lastExpandedNode.
         :param mcst_node: A selected node that does not have all 3 children expanded.
         """
-
-        while True:     # Randomly pick a non expanded node.
-            rand_num = random.random()
-            if rand_num < 0.33 and mcst_node.no_turn is None:
-                # Expand to the no_turn state.
-                new_state = getNewState(
-                    mcst_node.state, 'NO_TURN', TIME_INCREMENT)
-                mcst_node.no_turn = MCST_State(new_state)
-                self.lastExpandedState = mcst_node.no_turn
-                break
-            elif rand_num < 0.66 and mcst_node.turn_left is None:
-                # Expand to the turn_left state.
-                new_state = getNewState(
-                    mcst_node.state, 'LEFT', TIME_INCREMENT)
-                mcst_node.turn_left = MCST_State(new_state)
-                self.lastExpandedState = mcst_node.turn_left
-                break
-            elif rand_num < 0.99 and mcst_node.turn_right is None:
-                # Expand to the turn_right state.
-                new_state = getNewState(
-                    mcst_node.state, 'RIGHT', TIME_INCREMENT)
-                mcst_node.turn_right = MCST_State(new_state)
-                self.lastExpandedState = mcst_node.turn_right
-                break
-
-        mcst_node.visited_child_count += 1
+        # Pick uniformly among the non expanded children: One random draw.
+        untried_actions = UNTRIED_ACTIONS[mcst_node.expanded]
+        action = untried_actions[random.randrange(len(untried_actions))]
+        mcst_node.expanded |= 1 << action
+
+        new_state = getNewMacroState(mcst_node.state, ACTION_NAMES[action], TIME_INCREMENT, TRAINING_MACRO_STEPS)
+        mcst_node.children[action] = MCST_State(new_state)
+        self.lastExpandedState = mcst_node.children[action]
+        self.node_count += 1
+        if self.node_count > self.peak_nodes:
+            self.peak_nodes = self.node_count
 
     def simulate(self):
         """
         Run simulations on the last expanded node.
         """
-
-        # Initial reward for this MCTS node.
-        Q = 0
-        # Total Discount.
-        discount_factor = GAMMA
         # Last state in the MCTS path where simulation will start.
         simState = self.lastExpandedState.state
 
-        # Number of steps (actions) taken.
-        steps = 0
-        while True:
-            rand_num = random.random()
-
-            # Select a random action from this state.
-            if rand_num < 0.33:
-                simState = getNewState(simState, 'NO_TURN', TIME_INCREMENT)
-                # No penalty for NO_TURN action.
-            elif rand_num < 0.66:
-                # TURN_LEFT.
-                simState = getNewState(simState, 'LEFT', TIME_INCREMENT)
-                # penalize for turning.
-                Q += TURN_ACTION_REWARD
-            else:
-                # TURN_RIGHT.
-                simState = getNewState(simState, 'RIGHT', TIME_INCREMENT)
-                # penalize for turning.
-                Q += TURN_ACTION_REWARD
-
-            # Check if this state is final.
-            state_Q = isTerminalState(simState)
-            # Non-zero means simState is terminal (refer to isTerminalState).
-            if state_Q is not 0:
-                # Compute Reward/Score and back-propagate.
-                Q += state_Q
-                break   # End simulation.
-
-            # If there is a limit in the number of actions that can be taken enforce it.
-            if EPISODE_LENGTH is not None and steps >= EPISODE_LENGTH:
-                break
-
-            discount_factor *= GAMMA
-
         # Back-Propagate the reward.
-        self.backpropagate(discount_factor*Q)
+        if self.transposition_table is None:
+            self.backpropagate(simulationValue(simState))
+        else:
+            self.backpropagate(self.transposition_table.simulationValue(simState))
 
     def backpropagate(self, Q):
         """
@@ -242,19 +421,21 @@ class MCST:
         # Update Last Expanded state and mark it as dirty.
         self.lastExpandedState.Q += Q
         self.lastExpandedState.N += 1
+        self.lastExpandedState.log_N = math.log(self.lastExpandedState.N)
         self.lastExpandedState.dirty_bit = 1
 
         for mcst_state in self.visitedStatesPath:
             # Update Q values and Number of Simulations.
             mcst_state.updateQN(Q)
             mcst_state.N += 1
+            mcst_state.log_N = math.log(mcst_state.N)
             # Mark it as dirty.
             mcst_state.dirty_bit = 1
 
         # Empty statesPath for next selection round.
         self.clearStatesPath()
 
-    def getStateActionRewards(self, current_state):
+    def getStateActionRewards(self, current_state=None):
         """
         Generate a set of tuples  (state,action,reward) as follows:
         For every node that was updated during this iteration, the Q value of its left action is the Q value
@@ -264,27 +445,113 @@ class MCST:
         state S. This expected reward is the expected reward of the state this  action a leads to.
 
         These tuples are then discretized and added to the model.
+        :param current_state: Node where the walk starts (None: the root).
         """
-        # Only iterate over nodes that changed, if node did not change
-        # its sub-tree did not change.
+        # Only iterate over nodes that changed, if node did not change its sub-tree did not change.
+        # The walk keeps its own stack: Deep trees do not hit the recursion limit.
+        state_action_reward = self.state_action_reward
+        mcst_state = self.root if current_state is None else current_state
+        stack = [mcst_state] if mcst_state.dirty_bit == 1 else []
+        while stack:
+            mcst_state = stack.pop()
+            state = mcst_state.state
+            # The reward of a non expanded child is 0. Avoid branches that did not update.
+            left, no_turn, right = mcst_state.children
+            if left is None:
+                state_action_reward.append((state, 'LEFT', 0))
+            else:
+                state_action_reward.append((state, 'LEFT', left.Q))
+                if left.dirty_bit == 1:
+                    stack.append(left)
+            if right is None:
+                state_action_reward.append((state, 'RIGHT', 0))
+            else:
+                state_action_reward.append((state, 'RIGHT', right.Q))
+                if right.dirty_bit == 1:
+                    stack.append(right)
+            if no_turn is None:
+                state_action_reward.append((state, 'NO_TURN', 0))
+            else:
+                state_action_reward.append((state, 'NO_TURN', no_turn.Q))
+                if no_turn.dirty_bit == 1:
+                    stack.append(no_turn)
+            mcst_state.clean()
 
-        # Recursive base case.
-        if current_state is None:
+    def prune(self):
+        """
+        Keep the tree within node_budget nodes: Collapse the subtrees of the least visited clean nodes until the tree
+        fits in the budget. A collapsed node keeps its Q and N values, which already average every simulation of its
+        subtree, and becomes a leaf again: Its children are expanded anew if selection reaches it.
+        Call it right after getStateActionRewards(): Only the subtrees of clean nodes are collapsed, so no update
+        is lost before it reaches the model. The tree can grow MCTS_CUT nodes past the budget between two harvests.
+        :return: The number of nodes removed.
+        """
+        if self.node_budget is None or self.node_count <= self.node_budget:
             return 0
 
-        # Avoid branches that did not update.
-        if current_state.dirty_bit == 0:
-            return current_state.Q
-
-        self.state_action_reward.append((current_state.state,
-                                         'LEFT',
-                                         self.getStateActionRewards(current_state.turn_left)))
-        self.state_action_reward.append((current_state.state,
-                                         'RIGHT',
-                                         self.getStateActionRewards(current_state.turn_right)))
-        self.state_action_reward.append((current_state.state,
-                                         'NO_TURN',
-                                         self.getStateActionRewards(current_state.no_turn)))
-
-        current_state.clean()
-        return current_state.Q
+        # Expanded nodes other than the root: The candidates to collapse.
+        candidates = []
+        stack = [self.root]
+        while stack:
+            mcst_node = stack.pop()
+            for child in mcst_node.children:
+                if child is not None and child.expanded:
+                    candidates.append(child)
+                    stack.append(child)
+
+        # Least visited first: A node has fewer simulations than its ancestors, so the deepest subtrees go first.
+        candidates.sort(key=lambda node: node.N)
+        removed = 0
+        for mcst_node in candidates:
+            if self.node_count - removed <= self.node_budget:
+                break
+            if mcst_node.dirty_bit == 1:
+                continue
+            removed += self.collapse(mcst_node)
+
+        self.node_count -= removed
+        self.evicted_nodes += removed
+        return removed
+
+    @staticmethod
+    def collapse(mcst_node):
+        """
+        Remove the descendants of a node.
+        :return: The number of nodes removed.
+        """
+        removed = 0
+        stack = list(mcst_node.children)
+        while stack:
+            child = stack.pop()
+            if child is not None:
+                removed += 1
+                stack.extend(child.children)
+
+        mcst_node.children = [None, None, None]
+        mcst_node.expanded = 0
+        return removed
+
+    def memoryReport(self):
+        """
+        Memory used by the tree nodes, estimated from the size of the root node (refer to nodeBytes()).
+        :return: dictionary with the number of nodes, the peak number of nodes, the nodes pruned and the bytes used.
+        """
+        bytes_per_node = nodeBytes(self.root)
+        return {
+            'nodes': self.node_count,
+            'peak_nodes': self.peak_nodes,
+            'evicted_nodes': self.evicted_nodes,
+            'bytes': self.node_count * bytes_per_node,
+            'peak_bytes': self.peak_nodes * bytes_per_node,
+        }
+
+
+def nodeBytes(mcst_node: MCST_State):
+    """
+    Bytes used by a MCST node: The node, its child list, its state and the arrays of the state (the intruder
+    velocity is shared).
+    """
+    state = mcst_node.state
+    return (sys.getsizeof(mcst_node) + sys.getsizeof(mcst_node.children) + sys.getsizeof(state)
+            + sys.getsizeof(state.__dict__) + sum(sys.getsizeof(array) for array in
+                                                  (state.ownship_pos, state.intruder_pos, state.ownship_vel)))
@@ -0,0 +1,230 @@
+"""
+MCTSArena.py implements an array-backed Monte Carlo Tree (MCT).
+
+Instead of one MCST_State object per node (plus a State object and four numpy arrays), every node is an
+integer id that indexes preallocated numpy arrays holding Q, N, the dirty bit, the children ids and the
+continuous state of the node. The arrays grow by doubling when the tree runs out of capacity.
+ArenaMCST offers the same selection/expansion/simulation/back-propagation API as MCST.
+Set MCTS_ARENA = True in Global_constants.py to train with it.
+"""
+
+from PPA.MCTS import *
+
+
+class ArenaMCST:
+    """
+    Monte Carlo Tree stored in arrays indexed by node id.
+    The children of a node are indexed by action index (refer to ACTION_INDEX): -1 means not expanded.
+    """
+
+    def __init__(self, state: State, capacity=1024, transposition_table=None):
+        self.capacity = capacity
+        # Number of nodes in the tree.
+        self.node_count = 0
+
+        # Node statistics.
+        self.Q = np.zeros(capacity)
+        self.N = np.zeros(capacity, dtype=np.int64)
+        # Dirty == 1 if the node was updated during simulations.
+        self.dirty = np.zeros(capacity, dtype=np.bool_)
+
+        # Children ids of every node: [LEFT, NO_TURN, RIGHT].
+        self.children = np.full((capacity, 3), -1, dtype=np.int32)
+        # How many child states of every node have been expanded.
+        self.visited_child_count = np.zeros(capacity, dtype=np.int8)
+
+        # Continuous state of every node. The intruder flights at a constant velocity: It is the same for all nodes.
+        self.ownship_pos = np.zeros((capacity, 2))
+        self.intruder_pos = np.zeros((capacity, 2))
+        self.ownship_vel = np.zeros((capacity, 2))
+        self.intruder_vel = np.array(state.intruder_vel, dtype=np.float64)
+
+        # Set the MCST initial state.
+        self.root = self.addNode(np.asarray(state.ownship_pos, dtype=np.float64),
+                                 np.asarray(state.intruder_pos, dtype=np.float64),
+                                 np.asarray(state.ownship_vel, dtype=np.float64))
+        self.N[self.root] = 1
+
+        # Sequence of node ids selected on a given iteration: Refer to MCST.
+        self.visitedStatesPath = [self.root]
+        # Node id of the last expanded node where simulation starts from.
+        self.lastExpandedState = self.root
+        # List of 3 elements tuples (state,action,reward).
+        self.state_action_reward = []
+        # Rollout values shared by discrete state: Refer to MCST.
+        self.transposition_table = transposition_table
+
+    def grow(self):
+        """
+        Double the capacity of the node arrays.
+        """
+        self.capacity *= 2
+        for name in ['Q', 'N', 'dirty', 'visited_child_count']:
+            array = getattr(self, name)
+            grown = np.zeros(self.capacity, dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+        for name in ['ownship_pos', 'intruder_pos', 'ownship_vel']:
+            array = getattr(self, name)
+            grown = np.zeros((self.capacity, 2))
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+        children = np.full((self.capacity, 3), -1, dtype=np.int32)
+        children[:len(self.children)] = self.children
+        self.children = children
+
+    def addNode(self, ownship_pos, intruder_pos, ownship_vel):
+        """
+        Add a node to the arena.
+        :return: The id of the new node.
+        """
+        if self.node_count == self.capacity:
+            self.grow()
+
+        node = self.node_count
+        self.ownship_pos[node] = ownship_pos
+        self.intruder_pos[node] = intruder_pos
+        self.ownship_vel[node] = ownship_vel
+        self.node_count += 1
+        return node
+
+    def state(self, node):
+        """
+        Return the continuous state of a node as a State object.
+        """
+        return State(self.ownship_pos[node].copy(), self.intruder_pos[node].copy(),
+                     self.ownship_vel[node].copy(), self.intruder_vel.copy())
+
+    def clearStatesPath(self):
+        """
+        After processing the nodes, empty it for the next iteration of MCTS.
+        """
+        self.visitedStatesPath = [self.root]
+
+    def getBestAction(self):
+        """
+        The best action to take from the root is the one with the most simulations based on UCB1.
+        """
+        return ACTION_NAMES[int(np.argmax(self.N[self.children[self.root]]))]
+
+    def selection(self):
+        """
+        Selection step on the MCTS iteration.
+        Starting  from the root, select the node with the highest UCB1 value.
+        """
+        node = self.root
+        # Scalar reads with item() avoid creating numpy objects for every node in the path.
+        Q = self.Q
+        N = self.N
+
+        # We only run selection on nodes that have the 3 children expanded.
+        while self.visited_child_count.item(node) == 3:
+            left, no_turn, right = self.children[node].tolist()
+            log_N = math.log(N.item(node))
+
+            # Explore or exploit? UCB1 formula.
+            UCB1_left = Q.item(left) + UCB1_C * math.sqrt(log_N / N.item(left))
+            UCB1_right = Q.item(right) + UCB1_C * math.sqrt(log_N / N.item(right))
+            UCB1_no_turn = Q.item(no_turn) + UCB1_C * math.sqrt(log_N / N.item(no_turn))
+
+            # Same tie breaking as MCST: NO_TURN, LEFT, RIGHT.
+            if UCB1_no_turn >= UCB1_left and UCB1_no_turn >= UCB1_right:
+                node = no_turn
+            elif UCB1_left >= UCB1_right:
+                node = left
+            else:
+                node = right
+
+            # Add selected node to the Visited States Path.
+            self.visitedStatesPath.append(node)
+
+        # Return a selected node that does not have all 3 children node expanded: Used for expansion().
+        return node
+
+    def expansion(self, node):
+        """
+        Randomly pick a non expanded child node to run simulation on.
+        Node picked to expand is set as lastExpandedNode.
+        :param node: A selected node id that does not have all 3 children expanded.
+        """
+        # Pick uniformly among the non expanded children.
+        action = random.choice(np.flatnonzero(self.children[node] < 0).tolist())
+
+        if TRAINING_MACRO_STEPS == 1:
+            # Take the action from the node state: Refer to getNewState().
+            ownship_vel = self.ownship_vel[node]
+            new_vel_own = ACTION_ROTATIONS[action]@ownship_vel
+            new_own_pos = self.ownship_pos[node] + 0.5 * (new_vel_own + ownship_vel) * TIME_INCREMENT
+            new_intr_pos = self.intruder_pos[node] + 0.5 * (self.intruder_vel + self.intruder_vel) * TIME_INCREMENT
+        else:
+            # Take the macro-action: Refer to stepMacroState().
+            new_state = getNewMacroState(self.state(node), ACTION_NAMES[action], TIME_INCREMENT, TRAINING_MACRO_STEPS)
+            new_own_pos, new_intr_pos, new_vel_own = new_state.ownship_pos, new_state.intruder_pos, new_state.ownship_vel
+
+        child = self.addNode(new_own_pos, new_intr_pos, new_vel_own)
+        self.children[node, action] = child
+        self.visited_child_count[node] += 1
+        self.lastExpandedState = child
+
+    def simulate(self):
+        """
+        Run simulations on the last expanded node.
+        """
+        # Back-Propagate the reward.
+        if self.transposition_table is None:
+            self.backpropagate(simulationValue(self.state(self.lastExpandedState)))
+        else:
+            self.backpropagate(self.transposition_table.simulationValue(self.state(self.lastExpandedState)))
+
+    def backpropagate(self, Q):
+        """
+        Back-propagate the new Q value up the tree.
+        :param Q: Q value to  back-propagate.
+        """
+        # Update Last Expanded state and mark it as dirty.
+        self.Q[self.lastExpandedState] += Q
+        self.N[self.lastExpandedState] += 1
+        self.dirty[self.lastExpandedState] = True
+
+        # Average Q with the current Q value of every node in the path (refer to MCST_State.updateQN).
+        path = np.array(self.visitedStatesPath)
+        self.Q[path] += (Q - self.Q[path]) / (self.N[path] + 1)
+        self.N[path] += 1
+        self.dirty[path] = True
+
+        # Empty statesPath for next selection round.
+        self.clearStatesPath()
+
+    def getStateActionRewards(self, current_state=None):
+        """
+        Generate the set of tuples (state,action,reward) for every node updated since the last call:
+        Refer to MCST.getStateActionRewards(). The reward of an action is the Q value of the child
+        it leads to (0 if the child is not expanded).
+        """
+        for node in np.flatnonzero(self.dirty[:self.node_count]).tolist():
+            state = self.state(node)
+            children = self.children[node].tolist()
+            for action in ['LEFT', 'RIGHT', 'NO_TURN']:
+                child = children[ACTION_INDEX[action]]
+                reward = self.Q[child] if child >= 0 else 0
+                self.state_action_reward.append((state, action, reward))
+
+        # Mark all nodes as clean.
+        self.dirty[:self.node_count] = False
+
+    def memoryReport(self):
+        """
+        Memory used by the tree arrays.
+        :return: dictionary with the number of nodes, the capacity and the bytes used.
+        """
+        arrays = [self.Q, self.N, self.dirty, self.children, self.visited_child_count,
+                  self.ownship_pos, self.intruder_pos, self.ownship_vel]
+        total_bytes = sum(array.nbytes for array in arrays)
+        return {
+            'nodes': self.node_count,
+            'capacity': self.capacity,
+            'bytes': total_bytes,
+            'bytes_per_node': total_bytes / self.capacity,
+        }
@@ -0,0 +1,245 @@
+"""
+ModelFile.py implements the columnar model file format.
+
+A model file stores the learned model as flat arrays instead of a pickle of StateActionQN objects:
+    - magic (8 bytes), format version and header length (uint32 each).
+    - JSON header: Number of modeled states, the discretization settings used during training and the
+      training encounters the model solved.
+    - codes: Sorted int64 array with the code of every modeled discrete state (refer to DiscreteLocalState.code()).
+    - Q: (n, 3) float64 array with the LEFT, NO_TURN, RIGHT Q values of every state.
+    - N: (n, 3) int64 array with the LEFT, NO_TURN, RIGHT N counts of every state.
+The arrays are opened with np.memmap: Loading a model reads only the header and a lookup binary searches the
+sorted codes, so only the pages that are used are read from disk.
+
+Convert a pickle model to a model file (or back with -f pickle) with:
+    python3 -m PPA.ModelFile -i <model.pickle> -o <model.ppa>
+"""
+from PPA.ModelStore import *
+import json
+import struct
+
+# First bytes of every model file.
+MODEL_FILE_MAGIC = b'PPAMODEL'
+MODEL_FILE_VERSION = 1
+# The arrays start at a multiple of this many bytes.
+MODEL_FILE_ALIGNMENT = 64
+# Order of the actions in the Q and N columns.
+MODEL_FILE_ACTIONS = ['LEFT', 'NO_TURN', 'RIGHT']
+
+
+def discretizationSettings(distance_bins=DISTANCE_BINS, angle_bins=ANGLE_BINS, speed_bins=SPEED_BINS):
+    """
+    The discretization settings recorded in the header of a model file (default: Global_constants.py).
+    """
+    return {
+        'distance_bins': distance_bins,
+        'angle_bins': angle_bins,
+        'speed_bins': speed_bins,
+        'min_distance': MIN_DISTANCE,
+        'max_distance': MAX_DISTANCE,
+        'min_angle': MIN_ANGLE,
+        'max_angle': MAX_ANGLE,
+        'min_speed': MIN_SPEED,
+        'max_speed': MAX_SPEED,
+    }
+
+
+def checkDiscretization(header, model_path=''):
+    """
+    Raise a ValueError if a model file was generated with discretization settings that differ from the
+    settings in Global_constants.py: Its state codes would decode into the wrong discrete states.
+    """
+    settings = discretizationSettings()
+    mismatches = [f'{name} = {header.get(name)} (expected {value})'
+                  for name, value in settings.items() if header.get(name) != value]
+    if mismatches:
+        raise ValueError(f'Model {model_path} was trained with different discretization settings: '
+                         + ', '.join(mismatches))
+
+
+def isModelFile(model_path):
+    """
+    True if the file is a columnar model file, False otherwise (e.g. a pickle model).
+    """
+    with open(model_path, 'rb') as f:
+        return f.read(len(MODEL_FILE_MAGIC)) == MODEL_FILE_MAGIC
+
+
+def stateActionQNFromRow(state_code, Q, N):
+    """
+    Build the StateActionQN object of a modeled state from its row of the Q and N arrays.
+    """
+    stateActionQN = StateActionQN(int(state_code), '', 0)
+    for action, action_Q, action_N in zip(MODEL_FILE_ACTIONS, Q.tolist(), N.tolist()):
+        setattr(stateActionQN, action + '_Q', action_Q)
+        setattr(stateActionQN, action + '_N', action_N)
+    return stateActionQN
+
+
+class ColumnarModel:
+    """
+    Read only model backed by a model file. Offers the lookup API of ModelStore: StateActionQN objects are
+    built on demand from the memory mapped arrays.
+    """
+
+    def __init__(self, model_path):
+        self.model_path = model_path
+        with open(model_path, 'rb') as f:
+            magic = f.read(len(MODEL_FILE_MAGIC))
+            if magic != MODEL_FILE_MAGIC:
+                raise ValueError(f'{model_path} is not a model file.')
+            version, header_length = struct.unpack('<II', f.read(8))
+            if version != MODEL_FILE_VERSION:
+                raise ValueError(f'Unsupported model file version {version} in {model_path}.')
+            self.header = json.loads(f.read(header_length).decode())
+        # Keys of the training encounters the model solved (refer to ModelStore.solved_encounters).
+        self.solved_encounters = set(self.header.get('solved_encounters', []))
+
+        count = self.header['count']
+        offset = self.header['data_offset']
+        if count == 0:
+            self.codes = np.zeros(0, dtype=np.int64)
+            self.Q = np.zeros((0, 3))
+            self.N = np.zeros((0, 3), dtype=np.int64)
+            return
+
+        # Plain ndarray views of the memory maps: Indexing a np.memmap subclass is several times slower.
+        self.codes = np.memmap(model_path, dtype='<i8', mode='r', offset=offset, shape=(count,)).view(np.ndarray)
+        offset += self.codes.nbytes
+        self.Q = np.memmap(model_path, dtype='<f8', mode='r', offset=offset, shape=(count, 3)).view(np.ndarray)
+        offset += self.Q.nbytes
+        self.N = np.memmap(model_path, dtype='<i8', mode='r', offset=offset, shape=(count, 3)).view(np.ndarray)
+
+    def index(self, discrete_state):
+        """
+        Row of a discrete state in the arrays or -1 if the state is not modeled.
+        """
+        state_code = ModelStore.key(discrete_state)
+        i = int(self.codes.searchsorted(state_code))
+        if i < len(self.codes) and self.codes.item(i) == state_code:
+            return i
+        return -1
+
+    def get(self, discrete_state):
+        """
+        Return the StateActionQN object modeling a discrete state or None if the state is not modeled.
+        """
+        i = self.index(discrete_state)
+        if i < 0:
+            return None
+        return stateActionQNFromRow(self.codes.item(i), self.Q[i], self.N[i])
+
+    def values(self):
+        """
+        Iterate over the StateActionQN objects in the model.
+        """
+        for i in range(len(self.codes)):
+            yield stateActionQNFromRow(self.codes[i], self.Q[i], self.N[i])
+
+    def stateCodes(self):
+        """
+        The codes of the modeled discrete states as an int64 array (sorted).
+        """
+        return self.codes
+
+    def toModelStore(self):
+        """
+        Load the whole model into a ModelStore that can be updated.
+        """
+        model_store = ModelStore()
+        for stateActionQN in self.values():
+            model_store.add(stateActionQN)
+        model_store.solved_encounters = set(self.solved_encounters)
+        return model_store
+
+    def __contains__(self, discrete_state):
+        return self.index(discrete_state) >= 0
+
+    def __iter__(self):
+        # Iterate over the codes of the modeled discrete states.
+        return iter(self.codes.tolist())
+
+    def __len__(self):
+        return len(self.codes)
+
+
+def saveModelFile(model, model_path, metadata=None):
+    """
+    Write a model (ModelStore or ColumnarModel) to a columnar model file that can be loaded with loadModel().
+    The file is written to a temporary file first and then renamed: A crash never leaves a partial model file.
+    :param metadata: Dictionary of JSON values added to the header of the file (refer to ColumnarModel.header).
+    """
+    codes = np.asarray(model.stateCodes(), dtype=np.int64)
+    order = np.argsort(codes, kind='stable')
+    codes = codes[order]
+
+    if isinstance(model, ColumnarModel):
+        Q = np.asarray(model.Q)[order]
+        N = np.asarray(model.N)[order]
+    else:
+        stateActionQNs = [model.get(state_code) for state_code in codes.tolist()]
+        Q = np.array([[getattr(s, action + '_Q') for action in MODEL_FILE_ACTIONS] for s in stateActionQNs],
+                     dtype=np.float64).reshape(-1, 3)
+        N = np.array([[getattr(s, action + '_N') for action in MODEL_FILE_ACTIONS] for s in stateActionQNs],
+                     dtype=np.int64).reshape(-1, 3)
+
+    saveModelArrays(codes, Q, N, model_path, metadata, solved_encounters=getattr(model, 'solved_encounters', set()))
+
+
+def saveModelArrays(codes, Q, N, model_path, metadata=None, settings=None, solved_encounters=()):
+    """
+    Write a model given as arrays to a columnar model file: Refer to saveModelFile().
+    :param codes: (n,) sorted array of unique discrete state codes.
+    :param Q: (n,3) array of LEFT, NO_TURN, RIGHT Q values.
+    :param N: (n,3) array of LEFT, NO_TURN, RIGHT N counts.
+    :param settings: Discretization settings the codes were generated with (default: discretizationSettings()).
+    :param solved_encounters: Keys of the training encounters the model solved.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    Q = np.asarray(Q, dtype=np.float64).reshape(-1, 3)
+    N = np.asarray(N, dtype=np.int64).reshape(-1, 3)
+
+    header = dict(metadata or {}, **(settings or discretizationSettings()), count=len(codes), data_offset=0,
+                  solved_encounters=sorted(solved_encounters))
+    # The data offset is part of the header: Compute it with a placeholder of the final width.
+    header['data_offset'] = 10**12
+    header_length = len(json.dumps(header).encode())
+    data_offset = -(-(len(MODEL_FILE_MAGIC) + 8 + header_length) // MODEL_FILE_ALIGNMENT) * MODEL_FILE_ALIGNMENT
+    header['data_offset'] = data_offset
+    # Pad the header with spaces (valid JSON) up to the data offset.
+    header_bytes = json.dumps(header).encode()
+    header_bytes += b' ' * (data_offset - len(MODEL_FILE_MAGIC) - 8 - len(header_bytes))
+
+    temporary_path = model_path + '.tmp'
+    with open(temporary_path, 'wb') as f:
+        f.write(MODEL_FILE_MAGIC)
+        f.write(struct.pack('<II', MODEL_FILE_VERSION, len(header_bytes)))
+        f.write(header_bytes)
+        f.write(codes.astype('<i8').tobytes())
+        f.write(Q.astype('<f8').tobytes())
+        f.write(N.astype('<i8').tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, model_path)
+
+
+"""
+Main method: Convert a model file.
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Convert a model (pickle or model file) to the columnar model file format or to a pickle.")
+    parser.add_argument('-i', action="store", dest="INPUT_MODEL", required=True)
+    parser.add_argument('-o', action="store", dest="OUTPUT_MODEL", required=True)
+    parser.add_argument('-f', action="store", dest="FORMAT", choices=['columnar', 'pickle'], default='columnar')
+    args = parser.parse_args()
+
+    Learned_Model = loadModel(args.INPUT_MODEL)
+    if args.FORMAT == 'columnar':
+        saveModelFile(Learned_Model, args.OUTPUT_MODEL)
+    else:
+        if isinstance(Learned_Model, ColumnarModel):
+            Learned_Model = Learned_Model.toModelStore()
+        saveModel(Learned_Model, args.OUTPUT_MODEL)
+    print("CONVERTED STATES: ", len(Learned_Model))
@@ -0,0 +1,46 @@
+"""
+ModelIndex.py implements a spatial index over the discrete states of a learned model.
+
+Exact lookups go through the ModelStore keys. When a discrete state is not modeled, ModelIndex finds the
+modeled discrete state closest to it (euclidean distance between the bin vectors, refer to
+DiscreteLocalState.as_numpy()) with a KD-tree built once when the model is loaded, so every query takes
+logarithmic time in the size of the model instead of a scan of the whole model.
+"""
+from PPA.ModelStore import *
+from scipy.spatial import cKDTree
+
+
+class ModelIndex:
+    """
+    KD-tree over the bin vectors of the discrete states modeled by a ModelStore or a ColumnarModel.
+    The index is a snapshot: Build a new one if the model changes.
+    """
+
+    def __init__(self, model_store, radices=STATE_RADICES):
+        self.model_store = model_store
+        self.radices = radices
+        # Codes of the modeled discrete states and their bin vectors (one row per state).
+        self.codes = np.asarray(model_store.stateCodes(), dtype=np.int64)
+        self.bins = unpackStateCode(self.codes, radices).reshape(-1, 7).astype(np.float64)
+        self.tree = cKDTree(self.bins) if len(self.codes) > 0 else None
+
+    def nearest(self, discrete_state):
+        """
+        Find the modeled discrete state closest to a discrete state.
+        :param discrete_state: DiscreteLocalState or its code.
+        :return: Tuple (StateActionQN, distance) or (None, inf) if the model is empty.
+                 The distance is 0 if the discrete state is modeled.
+        """
+        stateActionQN = self.model_store.get(discrete_state)
+        if stateActionQN is not None:
+            return stateActionQN, 0.0
+
+        if self.tree is None:
+            return None, float('inf')
+
+        bins = unpackStateCode(ModelStore.key(discrete_state), self.radices).astype(np.float64)
+        distance, i = self.tree.query(bins)
+        return self.model_store.get(self.codes.item(i)), float(distance)
+
+    def __len__(self):
+        return len(self.codes)
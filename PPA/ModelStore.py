@@ -0,0 +1,299 @@
+"""
+ModelStore.py implements the container that holds the learned model.
+
+The model is a set of StateActionQN objects, one per discrete local state. ModelStore keys every
+StateActionQN on the integer code of its discrete state (refer to DiscreteLocalState.code()) so inserting,
+updating and looking up a state takes O(1) time regardless of how many states have been modeled.
+
+Models generated before ModelStore existed were pickled as a dictionary of hash chains
+({hash: [StateActionQN, ...]}). loadModel() detects that format and migrates it on load; run:
+    python3 -m PPA.ModelStore -i <old model.pickle> -o <new model.pickle>
+to migrate a model file once and for all.
+PPA_Learn saves models in the columnar model file format, refer to ModelFile.py.
+"""
+from PPA.StateActionQN import *
+import copy
+import pickle
+import argparse
+
+
+class ModelStore:
+    """
+    Keyed set of StateActionQN objects that represent the learned model.
+    The key of every StateActionQN is the code of its discrete state. Discrete states can be
+    given either as DiscreteLocalState objects or as their codes.
+    """
+
+    def __init__(self):
+        # discrete state code -> StateActionQN.
+        self.models = {}
+        # Codes of the states added or updated since the last call to popChanges().
+        self.changed_codes = set()
+        # Keys of the training encounters a valid trajectory was constructed for (refer to PPA_Learn.encounterKey()).
+        self.solved_encounters = set()
+
+    def __setstate__(self, state):
+        # Models pickled before changes and solved encounters were tracked.
+        state.setdefault('changed_codes', set())
+        state.setdefault('solved_encounters', set())
+        self.__dict__.update(state)
+
+    @staticmethod
+    def key(discrete_state):
+        """
+        The key of a discrete state in the model: Its integer code.
+        """
+        if isinstance(discrete_state, DiscreteLocalState):
+            return discrete_state.code()
+        return discrete_state
+
+    def update(self, discrete_state, action, reward):
+        """
+        Add knowledge about taking an action from a discrete state to the model.
+        If the state is already modeled update its Q and N values for the given action by averaging.
+        :param discrete_state: The discrete state to update.
+        :param action: The action taken from the discrete state.
+        :param reward: The expected reward for taking the action.
+        :return: True if the discrete state was not modeled before this update.
+        """
+        state_code = self.key(discrete_state)
+        self.changed_codes.add(state_code)
+        model = self.models.get(state_code)
+        if model is None:
+            self.models[state_code] = StateActionQN(state_code, action, reward)
+            return True
+
+        model.update(action, reward)
+        return False
+
+    def bulkUpdate(self, codes, Q, N):
+        """
+        Add the knowledge of a batch of rewards grouped by discrete state and action (refer to groupedMeans()).
+        Every Q value is averaged with the stored one weighted by the N counts: The same result as calling update()
+        for every reward of the batch (exactly the same for groups of a single reward, up to floating point
+        rounding otherwise).
+        :param codes: (n,) array of unique discrete state codes.
+        :param Q: (n,3) array with the mean LEFT, NO_TURN, RIGHT reward of every state in the batch.
+        :param N: (n,3) array with the number of LEFT, NO_TURN, RIGHT rewards of every state in the batch.
+        :return: The number of states that were not modeled before the update.
+        """
+        new_states = 0
+        for state_code, state_Q, state_N in zip(np.asarray(codes).tolist(), np.asarray(Q).tolist(),
+                                                np.asarray(N).tolist()):
+            self.changed_codes.add(state_code)
+            model = self.models.get(state_code)
+            if model is None:
+                model = StateActionQN(state_code, '', 0)
+                self.models[state_code] = model
+                new_states += 1
+
+            for action, batch_Q, batch_N in zip(['LEFT', 'NO_TURN', 'RIGHT'], state_Q, state_N):
+                if batch_N == 0:
+                    continue
+                action_N = getattr(model, action + '_N')
+                if action_N == 0:
+                    # First Q value for this action.
+                    setattr(model, action + '_Q', batch_Q)
+                else:
+                    # Average: Refer to StateActionQN.update().
+                    action_Q = getattr(model, action + '_Q')
+                    setattr(model, action + '_Q', action_Q + (batch_Q - action_Q) * batch_N / (action_N + batch_N))
+                setattr(model, action + '_N', action_N + batch_N)
+
+        return new_states
+
+    def add(self, stateActionQN: StateActionQN):
+        """
+        Add a StateActionQN object to the model, replacing any object with the same discrete state.
+        """
+        self.models[stateActionQN.state_code] = stateActionQN
+        self.changed_codes.add(stateActionQN.state_code)
+
+    def merge(self, other):
+        """
+        Merge another model into this one. States modeled by both models combine their Q values
+        weighted by their N counts (refer to StateActionQN.merge()). The solved encounters are joined.
+        :param other: The ModelStore to merge. Its StateActionQN objects may be reused by this model.
+        :return: The number of states that were not modeled before the merge.
+        """
+        self.solved_encounters |= other.solved_encounters
+        new_states = 0
+        for state_code, stateActionQN in other.models.items():
+            self.changed_codes.add(state_code)
+            model = self.models.get(state_code)
+            if model is None:
+                self.models[state_code] = stateActionQN
+                new_states += 1
+            else:
+                model.merge(stateActionQN)
+
+        return new_states
+
+    def changes(self):
+        """
+        Return the states added or updated since changes were last cleared as a new ModelStore, without clearing
+        them (refer to clearChanges()). The returned model shares its StateActionQN objects with this model and
+        has all its solved encounters.
+        """
+        changes = ModelStore()
+        changes.models = {state_code: self.models[state_code] for state_code in sorted(self.changed_codes)}
+        changes.solved_encounters = set(self.solved_encounters)
+        return changes
+
+    def clearChanges(self, state_codes):
+        """
+        Stop tracking the given states as changed, e.g. once they are saved.
+        """
+        self.changed_codes.difference_update(state_codes)
+
+    def popChanges(self):
+        """
+        Return the states added or updated since the last call as a new ModelStore and start tracking again.
+        Refer to changes().
+        """
+        changes = self.changes()
+        self.clearChanges(changes.models)
+        return changes
+
+    def get(self, discrete_state):
+        """
+        Return the StateActionQN object modeling a discrete state or None if the state is not modeled.
+        """
+        return self.models.get(self.key(discrete_state))
+
+    def values(self):
+        """
+        Iterate over the StateActionQN objects in the model.
+        """
+        return self.models.values()
+
+    def stateCodes(self):
+        """
+        The codes of the modeled discrete states as an int64 array.
+        """
+        return np.fromiter(self.models, dtype=np.int64, count=len(self.models))
+
+    def __contains__(self, discrete_state):
+        return self.key(discrete_state) in self.models
+
+    def __iter__(self):
+        # Iterate over the codes of the modeled discrete states.
+        return iter(self.models)
+
+    def __len__(self):
+        return len(self.models)
+
+
+class ModelOverlay:
+    """
+    Read only view of a model learned on top of another one: The StateActionQN of a discrete state modeled by both
+    combines their Q values weighted by their N counts (refer to StateActionQN.merge()). Neither model is modified:
+    Updates of the top model are seen by the next lookup.
+    """
+
+    def __init__(self, base, top):
+        """
+        :param base: The model underneath (ModelStore or ColumnarModel).
+        :param top: The model learned on top of it (ModelStore).
+        """
+        self.base = base
+        self.top = top
+
+    def get(self, discrete_state):
+        """
+        Return the combined StateActionQN object modeling a discrete state or None if neither model has the state.
+        """
+        top_model = self.top.get(discrete_state)
+        base_model = self.base.get(discrete_state)
+        if base_model is None:
+            return top_model
+        if top_model is None:
+            return base_model
+
+        combined = copy.copy(base_model)
+        combined.merge(top_model)
+        return combined
+
+    def __contains__(self, discrete_state):
+        return discrete_state in self.top or discrete_state in self.base
+
+
+def groupedMeans(codes, actions, rewards):
+    """
+    Average rewards grouped by discrete state and action in one vectorized pass: The same Q values and N counts
+    ModelStore.update() computes one reward at a time (up to floating point rounding).
+    :param codes: (n,) array of discrete state codes.
+    :param actions: (n,) array of action indices (refer to ACTION_INDEX).
+    :param rewards: (n,) array of rewards.
+    :return: Tuple (sorted unique codes, (m,3) Q values, (m,3) N counts). Columns: LEFT, NO_TURN, RIGHT.
+    """
+    unique_codes, inverse = np.unique(np.asarray(codes, dtype=np.int64), return_inverse=True)
+    # One slot per (state, action) pair.
+    slots = inverse.reshape(-1) * 3 + np.asarray(actions, dtype=np.int64)
+    N = np.bincount(slots, minlength=3 * len(unique_codes)).reshape(-1, 3)
+    sums = np.bincount(slots, weights=rewards, minlength=3 * len(unique_codes)).reshape(-1, 3)
+    Q = np.divide(sums, N, out=np.zeros(sums.shape), where=N > 0)
+    return unique_codes, Q, N
+
+
+def migrateLegacyModel(legacy_model: dict) -> ModelStore:
+    """
+    Convert a model stored as a dictionary of hash chains ({hash: [StateActionQN, ...]}) to a ModelStore.
+    :param legacy_model: The dictionary loaded from an old model pickle file.
+    :return: A ModelStore with the same StateActionQN objects.
+    """
+    model_store = ModelStore()
+    for chain in legacy_model.values():
+        for stateActionQN in chain:
+            model_store.add(stateActionQN)
+
+    return model_store
+
+
+def loadModel(model_path, check_discretization=True):
+    """
+    Load a model file generated by PPA_Learn. Old models stored as hash chains are migrated on load.
+    :param model_path: Path to the model: A columnar model file (refer to ModelFile.py) or a pickle file.
+    :param check_discretization: Raise a ValueError if a model file was trained with discretization settings that
+                                 differ from Global_constants.py (pickle files do not record them).
+    :return: A read only ColumnarModel for model files, a ModelStore for pickle files.
+    """
+    # ModelFile imports this module: Import it here.
+    from PPA.ModelFile import isModelFile, ColumnarModel, checkDiscretization
+    if isModelFile(model_path):
+        model = ColumnarModel(model_path)
+        if check_discretization:
+            checkDiscretization(model.header, model_path)
+        return model
+
+    with open(model_path, 'rb') as f:
+        model = pickle.load(f)
+
+    if isinstance(model, dict):
+        model = migrateLegacyModel(model)
+
+    return model
+
+
+def saveModel(model_store: ModelStore, model_path):
+    """
+    Dump a model to a pickle file that can be loaded with loadModel().
+    """
+    with open(model_path, 'wb') as f:
+        pickle.dump(model_store, f)
+
+
+"""
+Main method: Migrate an old model file.
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(
+        description="Migrate a model pickle file to the ModelStore format.")
+    parser.add_argument('-i', action="store", dest="INPUT_MODEL", required=True)
+    parser.add_argument('-o', action="store", dest="OUTPUT_MODEL", required=True)
+    args = parser.parse_args()
+
+    Learned_Model = loadModel(args.INPUT_MODEL)
+    saveModel(Learned_Model, args.OUTPUT_MODEL)
+    print("MIGRATED STATES: ", len(Learned_Model))
@@ -3,14 +3,26 @@ Run the training/learning process...
 Generate a file that represents our model, this file is then loaded into PPA_Test to evaluate the model.
 """
 from PPA.MCTS import *
+from PPA.MCTSArena import *
+from PPA.LockstepMCTS import *
+from PPA.TranspositionTable import *
 from PPA.StateActionQN import *
-import pickle
+from PPA.ModelStore import *
+from PPA.ModelFile import *
+from PPA.Checkpoints import *
+from PPA.ReplayLog import *
 from PPA.State import *
 from PPA.Global_constants import *
+import multiprocessing
+import argparse
+import tempfile
 
 
 # Set of StateActionQN objects that represent the learned model.
-Learned_Model = {}
+Learned_Model = ModelStore()
+# Worker processes only: Read only snapshot of the model as it stood before the batch of encounters the worker learns
+# from, Learned_Model holds the knowledge of the current encounter only (refer to learnFromEncounterPartial()).
+Base_Model = None
 # Keep track of how many discrete states the model contains.
 states_modeled = 0
 
@@ -19,16 +31,59 @@ distance_discretizer, angle_discretizer, speed_discretizer, space_size = setUpdi
 
 # Used to keep track of the training number when creating a results directory.
 TRAINING_NUMBER = 0
+# Directory of the checkpoint segments of the training run (refer to Checkpoints.py).
+CHECKPOINT_PATH = None
+# Replay log of the encounter being learned (None: the tuples are not logged, refer to ReplayLog.py).
+Replay_Log = None
+# Greedy trajectory last constructed for the encounter being learned (refer to GreedyPath).
+Greedy_Path = None
+# Rollout values shared by the nodes of the encounter being learned (None: no table, refer to TranspositionTable.py).
+Transposition_Table = None
 
 
-def learnFromEncounter(encounter_directory, encounter_index):
+class GreedyPath:
     """
-    Given the directory to an encounter, learn from it.
+    Trajectory of the greedy policy of the model from the initial state of an encounter, cached between calls to
+    constructPathWhileLearning(): Step i takes actions[i] from states[i], whose discrete state code is codes[i].
+    The last state of the trajectory is terminal or its discrete state is not modeled.
     """
-    global states_modeled
 
-    print("LEARNING FROM ", encounter_directory)
+    def __init__(self, initial_state: State):
+        self.states = [initial_state]
+        self.codes = []
+        self.actions = []
 
+    def firstChangedStep(self, updated_codes):
+        """
+        First step whose best action differs from the cached one after the model updated some discrete states.
+        :param updated_codes: Set of the discrete state codes updated since the trajectory was constructed.
+        :return: Index of the step or the number of steps if no step changed (the trajectory continues from
+                 its last state).
+        """
+        for step, (state_code, action) in enumerate(zip(self.codes, self.actions)):
+            if state_code in updated_codes and trajectoryModel().get(state_code).getBestAction() != action:
+                return step
+        return len(self.actions)
+
+    def truncate(self, step):
+        """
+        Drop the steps from the given step on: The trajectory ends at states[step].
+        """
+        del self.states[step + 1:]
+        del self.codes[step:]
+        del self.actions[step:]
+
+    def append(self, state_code, action, new_state: State):
+        self.codes.append(state_code)
+        self.actions.append(action)
+        self.states.append(new_state)
+
+
+def encounterInitialState(encounter_directory, encounter_index):
+    """
+    Initial state of an encounter to learn from.
+    :return: The State or None if the encounter must be skipped.
+    """
     encounter_state = getInitStateFromEncounter(
         encounter_directory, encounter_index)
 
@@ -41,10 +96,34 @@ def learnFromEncounter(encounter_directory, encounter_index):
             The two aircraft's initial positions is not separated by at least the well clear.
         '''
         print(log_str)
-        return
+        return None
+
+    return encounter_state
+
+
+def learnFromEncounter(encounter_directory, encounter_index):
+    """
+    Given the directory to an encounter, learn from it.
+    :return: True if a valid trajectory was constructed with the model (the encounter is solved).
+    """
+    global states_modeled, Greedy_Path
+
+    print("LEARNING FROM ", encounter_directory)
+    # The cached trajectory belongs to the previous encounter.
+    Greedy_Path = None
+
+    encounter_state = encounterInitialState(encounter_directory, encounter_index)
+    if encounter_state is None:
+        return False
+
+    if ROOT_PARALLEL_WORKERS > 1:
+        return learnRootParallel(encounter_state)
 
     # Generate a Monte Carlo Tree Search with initial state at this initial encounter state.
-    mcts = MCST(encounter_state)
+    if MCTS_ARENA:
+        mcts = ArenaMCST(encounter_state, transposition_table=Transposition_Table)
+    else:
+        mcts = MCST(encounter_state, transposition_table=Transposition_Table, node_budget=MCTS_NODE_BUDGET)
 
     # Perform selection, expansion, and simulation procedures MCTS_ITERATIONS times.
     """
@@ -60,12 +139,16 @@ def learnFromEncounter(encounter_directory, encounter_index):
             # Get State,Action,Rewards for states that updated in the last 1000 iterations.
             mcts.getStateActionRewards(mcts.root)
             # Add/Update model objects.
-            addModelObjects(mcts)
+            updated_codes = addModelObjects(mcts)
+            # The tuples are in the model: Collapse rarely visited subtrees if the tree is over its node budget.
+            if not MCTS_ARENA:
+                mcts.prune()
             # Try to construct a path with the current model.
-            result = constructPathWhileLearning(encounter_state)
+            result = constructPathWhileLearning(encounter_state, updated_codes)
             if result == 0:
                 print("SUCCESS TRAJ.")
-                return
+                print("TREE MEMORY: ", mcts.memoryReport())
+                return True
         """
             Run Monte Carlo Tree Search.
         """
@@ -77,72 +160,410 @@ def learnFromEncounter(encounter_directory, encounter_index):
         mcts.simulate()
 
     print("STATES MODELED: ", states_modeled)
+    print("TREE MEMORY: ", mcts.memoryReport())
+    return False
 
 
 def addModelObjects(mcts):
     """
     After a number of iterations of MCTS for a given encounter, get the set of (state,action,rewards) and add it
     to the model. If a state is already  in the model update its Q and N values for the given action by averaging.
+    The whole set is converted, discretized and grouped by (discrete state, action) as numpy arrays: Refer to
+    ModelStore.bulkUpdate().
     :param mcts: The tree with the (state,action,rewards) tuples.
+    :return: Set of the discrete state codes added or updated.
+    """
+    return addStateActionRewards(*stateActionRewardArrays(mcts.state_action_reward))
+
+
+def stateActionRewardArrays(state_action_reward):
+    """
+    Convert a list of (state, action, reward) tuples to arrays.
+    Skip non expanded children - There is no knowledge about their Q value.
+    :return: Tuple (StateBatch or None if no tuple is left, (n,) action indices, (n,) rewards).
+    """
+    state_action_reward = [t for t in state_action_reward if t[2] != 0]
+    if not state_action_reward:
+        return None, np.zeros(0, dtype=np.int64), np.zeros(0)
+
+    states = StateBatch.fromStates([state for state, _, _ in state_action_reward])
+    actions = np.array([ACTION_INDEX[action] for _, action, _ in state_action_reward], dtype=np.int64)
+    rewards = np.array([reward for _, _, reward in state_action_reward], dtype=np.float64)
+    return states, actions, rewards
+
+
+def addStateActionRewards(states: StateBatch, actions, rewards):
+    """
+    Add a batch of (state, action, reward) tuples to the model: Refer to addModelObjects().
+    :param states: The continuous states (None: empty batch).
+    :param actions: (n,) array of action indices (refer to ACTION_INDEX).
+    :param rewards: (n,) array of rewards.
+    :return: Set of the discrete state codes added or updated.
     """
     global states_modeled
 
-    # The set of state, action, rewards that agent learned from this encounter's MCTS iterations.
-    for state, action, reward in mcts.state_action_reward:
-
-        if reward == 0:
-            # This is a non expanded child - There is no knowledge about its Q value.
-            continue
-
-        # Convert state to a local state.
-        localstate = convertAbsToLocal(state)
-        # Discretize the resulting local state.
-        discrete_local_state = discretizeLocalState(localstate,
-                                                    distance_discretizer,
-                                                    angle_discretizer,
-                                                    speed_discretizer)
-        # Generate a discrete model object.
-        stateActionQN = StateActionQN(discrete_local_state, action, reward)
-
-        # Compute the hash value of this discrete state.
-        stateActionQN_hash = hash(StateActionQN)
-
-        state_exists = False
-        try:
-            # Linear search the chain of discrete states with this hash value
-            # to see if we find an identical discrete state.
-            for d_state in Learned_Model[stateActionQN_hash]:
-                if d_state == stateActionQN:
-                    state_exists = True
-                    """
-                        This discrete local state already
-                        exists in our model: Update our 
-                        knowledge about its Q value by averaging.
-                    """
-                    d_state.update(action, reward)
-                    break
-            # No identical state found: Append new discrete state to the chain.
-            if not state_exists:
-                states_modeled += 1
-                Learned_Model[stateActionQN_hash].append(stateActionQN)
-        except KeyError:
-            # First state that hashed to this hash key.
-            Learned_Model[stateActionQN_hash] = [stateActionQN]
-            states_modeled += 1
-
-
-def runEncounters():
+    if states is None:
+        return set()
+
+    # Convert the states to local states and discretize them (packed into integer codes).
+    features = convertAbsToLocalBatch(states.ownship_pos, states.intruder_pos, states.ownship_vel, states.intruder_vel)
+    discrete_state_codes = discretizeFeatureCodes(features, distance_discretizer, angle_discretizer, speed_discretizer)
+
+    # Add the discrete states to the model or update our knowledge about their Q values by averaging.
+    unique_codes, Q, N = groupedMeans(discrete_state_codes, actions, rewards)
+    states_modeled += Learned_Model.bulkUpdate(unique_codes, Q, N)
+
+    if Replay_Log is not None:
+        Replay_Log.extend(states, actions, rewards)
+
+    return set(unique_codes.tolist())
+
+
+def rootParallelWorker(connection, encounter_state, seed):
+    """
+    Worker process of root-parallel MCTS (refer to learnRootParallel()): Grows its own tree from the encounter state
+    with its own seed. Every message received is a number of MCTS iterations to run: The worker answers with the
+    (state, action, reward) tuples of its tree updated by them (refer to stateActionRewardArrays()).
+    """
+    random.seed(seed)
+    np.random.seed(seed)
+    if MCTS_ARENA:
+        mcts = ArenaMCST(encounter_state)
+    else:
+        mcts = MCST(encounter_state, node_budget=MCTS_NODE_BUDGET)
+
+    while True:
+        iterations = connection.recv()
+        if iterations is None:
+            break
+
+        for _ in range(iterations):
+            mcts.expansion(mcts.selection())
+            mcts.simulate()
+
+        mcts.state_action_reward = []
+        mcts.getStateActionRewards(mcts.root)
+        connection.send(stateActionRewardArrays(mcts.state_action_reward))
+        if not MCTS_ARENA:
+            mcts.prune()
+
+
+def learnRootParallel(encounter_state: State):
+    """
+    Root-parallel MCTS: ROOT_PARALLEL_WORKERS worker processes grow independent trees from the encounter state,
+    each one with its own seed. The MCTS_CUT iterations between path checks are split among the workers and the
+    tuples harvested from every tree are added to the model at every cut, in worker order, before the path check.
+    :return: True if a valid trajectory was constructed with the model (the encounter is solved).
+    """
+    # Same number of iterations per cut as a single tree: Worker w runs the MCTS_CUT // workers iterations plus one
+    # of the remainder.
+    worker_iterations = [MCTS_CUT // ROOT_PARALLEL_WORKERS + (worker < MCTS_CUT % ROOT_PARALLEL_WORKERS)
+                         for worker in range(ROOT_PARALLEL_WORKERS)]
+
+    workers = []
+    try:
+        for _ in range(ROOT_PARALLEL_WORKERS):
+            connection, worker_connection = multiprocessing.Pipe()
+            # The worker seeds come from the random generator of this encounter (refer to learnFromTask()).
+            process = multiprocessing.Process(target=rootParallelWorker,
+                                              args=(worker_connection, encounter_state, random.getrandbits(32)),
+                                              daemon=True)
+            process.start()
+            worker_connection.close()
+            workers.append((process, connection))
+
+        updated_codes = set()
+        for cut in range(0, MCTS_ITERATIONS, MCTS_CUT):
+            if cut > 0:
+                # Merge the tuples of all the trees: Add/Update model objects.
+                batches = [connection.recv() for _, connection in workers]
+                batches = [batch for batch in batches if batch[0] is not None]
+                if batches:
+                    states = StateBatch(*(np.concatenate([getattr(batch[0], column) for batch in batches])
+                                          for column in ['ownship_pos', 'intruder_pos', 'ownship_vel',
+                                                         'intruder_vel']))
+                    updated_codes = addStateActionRewards(states, np.concatenate([batch[1] for batch in batches]),
+                                                          np.concatenate([batch[2] for batch in batches]))
+                else:
+                    updated_codes = set()
+
+            # Try to construct a path with the current model.
+            result = constructPathWhileLearning(encounter_state, updated_codes)
+            if result == 0:
+                print("SUCCESS TRAJ.")
+                return True
+
+            # Run the iterations until the next cut (the iterations after the last cut would never be harvested).
+            if cut + MCTS_CUT < MCTS_ITERATIONS:
+                for (_, connection), iterations in zip(workers, worker_iterations):
+                    connection.send(iterations)
+    finally:
+        # The workers keep no state that must be saved.
+        for process, connection in workers:
+            process.terminate()
+            process.join()
+            connection.close()
+
+    print("STATES MODELED: ", states_modeled)
+    return False
+
+
+def encounterKey(encounter_geometry):
+    """
+    Key of an encounter geometry (a row of the training set without its Run number) in the set of solved encounters
+    of a model (refer to ModelStore.solved_encounters).
+    """
+    return ','.join(repr(float(value)) for value in encounter_geometry.tolist()[1:])
+
+
+def encounterSeed(seed, encounter_index):
+    """
+    Seed of the random generators used to learn from an encounter: Depends only on the training seed and
+    the encounter index so the result of an encounter does not depend on which worker learns from it.
+    """
+    return (seed * 100003 + encounter_index) % 2**32
+
+
+def learnFromTask(task):
+    """
+    Learn from an encounter of the training set into Learned_Model.
+    :param task: Tuple (encounter directory, encounter index, seed or None, encounter key,
+                 replay log directory or None) generated by runEncounters().
+    """
+    global Replay_Log, Transposition_Table
+
+    encounter_directory, encounter_index, seed, encounter_key, replay_path = task
+
+    if seed is not None:
+        random.seed(encounterSeed(seed, encounter_index))
+        np.random.seed(encounterSeed(seed, encounter_index))
+    if replay_path is not None:
+        Replay_Log = ReplayLog(replay_path, f'encounter-{encounter_index:06d}')
+    # A new table for every encounter: The values an encounter reuses do not depend on which encounters the process
+    # learned before (workers, resumed runs).
+    if TRANSPOSITION_TABLE_SIZE is not None:
+        Transposition_Table = TranspositionTable()
+
+    if learnFromEncounter(encounter_directory, encounter_index):
+        Learned_Model.solved_encounters.add(encounter_key)
+    if Transposition_Table is not None:
+        print("TRANSPOSITION TABLE: ", Transposition_Table.report())
+        Transposition_Table = None
+
+    if Replay_Log is not None:
+        Replay_Log.close()
+        Replay_Log = None
+
+
+def learnFromTasksLockstep(tasks):
+    """
+    Learn from a group of encounters of the training set at once into Learned_Model: The trees of all the encounters
+    grow in lockstep (refer to LockstepMCTS.py). Every MCTS_CUT iterations the tuples of all the trees are added to
+    the model and then a trajectory is constructed for every encounter: Solved encounters stop growing their trees.
+    :param tasks: List of tasks (refer to learnFromTask()). The random generators are seeded with the seed of the
+                  first encounter of the group.
+    """
+    global Replay_Log, Greedy_Path
+
+    encounter_index, seed = tasks[0][1], tasks[0][2]
+    if seed is not None:
+        random.seed(encounterSeed(seed, encounter_index))
+        np.random.seed(encounterSeed(seed, encounter_index))
+
+    # Encounters to learn from: (task, initial state, replay log or None).
+    encounters = []
+    for task in tasks:
+        encounter_directory, encounter_index, _, _, replay_path = task
+        print("LEARNING FROM ", encounter_directory)
+        encounter_state = encounterInitialState(encounter_directory, encounter_index)
+        if encounter_state is not None:
+            replay_log = None
+            if replay_path is not None:
+                replay_log = ReplayLog(replay_path, f'encounter-{encounter_index:06d}')
+            encounters.append((task, encounter_state, replay_log))
+
+    trees = LockstepMCTS([encounter_state for _, encounter_state, _ in encounters])
+    # Greedy trajectory cached for every encounter (refer to GreedyPath).
+    greedy_paths = [None] * len(encounters)
+    # Indices of the encounters not solved yet.
+    active = list(range(len(encounters)))
+
+    for i in range(MCTS_ITERATIONS):
+
+        # Try to construct paths every MCTS_CUT iterations of MCTS.
+        if i % MCTS_CUT == 0:
+            # Add the tuples of all the trees first: Every path is then checked against the same model.
+            updated_codes = set()
+            for k in active:
+                mcts = trees[k]
+                mcts.state_action_reward = []
+                mcts.getStateActionRewards(mcts.root)
+                Replay_Log = encounters[k][2]
+                updated_codes |= addModelObjects(mcts)
+            Replay_Log = None
+
+            for k in list(active):
+                Greedy_Path = greedy_paths[k]
+                result = constructPathWhileLearning(encounters[k][1], updated_codes)
+                greedy_paths[k] = Greedy_Path
+                if result == 0:
+                    print("SUCCESS TRAJ. ", encounters[k][0][0])
+                    Learned_Model.solved_encounters.add(encounters[k][0][3])
+                    active.remove(k)
+
+            if not active:
+                break
+
+        trees.iterate(active)
+
+    Greedy_Path = None
+    for _, _, replay_log in encounters:
+        if replay_log is not None:
+            replay_log.close()
+    print("STATES MODELED: ", states_modeled)
+
+
+def trajectoryModel():
+    """
+    The model trajectories are constructed with while learning: Learned_Model, or in worker processes the
+    knowledge of the current encounter on top of the snapshot of the model before its batch (refer to Base_Model).
+    """
+    if Base_Model is None:
+        return Learned_Model
+    return ModelOverlay(Base_Model, Learned_Model)
+
+
+def setBaseModel(model_path):
+    """
+    Set the snapshot of the model before the batch of the next encounter (run by the worker processes of
+    runEncounters()): The model file is memory mapped once per batch, not once per encounter.
+    :param model_path: Model file of the snapshot (refer to ModelFile.py).
+    """
+    global Base_Model
+
+    if Base_Model is None or Base_Model.model_path != model_path:
+        Base_Model = ColumnarModel(model_path)
+
+
+def learnFromEncounterPartial(batch_task):
+    """
+    Learn from an encounter into a new, empty model (run by the worker processes of runEncounters()).
+    The trajectory built while learning is constructed with this encounter's knowledge on top of the model as it
+    stood before the batch of the encounter (refer to Base_Model): It does not depend on the worker count.
+    :param batch_task: Tuple (task, model file of the snapshot of the model before the batch). Refer to
+                       learnFromTask() and parallelBatches().
+    :return: The partial model learned from the encounter as a ModelStore.
+    """
+    global Learned_Model, states_modeled
+
+    task, base_model_path = batch_task
+    setBaseModel(base_model_path)
+    Learned_Model = ModelStore()
+    states_modeled = 0
+    learnFromTask(task)
+    return Learned_Model
+
+
+def parallelBatches(tasks):
+    """
+    Split the tasks learned in parallel into batches of PARALLEL_BATCH_SIZE consecutive encounter indices: The
+    batches do not depend on the worker count nor on the encounters already learned.
+    :param tasks: Tasks in encounter order (refer to learnFromTask()).
+    :return: List of lists of tasks.
+    """
+    batches = {}
+    for task in tasks:
+        batches.setdefault(task[1] // PARALLEL_BATCH_SIZE, []).append(task)
+    return list(batches.values())
+
+
+def checkpointEncounter(encounter_index, last=False, first_index=None):
+    """
+    Write a checkpoint segment every CHECKPOINT_EVERY encounters (and after the last encounter) with the states
+    updated since the previous segment.
+    :param encounter_index: Index of the encounter just learned.
+    :param last: True after the last encounter of the training set.
+    :param first_index: Index of the first encounter learned since the previous call when a group of encounters was
+                        learned at once (None: only encounter_index).
+    """
+    if CHECKPOINT_EVERY is None or (last and not Learned_Model.changed_codes):
+        return
+    if first_index is None:
+        first_index = encounter_index
+    if last or any((index + 1) % CHECKPOINT_EVERY == 0 for index in range(first_index, encounter_index + 1)):
+        segment_path = writeSegment(Learned_Model, CHECKPOINT_PATH, encounter_index, TRAINING_NUMBER)
+        print("CHECKPOINT: ", segment_path)
+
+
+def runEncounters(workers=1, seed=None, resume_path=None, initial_model_path=None, replay_path=None, lockstep=1):
     """
     Given the set of training encounters specified in globlal_constants -- TRAINING_SET, iterate over each
     encounter and run MCTS.
+    :param workers: Number of processes learning from encounters in parallel. With more than 1 worker every
+                    encounter is learned into a partial model and the partial models are merged into
+                    Learned_Model in encounter order (refer to ModelStore.merge()). The encounters of a batch
+                    (refer to parallelBatches()) construct their trajectories with the model before the batch, not
+                    with the encounters learned just before them: 1 worker and more than 1 worker train different
+                    models. A resumed run learns the batch it was interrupted in again.
+    :param seed: Seed of the random generators (None: do not seed). With a seed the merged model is the same
+                 for any number of workers > 1.
+    :param resume_path: Directory of an interrupted training run: Load its checkpoints and continue
+                        from the encounter after the last checkpointed one (refer to Checkpoints.py).
+    :param initial_model_path: Model file (or pickle) to warm start from: Training continues averaging its Q values
+                               and the encounters it solved are skipped. Ignored when resuming.
+    :param replay_path: Directory of the replay log to stream the (state, action, reward) tuples learned to
+                        (None: no replay log, refer to ReplayLog.py).
+    :param lockstep: Number of encounters learned at once by a single process (refer to learnFromTasksLockstep()).
     """
 
-    global PATH, TRAINING_NUMBER
+    global PATH, TRAINING_NUMBER, CHECKPOINT_PATH, Learned_Model, states_modeled
+
+    if TRANSPOSITION_TABLE_SIZE is not None and (ROOT_PARALLEL_WORKERS > 1 or lockstep > 1):
+        raise ValueError("TRANSPOSITION_TABLE_SIZE can not be combined with root-parallel (-rp) or lockstep (-ls) "
+                         "training: Their trees do not use the transposition table.")
+    if workers > PARALLEL_BATCH_SIZE:
+        raise ValueError(f"{workers} workers can not be busy with batches of PARALLEL_BATCH_SIZE = "
+                         f"{PARALLEL_BATCH_SIZE} encounters.")
+    if workers > 1 and CHECKPOINT_EVERY is not None and PARALLEL_BATCH_SIZE % CHECKPOINT_EVERY != 0:
+        raise ValueError("PARALLEL_BATCH_SIZE must be a multiple of CHECKPOINT_EVERY: A resumed run learns the "
+                         "interrupted batch again from the checkpoint before it.")
 
     PATH = TEST_RESULTS_PATH
+    # Index of the last encounter already learned.
+    last_encounter = -1
+
+    if resume_path is not None:
+        checkpoint_dir = resume_path.rstrip('/') + '/checkpoints'
+        # Read before the rollback: It may delete every segment.
+        resume_training_number = checkpointTrainingNumber(checkpoint_dir)
+        if workers > 1:
+            # The encounters of a batch build on the model before the batch: Learn the interrupted batch again.
+            batch_start = (lastCheckpointedEncounter(checkpoint_dir) + 1) // PARALLEL_BATCH_SIZE * PARALLEL_BATCH_SIZE
+            rollbackCheckpoints(checkpoint_dir, batch_start - 1)
+        Learned_Model, last_encounter = compactCheckpoints(checkpoint_dir)
+        states_modeled = len(Learned_Model)
+        print(f"RESUMING AFTER ENCOUNTER {last_encounter} WITH {states_modeled} STATES MODELED")
+    elif initial_model_path is not None:
+        initial_model = loadModel(initial_model_path)
+        if isinstance(initial_model, ColumnarModel):
+            initial_model = initial_model.toModelStore()
+        # Merge into the empty model: The initial states are part of the first checkpoint segment.
+        states_modeled = Learned_Model.merge(initial_model)
+        print(f"WARM START FROM {initial_model_path}: {states_modeled} STATES MODELED, "
+              f"{len(Learned_Model.solved_encounters)} ENCOUNTERS SOLVED")
 
     # Create a directory for the Training encounters.
-    if not os.path.exists(PATH):
+    if resume_path is not None:
+        PATH = resume_path.rstrip('/')
+        TRAINING_NUMBER = resume_training_number
+        if TRAINING_NUMBER is None:
+            # Checkpoints written before the training number was recorded: Refer to the directory naming below.
+            digits = PATH[len(PATH.rstrip('0123456789')):]
+            if not digits and os.path.abspath(PATH) != os.path.abspath(TEST_RESULTS_PATH):
+                raise ValueError(f"The checkpoints of {PATH} do not record the training number and the directory "
+                                 f"name does not end with it.")
+            TRAINING_NUMBER = int(digits or 0)
+    elif not os.path.exists(PATH):
         os.makedirs(PATH)
     elif os.path.exists(PATH):
         i = 1
@@ -152,6 +573,7 @@ def runEncounters():
             PATH = PATH[:-1] + str(i)
         os.makedirs(PATH)
         TRAINING_NUMBER = i
+    CHECKPOINT_PATH = PATH + '/checkpoints'
 
     # Header set to 0 because Test_Encounter_Geometries.csv contains headers on first row.
     ENCOUNTERS_GEOMETRIES = pd.read_csv(TRAINING_SET, header=0)
@@ -162,59 +584,97 @@ def runEncounters():
     """
         Learn from training set
     """
+    tasks = []
     for encounter_index in range(NUMBER_OF_ENCOUNTERS):
 
         # Create a directory for this encounter's description and resulting path after a model test.
         ENCOUNTER_NAME = f'ENCOUNTER_{encounter_index}'
         ENCOUNTER_PATH = PATH + '/' + ENCOUNTER_NAME
-        os.makedirs(ENCOUNTER_PATH)
+        os.makedirs(ENCOUNTER_PATH, exist_ok=resume_path is not None)
 
         # Create a .csv file to describe this encounter
         (ENCOUNTERS_GEOMETRIES.iloc[encounter_index]).to_csv(
             ENCOUNTER_PATH + '/desc.csv', index=False, header=False)
-        # Learn
-        learnFromEncounter(ENCOUNTER_PATH, encounter_index)
-
-
-def constructPathWhileLearning(initial_state: State):
+        encounter_key = encounterKey(ENCOUNTERS_GEOMETRIES.iloc[encounter_index])
+        if encounter_key in Learned_Model.solved_encounters:
+            print(f"ENCOUNTER {encounter_index} ALREADY SOLVED: SKIPPED")
+        elif encounter_index > last_encounter:
+            tasks.append((ENCOUNTER_PATH, encounter_index, seed, encounter_key, replay_path))
+
+    if lockstep > 1:
+        # Learn groups of encounters in lockstep: Every group builds on the knowledge of the previous ones.
+        for start in range(0, len(tasks), lockstep):
+            group = tasks[start:start + lockstep]
+            learnFromTasksLockstep(group)
+            checkpointEncounter(group[-1][1], first_index=group[0][1])
+    elif workers == 1:
+        # Learn sequentially: Every encounter builds on the knowledge of the previous ones.
+        for task in tasks:
+            learnFromTask(task)
+            checkpointEncounter(task[1])
+    else:
+        # Learn in parallel, one batch of encounters at a time: Every encounter of a batch builds on the model as it
+        # stood before the batch, saved to a model file the workers memory map (refer to setBaseModel()).
+        with tempfile.TemporaryDirectory(prefix='ppa-batches-') as snapshot_dir, \
+                multiprocessing.Pool(workers) as pool:
+            for batch_index, batch in enumerate(parallelBatches(tasks)):
+                snapshot_path = os.path.join(snapshot_dir, f'batch-{batch_index:06d}.ppa')
+                saveModelFile(Learned_Model, snapshot_path)
+                batch_tasks = [(task, snapshot_path) for task in batch]
+                # imap returns the partial models in encounter order so merging them is deterministic.
+                for task, partial_model in zip(batch, pool.imap(learnFromEncounterPartial, batch_tasks)):
+                    Learned_Model.merge(partial_model)
+                    checkpointEncounter(task[1])
+                # Every encounter of the batch is learned: The next tasks carry the snapshot of the next batch.
+                os.remove(snapshot_path)
+
+        states_modeled = len(Learned_Model)
+
+    # Checkpoint the encounters learned since the last segment.
+    if tasks:
+        checkpointEncounter(NUMBER_OF_ENCOUNTERS - 1, last=True)
+
+
+def constructPathWhileLearning(initial_state: State, updated_codes=None):
     """
     After a number of iterations of MCTS for a given encounter, try to construct a trajectory using the current model.
+    The trajectory constructed by the previous call for the same initial state is reused (refer to GreedyPath):
+    The greedy policy is simulated again only from the first step whose best action changed, or from the end of
+    the trajectory if its last discrete state was not modeled.
     :param initial_state: Initial state for the trajectory
+    :param updated_codes: Set of the discrete state codes the model updated since the previous call
+                          (None: unknown, the whole trajectory is constructed again).
     """
+    global Greedy_Path
 
-    current_state = initial_state
+    if Greedy_Path is None or Greedy_Path.states[0] is not initial_state or updated_codes is None:
+        Greedy_Path = GreedyPath(initial_state)
+    else:
+        Greedy_Path.truncate(Greedy_Path.firstChangedStep(updated_codes))
+
+    model = trajectoryModel()
+    current_state = Greedy_Path.states[-1]
     # Begin to construct a trajectory
     # A return of 0 means the current state is not final.
     while isTerminalState(current_state) == 0:
-        # Assume this specific state is not modeled in memory yet.
-        model_has_state = False
         # Convert to a local state.
         current_local_state = convertAbsToLocal(current_state)
-        # Discretize the local state
-        current_discrete_local_state = discretizeLocalState(current_local_state,
-                                                            distance_discretizer,
-                                                            angle_discretizer,
-                                                            speed_discretizer)
-
-        # Generate a dummy model object for comparison purposes.
-        model_lookup = StateActionQN(current_discrete_local_state, '', 0)
-        # hash dummy model object
-        model_lookup_hash = hash(model_lookup)
-        try:
-            for d_state in Learned_Model[model_lookup_hash]:
-                if d_state == model_lookup:  # same discrete local state
-                    action = d_state.getBestAction()
-                    current_state = getNewState(
-                        current_state, action, TIME_INCREMENT)
-                    model_has_state = True
-                    break
-            if not model_has_state:
-                # Valid trajectory couldn't be constructed: Missing the current state in model.
-                return -1
-        except KeyError:
+        # Discretize the local state (packed into an integer code).
+        current_discrete_state_code = discretizeLocalStateCode(current_local_state,
+                                                               distance_discretizer,
+                                                               angle_discretizer,
+                                                               speed_discretizer)
+
+        # Look up the discrete local state in the model.
+        d_state = model.get(current_discrete_state_code)
+        if d_state is None:
             # Valid trajectory couldn't be constructed: Missing the current state in model.
             return -1
 
+        action = d_state.getBestAction()
+        current_state = getNewMacroState(current_state, action, TIME_INCREMENT, TRAINING_MACRO_STEPS)
+        Greedy_Path.append(current_discrete_state_code, action, current_state)
+
     # loop ends when reaches a final state.
     """
         What final state did the agent reach?
@@ -242,6 +702,36 @@ Main method.
 """
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser(description="Train a PPA model on the encounters of TRAINING_SET.")
+    parser.add_argument('-w', action="store", dest="WORKERS", type=int, default=1,
+                        help="Number of processes learning from encounters in parallel.")
+    parser.add_argument('-s', action="store", dest="SEED", type=int, default=None,
+                        help="Seed of the random generators.")
+    parser.add_argument('-r', action="store", dest="RESUME", default=None,
+                        help="Directory of an interrupted training run to resume from its checkpoints.")
+    parser.add_argument('-m', action="store", dest="INITIAL_MODEL", default=None,
+                        help="Model to warm start from: Encounters it solved are skipped.")
+    parser.add_argument('-l', action="store", dest="REPLAY_LOG", default=None,
+                        help="Directory of a replay log of the (state, action, reward) tuples learned.")
+    parser.add_argument('-rp', action="store", dest="ROOT_PARALLEL_WORKERS", type=int, default=ROOT_PARALLEL_WORKERS,
+                        help="Number of processes growing independent trees of every encounter (root-parallel MCTS).")
+    parser.add_argument('-ls', action="store", dest="LOCKSTEP_ENCOUNTERS", type=int, default=LOCKSTEP_ENCOUNTERS,
+                        help="Number of encounters whose trees grow in lockstep in a single process.")
+    args = parser.parse_args()
+    if args.RESUME is not None and args.INITIAL_MODEL is not None:
+        parser.error("-m can not be combined with -r: The checkpoints already contain the initial model.")
+    if args.ROOT_PARALLEL_WORKERS > 1 and args.WORKERS > 1:
+        parser.error("-rp can not be combined with -w: Parallelize either across encounters or within them.")
+    if args.LOCKSTEP_ENCOUNTERS > 1 and (args.WORKERS > 1 or args.ROOT_PARALLEL_WORKERS > 1):
+        parser.error("-ls can not be combined with -w or -rp.")
+    if TRANSPOSITION_TABLE_SIZE is not None and (args.ROOT_PARALLEL_WORKERS > 1 or args.LOCKSTEP_ENCOUNTERS > 1):
+        parser.error("-rp and -ls can not be combined with TRANSPOSITION_TABLE_SIZE: Their trees do not use the "
+                     "transposition table.")
+    if args.WORKERS > PARALLEL_BATCH_SIZE:
+        parser.error("-w can not be larger than PARALLEL_BATCH_SIZE: The workers learn one batch of "
+                     "PARALLEL_BATCH_SIZE encounters at a time.")
+    ROOT_PARALLEL_WORKERS = args.ROOT_PARALLEL_WORKERS
+
     space_size_str = "{:e}".format(space_size)
     # Print useful information about the hyper-parameters.
     info_str = f'''
@@ -249,11 +739,25 @@ if __name__ == "__main__":
         *                                               
         *    # MCTS ITERATIONS = {MCTS_ITERATIONS} 
         *    MCTS CUT = {MCTS_CUT} 
+        *    ROLLOUTS PER SIMULATION = {ROLLOUTS_PER_SIMULATION}
+        *    ROLLOUT TURN HORIZON = {ROLLOUT_TURN_HORIZON}
         *    GAMMA = {GAMMA}                        
         *    EPISODE LENGTH = {EPISODE_LENGTH}      
         *    EXPLORATION FACTOR (C) = {UCB1_C}      
         *    TIME INCREMENT = {TIME_INCREMENT}     
+        *    MACRO STEPS = {TRAINING_MACRO_STEPS}
+        *    ADAPTIVE TIME STEP = {ADAPTIVE_TIME_STEP} (MAX STEPS = {ADAPTIVE_MAX_STEPS})
         *    TRAINING SET = {TRAINING_SET}          
+        *    WORKERS = {args.WORKERS}
+        *    ROOT PARALLEL WORKERS = {ROOT_PARALLEL_WORKERS}
+        *    LOCKSTEP ENCOUNTERS = {args.LOCKSTEP_ENCOUNTERS}
+        *    TRANSPOSITION TABLE SIZE = {TRANSPOSITION_TABLE_SIZE} (MIN VISITS = {TRANSPOSITION_MIN_VISITS})
+        *    MCTS NODE BUDGET = {MCTS_NODE_BUDGET}
+        *    SEED = {args.SEED}
+        *    CHECKPOINT EVERY = {CHECKPOINT_EVERY}
+        *    PARALLEL BATCH SIZE = {PARALLEL_BATCH_SIZE}
+        *    INITIAL MODEL = {args.INITIAL_MODEL}
+        *    REPLAY LOG = {args.REPLAY_LOG}
         *                                           
         *               DISCRETE BINS                
         *    ------------------------------------        
@@ -280,7 +784,7 @@ if __name__ == "__main__":
     '''
     print(info_str)
     # Train using the training examples.
-    runEncounters()
+    runEncounters(args.WORKERS, args.SEED, args.RESUME, args.INITIAL_MODEL, args.REPLAY_LOG, args.LOCKSTEP_ENCOUNTERS)
 
     # What percentage of the discrete state space did we cover?
     print("Final State Space Coverage (%) = ",
@@ -290,20 +794,17 @@ if __name__ == "__main__":
     Open a file, where you want to store the model.
     This file can be loaded and used with PPA_Test.py to evaluate the  performance of the model.
     """
-    model_str = f'model-{TRAINING_NUMBER}.pickle'
-    file = open(model_str, 'wb')
+    model_str = f'model-{TRAINING_NUMBER}.ppa'
 
-    # Dump all the learned model information to the file.
-    pickle.dump(Learned_Model, file)
+    # Dump all the learned model information to a columnar model file (refer to ModelFile.py).
+    saveModelFile(Learned_Model, model_str)
 
-    for model in Learned_Model:
-        print(model)
+    print("STATES MODELED: ", len(Learned_Model))
 
     # Save the training hyper-parameters corresponding to this training set for future reference.
     training_config_file_str = f'''Training_Parameters({model_str}).txt'''
     training_config_file = open(training_config_file_str, 'w+')
     training_config_file.write(info_str)
 
-    # Close the files
-    file.close()
+    # Close the file
     training_config_file.close()
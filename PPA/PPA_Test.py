@@ -8,13 +8,13 @@ encounter directory for later analysis.
 """
 from PPA.MCTS import *
 from PPA.StateActionQN import *
+from PPA.ModelStore import *
+from PPA.ModelIndex import *
 from PPA.Global_constants import *
 import pandas as pd
 import csv
-import pickle
 import argparse
 import numpy as np
-from numpy import linalg as LA
 
 # Test performance counters.
 failedTests = 0
@@ -22,6 +22,11 @@ passedTests = 0
 LODWCCount = 0
 UnknownStateCount = 0
 AbandonStateCount = 0
+# Number of steps that took the action of the closest modeled state (nearest neighbour fallback).
+NearestNeighbourSteps = 0
+
+# Spatial index of the model used by the nearest neighbour fallback (None: fallback disabled).
+Model_Index = None
 
 # Keep track of encounters and their results by categories
 SUCCESS_LIST = []       # Successful encounters.
@@ -30,11 +35,6 @@ UNKNOWNSTATE_LIST = []  # Encounters that resulted in an un-modeled state.
 ABANDONSTATE_LIST = []  # Encounters that resulted in an Abandon state.
 
 
-def states_delta(stateA, stateB):
-    """Compute the magnitud of the vector difference between to discrete states"""
-    return LA.norm(stateA-stateB)
-
-
 def constructPath(initial_state: State, encounter_path, encounter_index):
     """
     Try to construct a path using the knowledge of our model.
@@ -42,7 +42,7 @@ def constructPath(initial_state: State, encounter_path, encounter_index):
     :param encounter_path: Directory to store the trajectory csv file.
     :param encounter_index: Index of this encounter.
     """
-    global UnknownStateCount, AbandonStateCount, LODWCCount
+    global UnknownStateCount, AbandonStateCount, LODWCCount, NearestNeighbourSteps
 
     print("TRAJ FOR:", encounter_path)
 
@@ -52,60 +52,51 @@ def constructPath(initial_state: State, encounter_path, encounter_index):
     While a terminal state is not reached keep taking actions as suggested by our model.
     """
     while isTerminalState(current_state) == 0:
-        model_has_state = False
-
         current_local_state = convertAbsToLocal(current_state)
 
-        current_discrete_local_state = discretizeLocalState(current_local_state,
-                                                            distance_discretizer,
-                                                            angle_discretizer,
-                                                            speed_discretizer)
-        smallest_delta = float('inf')
-        closest_d_state = None
-
-        # Generate model object.
-        model_lookup = StateActionQN(current_discrete_local_state, '', 0)
-        try:
-            for d_state_list in Learned_Model.values():
-                for d_state in d_state_list:
-                    if d_state == model_lookup:  # same discrete local state
-                        action = d_state.getBestAction()
-                        # Log the action taken.
-                        print("TOOK ACTION: ", action)
-                        current_state = getNewState(
-                            current_state, action, TEST_TIME_INCREMENT)
-                        trajectory_states.append(current_state)
-                        model_has_state = True
-                        break
-                    else:  # Compute the states delta.
-                        delta = states_delta(d_state.discrete_state.as_numpy(
-                        ), current_discrete_local_state.as_numpy())
-                        if delta < smallest_delta:
-                            smallest_delta = delta
-                            closest_d_state = d_state
-                if model_has_state:
-                    break
-
-            if not model_has_state:
-                """ 
-                    The following commented block of code forces the agent
-                    to go straight if it doesn't have the current state modeled
-                """
-                # action = "NO_TURN"
-                # Log the action taken.
-                # print("TOOK ACTION: ", action)
-                #current_state = getNewState(current_state, action, TEST_TIME_INCREMENT)
-                # trajectory_states.append(current_state)
-
-                """Otherwise, just rise an error"""
-                raise KeyError
-        except KeyError:
+        current_discrete_state_code = discretizeLocalStateCode(current_local_state,
+                                                               distance_discretizer,
+                                                               angle_discretizer,
+                                                               speed_discretizer)
+
+        # Look up the discrete local state in the model.
+        d_state = Learned_Model.get(current_discrete_state_code)
+        if d_state is None and Model_Index is not None:
+            # Nearest neighbour fallback: Take the action of the closest modeled discrete state.
+            d_state, delta = Model_Index.nearest(current_discrete_state_code)
+            if d_state is not None:
+                print("CLOSEST STATE DELTA: ", delta)
+                NearestNeighbourSteps += 1
+
+        if d_state is None:
+            """ 
+                The following commented block of code forces the agent
+                to go straight if it doesn't have the current state modeled
+            """
+            # action = "NO_TURN"
+            # Log the action taken.
+            # print("TOOK ACTION: ", action)
+            #current_state = getNewState(current_state, action, TEST_TIME_INCREMENT)
+            # trajectory_states.append(current_state)
+
+            """Otherwise, the path couldn't be constructed"""
             print('STATE_NOT_MODELED')
             UNKNOWNSTATE_LIST.append(encounter_index)
             UnknownStateCount += 1
             writeTraj(encounter_path, trajectory_states)
             return -1   # Path couldn't be constructed missing states in model.
 
+        action = d_state.getBestAction()
+        # Log the action taken.
+        print("TOOK ACTION: ", action)
+        if ADAPTIVE_TIME_STEP:
+            macro_steps = adaptiveStepCount(current_state, TEST_TIME_INCREMENT)
+        else:
+            macro_steps = TEST_MACRO_STEPS
+        current_state = getNewMacroState(
+            current_state, action, TEST_TIME_INCREMENT, macro_steps)
+        trajectory_states.append(current_state)
+
     # What final state did we reach?
     """
         Possible final states return values: 
@@ -159,7 +150,7 @@ if __name__ == "__main__":
     ************************************************************************************************
                                             PPA TEST
     ENCOUNTER_DIR = Path to the set of Encounters to test the model on. (csv file).
-    MODEL_DIR =  Path to the model pickle file.
+    MODEL_DIR =  Path to the model file.
     RESULTS_DIR = Path to the directory to store results for each encounter.
     ************************************************************************************************
     """
@@ -170,6 +161,8 @@ if __name__ == "__main__":
                         dest="ENCOUNTER_DIR", default="")
     parser.add_argument('-md', action="store", dest="MODEL_DIR", default="")
     parser.add_argument('-rd', action="store", dest="RESULTS_DIR", default="")
+    parser.add_argument('-nn', action="store_true", dest="NEAREST_NEIGHBOUR",
+                        help="Take the action of the closest modeled state when a state is not modeled.")
     args = parser.parse_args()
 
     ENCOUNTER_DIR = args.ENCOUNTER_DIR
@@ -221,6 +214,9 @@ if __name__ == "__main__":
             Testing on  {NUMBER_OF_ENCOUNTERS} encounters
 
             TIME INCREMENT = {TEST_TIME_INCREMENT}
+            MACRO STEPS = {TEST_MACRO_STEPS}
+            ADAPTIVE TIME STEP = {ADAPTIVE_TIME_STEP} (MAX STEPS = {ADAPTIVE_MAX_STEPS})
+            NEAREST NEIGHBOUR FALLBACK = {args.NEAREST_NEIGHBOUR}
             TESTING SET = {ENCOUNTER_DIR}
 
                 DISCRETE BINS
@@ -245,13 +241,11 @@ if __name__ == "__main__":
     input("Press Enter to Run...")
 
     # Set of StateActionQN that represent the model.
-    Learned_Model = {}
-
-    with open(MODEL_DIR, 'rb') as f:
-        # Pickle the 'data' dictionary using the highest protocol available.
-        Learned_Model = pickle.load(f)
+    Learned_Model = loadModel(MODEL_DIR)
+    # Spatial index over the modeled states for the nearest neighbour fallback.
+    Model_Index = ModelIndex(Learned_Model) if args.NEAREST_NEIGHBOUR else None
 
-    #print("MODEL SIZE: ", len(Learned_Model.values()))
+    #print("MODEL SIZE: ", len(Learned_Model))
 
     for encounter_index in range(NUMBER_OF_ENCOUNTERS):
 
@@ -290,6 +284,8 @@ if __name__ == "__main__":
 
         ABANDON STATES = {AbandonStateCount}
         ABANDON STATES List = {ABANDONSTATE_LIST}
+
+        NEAREST NEIGHBOUR STEPS = {NearestNeighbourSteps}
     ************************************************************************************************
     """
     print(results_str)
@@ -0,0 +1,143 @@
+"""
+ReplayLog.py implements an on-disk log of the (state, action, reward) tuples generated by MCTS during training.
+
+addModelObjects() discretizes the tuples and then throws the continuous states away. With a replay log (run
+PPA_Learn with -l <replay log directory>) the tuples added to the model are also streamed to numbered .npz chunks
+of at most REPLAY_CHUNK_SIZE rows, one column per array:
+    ownship_pos, intruder_pos, ownship_vel, intruder_vel: (n,2) float64 arrays of the continuous states.
+    action: (n,) int8 action indices (refer to ACTION_INDEX).
+    reward: (n,) float64 rewards.
+A model can then be rebuilt from the log for any number of bins without running MCTS again; run:
+    python3 -m PPA.ReplayLog -l <replay log directory> -o <model.ppa> -db <distance bins> -ab <angle bins> -sb <speed bins>
+The rebuilt model is the model the logged tuples produce under the new discretization. MCTS itself is not
+replayed: Training with other bins could have tried different trajectories and stopped at different cuts.
+"""
+from PPA.LocalState import *
+from PPA.ModelFile import *
+import glob
+import time
+
+# Columns of every chunk.
+REPLAY_COLUMNS = ['ownship_pos', 'intruder_pos', 'ownship_vel', 'intruder_vel', 'action', 'reward']
+
+
+class ReplayLog:
+    """
+    Writer of the replay chunks of one training encounter: Chunks are named <name>-<chunk number>.npz.
+    Opening a log removes the chunks a previous run wrote with the same name (e.g. an encounter learned again
+    after resuming a training run).
+    """
+
+    def __init__(self, directory, name, chunk_size=REPLAY_CHUNK_SIZE):
+        self.directory = directory
+        self.name = name
+        self.chunk_size = chunk_size
+        # Number of chunks written.
+        self.chunks = 0
+        # Rows not written yet: One list of arrays per column.
+        self.buffer = {column: [] for column in REPLAY_COLUMNS}
+        self.buffered_rows = 0
+
+        os.makedirs(directory, exist_ok=True)
+        for chunk_path in glob.glob(os.path.join(directory, f'{name}-*.npz')):
+            os.remove(chunk_path)
+
+    def extend(self, states: StateBatch, actions, rewards):
+        """
+        Add a batch of (state, action, reward) tuples to the log.
+        :param states: The continuous states.
+        :param actions: (n,) array of action indices (refer to ACTION_INDEX).
+        :param rewards: (n,) array of rewards.
+        """
+        rows = {'ownship_pos': states.ownship_pos, 'intruder_pos': states.intruder_pos,
+                'ownship_vel': states.ownship_vel, 'intruder_vel': states.intruder_vel,
+                'action': np.asarray(actions, dtype=np.int8), 'reward': np.asarray(rewards, dtype=np.float64)}
+        start = 0
+        while start < len(rows['reward']):
+            # Fill the current chunk.
+            stop = start + self.chunk_size - self.buffered_rows
+            for column in REPLAY_COLUMNS:
+                self.buffer[column].append(rows[column][start:stop])
+            self.buffered_rows += len(rows['reward'][start:stop])
+            start = stop
+
+            if self.buffered_rows == self.chunk_size:
+                self.flush()
+
+    def flush(self):
+        """
+        Write the buffered rows to a new chunk.
+        """
+        if self.buffered_rows == 0:
+            return
+
+        columns = {column: np.concatenate(arrays) for column, arrays in self.buffer.items()}
+
+        # Write to a temporary file and rename it: A crash never leaves a partial chunk.
+        chunk_path = os.path.join(self.directory, f'{self.name}-{self.chunks:06d}.npz')
+        with open(chunk_path + '.tmp', 'wb') as f:
+            np.savez(f, **columns)
+        os.replace(chunk_path + '.tmp', chunk_path)
+
+        self.chunks += 1
+        self.buffer = {column: [] for column in REPLAY_COLUMNS}
+        self.buffered_rows = 0
+
+    def close(self):
+        self.flush()
+
+
+def readReplayLog(directory):
+    """
+    Load all the chunks of a replay log.
+    :return: Dictionary column name -> array with the rows of all the chunks (refer to REPLAY_COLUMNS).
+    """
+    chunk_paths = sorted(glob.glob(os.path.join(directory, '*.npz')))
+    columns = {column: [] for column in REPLAY_COLUMNS}
+    for chunk_path in chunk_paths:
+        with np.load(chunk_path) as chunk:
+            for column in REPLAY_COLUMNS:
+                columns[column].append(chunk[column])
+
+    if not chunk_paths:
+        return {column: np.zeros((0, 2)) if column.endswith(('pos', 'vel')) else np.zeros(0)
+                for column in REPLAY_COLUMNS}
+    return {column: np.concatenate(arrays) for column, arrays in columns.items()}
+
+
+def rebuildModel(directory, distance_bins=DISTANCE_BINS, angle_bins=ANGLE_BINS, speed_bins=SPEED_BINS):
+    """
+    Rebuild a model from a replay log under any discretization in one vectorized pass.
+    :return: Tuple (sorted codes, (n,3) Q values, (n,3) N counts): Refer to groupedMeans().
+    """
+    log = readReplayLog(directory)
+    discretizers = setUpdiscretizers(distance_bins, angle_bins, speed_bins)[:3]
+
+    features = convertAbsToLocalBatch(log['ownship_pos'], log['intruder_pos'],
+                                      log['ownship_vel'], log['intruder_vel'])
+    codes = discretizeFeatureCodes(features, *discretizers)
+    return groupedMeans(codes, log['action'], log['reward'])
+
+
+"""
+Main method: Rebuild a model from a replay log.
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Rebuild a model from a replay log with any number of bins.")
+    parser.add_argument('-l', action="store", dest="REPLAY_LOG", required=True)
+    parser.add_argument('-o', action="store", dest="OUTPUT_MODEL", required=True)
+    parser.add_argument('-db', action="store", dest="DISTANCE_BINS", type=int, default=DISTANCE_BINS)
+    parser.add_argument('-ab', action="store", dest="ANGLE_BINS", type=int, default=ANGLE_BINS)
+    parser.add_argument('-sb', action="store", dest="SPEED_BINS", type=int, default=SPEED_BINS)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    codes, Q, N = rebuildModel(args.REPLAY_LOG, args.DISTANCE_BINS, args.ANGLE_BINS, args.SPEED_BINS)
+    saveModelArrays(codes, Q, N, args.OUTPUT_MODEL,
+                    settings=discretizationSettings(args.DISTANCE_BINS, args.ANGLE_BINS, args.SPEED_BINS))
+
+    print("REPLAYED TUPLES: ", int(N.sum()))
+    print("STATES MODELED: ", len(codes))
+    print(f"REBUILT IN {time.perf_counter() - start:.2f} s")
+    print("Set DISTANCE_BINS, ANGLE_BINS and SPEED_BINS in Global_constants.py to these values to test the model.")
@@ -1,10 +1,35 @@
 from PPA.Global_constants import *
+import functools
 import math
 import numpy as np
 from numpy import linalg as LA
 import pandas as pd
 
 
+# Index of every action: Same order as the actions of a StateActionQN object (LEFT, NO_TURN, RIGHT).
+ACTION_NAMES = ['LEFT', 'NO_TURN', 'RIGHT']
+ACTION_INDEX = {'LEFT': 0, 'NO_TURN': 1, 'RIGHT': 2}
+
+# Degrees the ownship velocity rotates on every turn action.
+TURN_ANGLE = 5
+COS_TURN = math.cos(math.radians(TURN_ANGLE))
+SIN_TURN = math.sin(math.radians(TURN_ANGLE))
+
+# Counter-clock wise rotation of the ownship velocity.
+LEFT_ROTATION = np.array([
+    [COS_TURN, -SIN_TURN],
+    [SIN_TURN,  COS_TURN]
+])
+# Clock-wise rotation of the ownship velocity.
+RIGHT_ROTATION = np.array([
+    [COS_TURN, SIN_TURN],
+    [-SIN_TURN, COS_TURN]
+])
+
+# Rotation of the ownship velocity for every action, indexed by action index: (3,2,2).
+ACTION_ROTATIONS = np.array([LEFT_ROTATION, np.identity(2), RIGHT_ROTATION])
+
+
 class State:
     # Defines a state object type.
     def __init__(self, ownship_pos, intruder_pos, ownship_vel, intruder_vel):
@@ -16,6 +41,8 @@ class State:
         self.intruder_pos = intruder_pos    # [x,y] (ft)
         self.ownship_vel = ownship_vel      # [v_x,v_y] (ft/sec)
         self.intruder_vel = intruder_vel    # [v_x,v_y] (ft/sec)
+        # Terminal code of this state, computed once by isTerminalState().
+        self.terminal = None
 
     # Distance between the aircraft in ft.
     def get_distance(self):
@@ -31,6 +58,39 @@ class State:
         """
 
 
+class StateBatch:
+    """
+    A set of N states stored as a struct-of-arrays: Every feature is a (N,2) numpy array
+    where row i holds the feature of state i.
+    """
+
+    def __init__(self, ownship_pos, intruder_pos, ownship_vel, intruder_vel):
+        self.ownship_pos = ownship_pos      # (N,2) [x,y] (ft)
+        self.intruder_pos = intruder_pos    # (N,2) [x,y] (ft)
+        self.ownship_vel = ownship_vel      # (N,2) [v_x,v_y] (ft/sec)
+        self.intruder_vel = intruder_vel    # (N,2) [v_x,v_y] (ft/sec)
+
+    @staticmethod
+    def fromStates(states):
+        """
+        Generate a StateBatch from a list of State objects.
+        """
+        return StateBatch(np.array([state.ownship_pos for state in states], dtype=np.float64),
+                          np.array([state.intruder_pos for state in states], dtype=np.float64),
+                          np.array([state.ownship_vel for state in states], dtype=np.float64),
+                          np.array([state.intruder_vel for state in states], dtype=np.float64))
+
+    def state(self, i):
+        """
+        Return state i as a State object.
+        """
+        return State(self.ownship_pos[i].copy(), self.intruder_pos[i].copy(),
+                     self.ownship_vel[i].copy(), self.intruder_vel[i].copy())
+
+    def __len__(self):
+        return len(self.ownship_pos)
+
+
 def getInitStateFromEncounter(encounter_directory, encounter_index):
     """
     Load the desc.csv file that contains the details about an encounter and get the initial state.
@@ -199,27 +259,13 @@ def getNewState(state: State, action, TIME):
     if action is 'NO_TURN':
         new_vel_own = ownship_vel   # [v_x,v_y] (ft/sec).
 
-    else:
+    elif action is 'LEFT':
+        # Perform Counter-clock wise rotation.
+        new_vel_own = LEFT_ROTATION@ownship_vel
 
-        theta = 5   # degrees.
-        cos_theta = math.cos(math.radians(theta))
-        sin_theta = math.sin(math.radians(theta))
-
-        if action is 'LEFT':
-            # Perform Counter-clock wise rotation.
-            rotation_matrix = np.array([
-                [cos_theta, -sin_theta],
-                [sin_theta,  cos_theta]
-            ])
-            new_vel_own = rotation_matrix@ownship_vel
-
-        elif action is 'RIGHT':
-            # Perform clock-wise rotation.
-            rotation_matrix = np.array([
-                [cos_theta, sin_theta],
-                [-sin_theta, cos_theta]
-            ])
-            new_vel_own = rotation_matrix@ownship_vel
+    elif action is 'RIGHT':
+        # Perform clock-wise rotation.
+        new_vel_own = RIGHT_ROTATION@ownship_vel
 
     # Position:
     # For Ownship:
@@ -235,3 +281,64 @@ def getNewState(state: State, action, TIME):
     # New state after the action.
     new_state = State(new_own_pos, new_intr_pos, new_vel_own, new_vel_intr)
     return new_state
+
+
+def getNewStates(states: StateBatch, actions, TIME):
+    """
+        Vectorized getNewState(): Returns a StateBatch with the
+        new states after every state in states takes its action.
+        actions: (N,) array of action indices (refer to ACTION_INDEX)
+        or a single action index/name taken by all the states.
+        TIME: How long should an action go for.
+    """
+    if isinstance(actions, str):
+        actions = ACTION_INDEX[actions]
+
+    # Rotate the ownship velocities: LEFT (counter-clock wise), NO_TURN (identity), RIGHT (clock-wise).
+    ownship_vel = states.ownship_vel
+    new_vel_own = np.matmul(ACTION_ROTATIONS[actions], ownship_vel[..., np.newaxis])[..., 0]
+
+    # Position:
+    # For Ownship:
+    new_own_pos = states.ownship_pos + 0.5 * (new_vel_own + ownship_vel) * TIME
+
+    # For Intruder: Intruder flights at a constant velocity.
+    intr_vel = states.intruder_vel
+    new_intr_pos = states.intruder_pos + 0.5 * (intr_vel + intr_vel) * TIME
+
+    return StateBatch(new_own_pos, new_intr_pos, new_vel_own, intr_vel)
+
+
+@functools.lru_cache(maxsize=None)
+def macroStepMatrices(steps, TIME):
+    """
+        Closed form of repeating every action steps times (constant turn rate):
+        After j steps of an action with rotation R the ownship velocity is R^j v
+        and the ownship position is p + M_j v with M_j = TIME/2 (I + R) (I + R + ... + R^(j-1)).
+        Returns a tuple ((3,steps,2,2) array of R^j, (3,steps,2,2) array of M_j)
+        for j = 1..steps, indexed by action index (refer to ACTION_INDEX).
+        The arrays are cached: Do not modify them.
+    """
+    rotations = np.zeros((3, steps, 2, 2))
+    displacements = np.zeros((3, steps, 2, 2))
+    for action, rotation in enumerate(ACTION_ROTATIONS):
+        power = np.identity(2)      # R^(j-1)
+        power_sum = np.zeros((2, 2))    # I + R + ... + R^(j-1)
+        for j in range(steps):
+            power_sum = power_sum + power
+            power = rotation@power
+            rotations[action, j] = power
+            displacements[action, j] = 0.5 * TIME * (np.identity(2) + rotation)@power_sum
+    return rotations, displacements
+
+
+@functools.lru_cache(maxsize=None)
+def macroStepCoefficients(steps, TIME):
+    """
+        macroStepMatrices() as lists of floats for scalar code: For every action index
+        a list of steps tuples (R^j flattened, M_j flattened), j = 1..steps.
+    """
+    rotations, displacements = macroStepMatrices(steps, TIME)
+    return [list(zip(map(tuple, rotations[action].reshape(steps, 4).tolist()),
+                     map(tuple, displacements[action].reshape(steps, 4).tolist())))
+            for action in range(3)]
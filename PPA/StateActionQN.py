@@ -13,9 +13,12 @@ class StateActionQN:
     during testing with PPA_Test.py
     """
 
-    def __init__(self, d_state: DiscreteLocalState, action, Q):
-        # Discrete State to be modeled by this object.
-        self.discrete_state = d_state
+    def __init__(self, d_state, action, Q):
+        # Discrete State to be modeled by this object packed into an integer code.
+        # d_state can be given as a DiscreteLocalState or as its code (refer to DiscreteLocalState.code()).
+        if isinstance(d_state, DiscreteLocalState):
+            d_state = d_state.code()
+        self.state_code = d_state
         # The expected reward for taking a left turn.
         self.LEFT_Q = 0
         # The expected reward for going straight turn.
@@ -31,6 +34,13 @@ class StateActionQN:
         # Initial call to update the Q value of an action.
         self.update(action, Q)
 
+    @property
+    def discrete_state(self):
+        """
+        The discrete state modeled by this object.
+        """
+        return DiscreteLocalState.fromCode(self.state_code)
+
     def getBestAction(self):
         """
         Returns the action with the highest expected reward.
@@ -95,6 +105,23 @@ class StateActionQN:
             # Update number of visits to this action.
             self.NO_TURN_N += 1
 
+    def merge(self, other):
+        """
+            Combine the knowledge of another StateActionQN object of the same
+            discrete state into this one: The Q value of every action is the
+            average of both Q values weighted by their N counts.
+        """
+        for action in ['LEFT', 'NO_TURN', 'RIGHT']:
+            N = getattr(self, action + '_N')
+            other_N = getattr(other, action + '_N')
+            if other_N == 0:
+                continue
+
+            Q = getattr(self, action + '_Q')
+            other_Q = getattr(other, action + '_Q')
+            setattr(self, action + '_Q', (Q * N + other_Q * other_N) / (N + other_N))
+            setattr(self, action + '_N', N + other_N)
+
     def __str__(self):
         return f'''
             [discrete_state = {self.discrete_state}]
@@ -103,8 +130,17 @@ class StateActionQN:
             NO_TURN_Q = {"{:e}".format(self.NO_TURN_Q)}
         '''
 
+    def __setstate__(self, state):
+        """
+        Unpickle a StateActionQN object. Objects pickled before discrete states were packed into
+        integer codes hold a DiscreteLocalState object: Pack it.
+        """
+        if 'discrete_state' in state:
+            state['state_code'] = state.pop('discrete_state').code()
+        self.__dict__.update(state)
+
     def __hash__(self):
-        return hash(self.discrete_state)
+        return hash(self.state_code)
 
     def __eq__(self, obj):
-        return isinstance(obj, StateActionQN) and obj.discrete_state == self.discrete_state
+        return isinstance(obj, StateActionQN) and obj.state_code == self.state_code
@@ -0,0 +1,102 @@
+"""
+TranspositionTable.py implements a table of rollout values shared by the MCTS nodes that discretize to the same
+discrete local state.
+
+Many nodes of a tree discretize to the same DiscreteLocalState and every one of them runs its own rollouts. The
+transposition table keeps the sum and the number of the rollout values recorded for every discrete state code. A
+new node whose discrete state already has at least TRANSPOSITION_MIN_VISITS values takes their mean as its
+simulation value instead of running a rollout. The table keeps at most TRANSPOSITION_TABLE_SIZE discrete states:
+The least recently used one is evicted when it is full. Set TRANSPOSITION_TABLE_SIZE in Global_constants.py to
+train with it: PPA_Learn gives every encounter a new table, so an encounter never reuses values that depend on the
+encounters learned before it.
+"""
+
+from PPA.MCTS import *
+from PPA.Discretizers import *
+from collections import OrderedDict
+
+
+class TranspositionTable:
+    """
+    LRU table discrete state code -> [sum of rollout values, number of rollout values].
+    max_size = None keeps every discrete state.
+    """
+
+    def __init__(self, max_size=TRANSPOSITION_TABLE_SIZE, min_visits=TRANSPOSITION_MIN_VISITS):
+        self.max_size = max_size
+        self.min_visits = min_visits
+        self.entries = OrderedDict()
+        self.distance_discretizer, self.angle_discretizer, self.speed_discretizer, _ = setUpdiscretizers()
+
+        # Hit-rate counters.
+        self.lookups = 0
+        self.hits = 0
+        # Simulations answered by the table without a rollout.
+        self.skipped_rollouts = 0
+        self.evictions = 0
+
+    def key(self, state: State):
+        """
+        The key of a state in the table: The code of its discrete local state.
+        """
+        return discretizeLocalStateCode(convertAbsToLocal(state), self.distance_discretizer,
+                                        self.angle_discretizer, self.speed_discretizer)
+
+    def lookup(self, state_code):
+        """
+        Return the [sum, count] entry of a discrete state or None if it is not in the table.
+        """
+        self.lookups += 1
+        entry = self.entries.get(state_code)
+        if entry is not None:
+            self.hits += 1
+            self.entries.move_to_end(state_code)
+        return entry
+
+    def record(self, state_code, value):
+        """
+        Add a rollout value to the entry of a discrete state, evicting the least recently used entry if the table
+        is full.
+        """
+        entry = self.entries.get(state_code)
+        if entry is None:
+            if self.max_size is not None and len(self.entries) >= self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+            self.entries[state_code] = [value, 1]
+        else:
+            entry[0] += value
+            entry[1] += 1
+            self.entries.move_to_end(state_code)
+
+    def simulationValue(self, state: State):
+        """
+        Simulation value of a new node: The mean of the rollout values of its discrete state if the table has at
+        least min_visits of them, otherwise the value of new rollouts (refer to simulationValue()), which is
+        recorded in the table.
+        """
+        state_code = self.key(state)
+        entry = self.lookup(state_code)
+        if entry is not None and entry[1] >= self.min_visits:
+            self.skipped_rollouts += 1
+            return entry[0] / entry[1]
+
+        value = simulationValue(state)
+        self.record(state_code, value)
+        return value
+
+    def report(self):
+        """
+        Usage of the table.
+        :return: dictionary with the number of discrete states, the hit rate, the rollouts skipped and the evictions.
+        """
+        return {
+            'states': len(self.entries),
+            'lookups': self.lookups,
+            'hit_rate': self.hits / self.lookups if self.lookups else 0.0,
+            'skipped_rollouts': self.skipped_rollouts,
+            'evictions': self.evictions,
+        }
+
+    def __len__(self):
+        return len(self.entries)
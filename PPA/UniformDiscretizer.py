@@ -0,0 +1,64 @@
+"""
+UniformDiscretizer.py implements a discretizer with uniform bins that computes bin indices arithmetically.
+
+It places values in the same bins as sklearn's KBinsDiscretizer(encode='ordinal', strategy='uniform') fitted
+on the range [min_value, max_value]: Bin edges are np.linspace(min_value, max_value, n_bins + 1), a value
+equal to an inner edge belongs to the upper bin and values outside the range are clipped to the first/last bin.
+"""
+import math
+import numpy as np
+
+
+class UniformDiscretizer:
+    """
+    Discretize values into n_bins uniform bins over [min_value, max_value].
+    """
+
+    def __init__(self, min_value, max_value, n_bins):
+        self.min_value = float(min_value)
+        self.max_value = float(max_value)
+        self.n_bins = int(n_bins)
+        # Width of every bin.
+        self.width = (self.max_value - self.min_value) / self.n_bins
+        # Bin edges: Same edges KBinsDiscretizer computes for the uniform strategy.
+        self.bin_edges = np.linspace(self.min_value, self.max_value, self.n_bins + 1)
+        # Python floats of the edges for the single value path.
+        self.bin_edges_list = self.bin_edges.tolist()
+
+    def bin(self, value):
+        """
+        Return the bin of a single value.
+        """
+        b = math.floor((value - self.min_value) / self.width)
+        # Clip values outside the range to the first/last bin.
+        if b < 0:
+            b = 0
+        elif b > self.n_bins - 1:
+            b = self.n_bins - 1
+        # The arithmetic bin can be off by one next to an edge due to rounding: Compare with the exact edges.
+        if b > 0 and value < self.bin_edges_list[b]:
+            b -= 1
+        elif b < self.n_bins - 1 and value >= self.bin_edges_list[b + 1]:
+            b += 1
+        return float(b)
+
+    def bins(self, values):
+        """
+        Return the bins of an array of values.
+        :param values: np.array of any shape.
+        :return: np.array of float64 bins with the shape of values.
+        """
+        values = np.asarray(values, dtype=np.float64)
+        b = np.floor((values - self.min_value) / self.width)
+        # Clip values outside the range to the first/last bin.
+        b = np.clip(b, 0, self.n_bins - 1).astype(np.intp)
+        # The arithmetic bin can be off by one next to an edge due to rounding: Compare with the exact edges.
+        b -= (b > 0) & (values < self.bin_edges[b])
+        b += (b < self.n_bins - 1) & (values >= self.bin_edges[np.minimum(b + 1, self.n_bins)])
+        return b.astype(np.float64)
+
+    def transform(self, X):
+        """
+        Drop-in replacement of KBinsDiscretizer.transform(): Discretize a (n_samples, n_features) array.
+        """
+        return self.bins(X)
@@ -0,0 +1,822 @@
+"""
+Micro-benchmarks for the hot paths of training and testing.
+run: python3 -m PPA.benchmarks -b <benchmark name> (or make benchmark to run all of them).
+"""
+from PPA.ModelStore import *
+from PPA.ModelFile import *
+from PPA.MCTSArena import *
+import argparse
+import gc
+import os
+import pickle
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+
+
+def randomDiscreteStates(count, rng):
+    """
+    Generate count random discrete states with bins in the range of the discretizers.
+    """
+    distance_bins = rng.integers(0, DISTANCE_BINS, size=(count, 2)).astype(np.float64)
+    angle_bins = rng.integers(0, ANGLE_BINS, size=(count, 3)).astype(np.float64)
+    speed_bins = rng.integers(0, SPEED_BINS, size=(count, 2)).astype(np.float64)
+
+    return [DiscreteLocalState(d[0], d[1], a[0], a[1], a[2], s[0], s[1])
+            for d, a, s in zip(distance_bins, angle_bins, speed_bins)]
+
+
+def randomStateCodes(count, rng):
+    """
+    Generate the codes of count random discrete states.
+    """
+    return rng.integers(0, np.prod(STATE_RADICES), size=count).tolist()
+
+
+def benchmarkModelStore(max_size=10**6, window=10000):
+    """
+    Grow a ModelStore up to max_size states and report the cost per insert at every power of 10.
+    The cost per insert of the old hash chain model is reported for the smaller sizes for comparison.
+    """
+    rng = np.random.default_rng(0)
+    actions = ['LEFT', 'NO_TURN', 'RIGHT']
+
+    print("MODEL STORE: PER-INSERT COST")
+    model_store = ModelStore()
+    size = 10**3
+    while size <= max_size:
+        # Grow the model up to size states.
+        for d_state in randomStateCodes(max(0, size - len(model_store)), rng):
+            model_store.update(d_state, 'LEFT', -0.1)
+
+        # Time a window of inserts (new states) and updates (modeled states) at this model size.
+        model_store_size = len(model_store)
+        new_states = randomStateCodes(window, rng)
+        start = time.perf_counter()
+        for i, d_state in enumerate(new_states):
+            model_store.update(d_state, actions[i % 3], -0.1)
+        elapsed = time.perf_counter() - start
+
+        print(f"    {model_store_size:>12,} states: {elapsed / window * 1e6:.3f} us/insert")
+        size *= 10
+
+    print("LEGACY HASH CHAIN MODEL: PER-INSERT COST")
+    for size in [10**3, 10**4]:
+        chain = [StateActionQN(d_state, 'LEFT', -0.1) for d_state in randomDiscreteStates(size, rng)]
+        chain_size = len(chain)
+        new_states = randomDiscreteStates(100, rng)
+        start = time.perf_counter()
+        for d_state in new_states:
+            stateActionQN = StateActionQN(d_state, 'LEFT', -0.1)
+            for d_state_model in chain:
+                if d_state_model == stateActionQN:
+                    break
+            chain.append(stateActionQN)
+        elapsed = time.perf_counter() - start
+
+        print(f"    {chain_size:>12,} states: {elapsed / len(new_states) * 1e6:.3f} us/insert")
+
+
+def benchmarkStateKeys(count=10**5):
+    """
+    Compare memory per modeled state, hashing and equality of DiscreteLocalState objects and their integer codes.
+    """
+    rng = np.random.default_rng(0)
+
+    print("DISCRETE STATE KEYS: DiscreteLocalState vs int code")
+    tracemalloc.start()
+    d_states = randomDiscreteStates(count, rng)
+    d_states_bytes = tracemalloc.get_traced_memory()[0]
+    codes = [d_state.code() for d_state in d_states]
+    codes_bytes = tracemalloc.get_traced_memory()[0] - d_states_bytes
+    tracemalloc.stop()
+    print(f"    memory per state: {d_states_bytes / count:.1f} bytes (object) vs {codes_bytes / count:.1f} bytes (code)")
+
+    for name, keys in [('object', d_states), ('code', codes)]:
+        start = time.perf_counter()
+        for key in keys:
+            hash(key)
+        hash_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for key_a, key_b in zip(keys, keys[1:]):
+            key_a == key_b
+        eq_time = time.perf_counter() - start
+
+        print(f"    {name}: hash {hash_time / count * 1e9:.1f} ns, eq {eq_time / count * 1e9:.1f} ns")
+
+
+def sklearnDiscretizers():
+    """
+    The KBinsDiscretizer objects setUpdiscretizers() used to generate, for comparison purposes.
+    """
+    from sklearn.preprocessing import KBinsDiscretizer
+
+    discretizers = []
+    for min_value, max_value, n_bins in [(MIN_DISTANCE, MAX_DISTANCE, DISTANCE_BINS),
+                                         (MIN_ANGLE, MAX_ANGLE, ANGLE_BINS),
+                                         (MIN_SPEED, MAX_SPEED, SPEED_BINS)]:
+        discretizer = KBinsDiscretizer(n_bins=n_bins, encode='ordinal', strategy='uniform')
+        discretizer.fit(np.array([[x for x in range(min_value, max_value + 1)]]).T)
+        discretizers.append(discretizer)
+
+    return discretizers
+
+
+def sklearnDiscretizeLocalState(local_state, distance_discretizer, angle_discretizer, speed_discretizer):
+    """
+    Bins of a local state (in the order of DiscreteLocalState.as_numpy()) as computed with KBinsDiscretizer.
+    """
+    distance_bins = distance_discretizer.transform(
+        np.array([[local_state.distance_ownship_destination, local_state.distance_int_own]]).T)
+    angle_bins = angle_discretizer.transform(
+        np.array([[local_state.theta_destintation_ownship, local_state.theta_int_own_track,
+                   local_state.angle_rel_vel_neg_rel_pos]]).T)
+    speed_bins = speed_discretizer.transform(
+        np.array([[local_state.ownship_vel, local_state.intruder_vel]]).T)
+
+    return np.array([distance_bins[0][0], angle_bins[0][0], speed_bins[0][0], speed_bins[1][0],
+                     distance_bins[1][0], angle_bins[1][0], angle_bins[2][0]])
+
+
+def randomLocalStateFeatures(count, rng):
+    """
+    Generate a (count,7) array of local state features in the order of LocalState.as_numpy().
+    Values cover the range of every discretizer, the exact bin edges and values out of range.
+    """
+    low = np.array([MIN_DISTANCE, MIN_ANGLE, MIN_SPEED, MIN_SPEED, MIN_DISTANCE, MIN_ANGLE, MIN_ANGLE])
+    high = np.array([MAX_DISTANCE, MAX_ANGLE, MAX_SPEED, MAX_SPEED, MAX_DISTANCE, MAX_ANGLE, MAX_ANGLE])
+    n_bins = stateRadices()
+
+    span = high - low
+    features = rng.uniform(low - 0.1 * span, high + 0.1 * span, size=(count, 7))
+    # Place a third of the values exactly on bin edges.
+    on_edge = rng.random(size=(count, 7)) < 0.33
+    edges = low + span * (rng.integers(0, n_bins + 1, size=(count, 7)) / n_bins)
+    features[on_edge] = edges[on_edge]
+
+    return features
+
+
+def benchmarkDiscretizer(count=20000):
+    """
+    Compare discretizing local states with UniformDiscretizer against sklearn's KBinsDiscretizer.
+    The bins of both methods must be identical.
+    """
+    rng = np.random.default_rng(0)
+    features = randomLocalStateFeatures(count, rng)
+    local_states = [LocalState(f[0], f[1], f[2], f[4], f[5], f[6], f[3]) for f in features]
+
+    sklearn_discretizers = sklearnDiscretizers()
+    distance_discretizer, angle_discretizer, speed_discretizer, _ = setUpdiscretizers()
+
+    print("DISCRETIZER: KBinsDiscretizer vs UniformDiscretizer")
+    start = time.perf_counter()
+    sklearn_bins = np.array([sklearnDiscretizeLocalState(local_state, *sklearn_discretizers)
+                             for local_state in local_states])
+    sklearn_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    uniform_bins = np.array([discretizeLocalState(local_state, distance_discretizer, angle_discretizer,
+                                                  speed_discretizer).as_numpy()
+                             for local_state in local_states])
+    uniform_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batch_bins = discretizeFeatures(features, distance_discretizer, angle_discretizer, speed_discretizer)
+    batch_time = time.perf_counter() - start
+
+    assert np.array_equal(sklearn_bins, uniform_bins), 'UniformDiscretizer bins differ from KBinsDiscretizer.'
+    assert np.array_equal(sklearn_bins, batch_bins), 'Batch bins differ from KBinsDiscretizer.'
+
+    print(f"    KBinsDiscretizer: {sklearn_time / count * 1e6:.2f} us/state")
+    print(f"    UniformDiscretizer: {uniform_time / count * 1e6:.2f} us/state "
+          f"({sklearn_time / uniform_time:.0f}x)")
+    print(f"    UniformDiscretizer (N,7) batch: {batch_time / count * 1e6:.3f} us/state "
+          f"({sklearn_time / batch_time:.0f}x)")
+    print(f"    bins identical for {count} states")
+
+
+def benchmarkPropagation(count=10000):
+    """
+    Compare stepping count states one at a time with getNewState() against one getNewStates() call.
+    """
+    rng = np.random.default_rng(0)
+    states = [State(rng.normal(0, 1e4, 2), rng.normal(0, 1e4, 2), rng.normal(0, 200, 2), rng.normal(0, 200, 2))
+              for _ in range(count)]
+    actions = rng.integers(0, 3, count)
+
+    print("STATE PROPAGATION: getNewState vs getNewStates")
+    start = time.perf_counter()
+    for state, action in zip(states, actions):
+        getNewState(state, ACTION_NAMES[action], TIME_INCREMENT)
+    scalar_time = time.perf_counter() - start
+
+    state_batch = StateBatch.fromStates(states)
+    start = time.perf_counter()
+    getNewStates(state_batch, actions, TIME_INCREMENT)
+    batch_time = time.perf_counter() - start
+
+    print(f"    getNewState: {scalar_time / count * 1e6:.2f} us/state")
+    print(f"    getNewStates: {batch_time / count * 1e6:.3f} us/state ({scalar_time / batch_time:.0f}x)")
+
+
+def benchmarkLocalState(count=10000):
+    """
+    Compare converting count states one at a time with convertAbsToLocal() against convertAbsToLocalBatch().
+    """
+    rng = np.random.default_rng(0)
+    states = [State(rng.normal(0, 1e4, 2), rng.normal(0, 1e4, 2), rng.normal(0, 200, 2), rng.normal(0, 200, 2))
+              for _ in range(count)]
+
+    print("LOCAL STATE CONVERSION: convertAbsToLocal vs convertAbsToLocalBatch")
+    start = time.perf_counter()
+    features = np.array([convertAbsToLocal(state).as_numpy() for state in states])
+    scalar_time = time.perf_counter() - start
+
+    state_batch = StateBatch.fromStates(states)
+    start = time.perf_counter()
+    batch_features = convertAbsToLocalBatch(state_batch.ownship_pos, state_batch.intruder_pos,
+                                            state_batch.ownship_vel, state_batch.intruder_vel)
+    batch_time = time.perf_counter() - start
+
+    print(f"    convertAbsToLocal: {scalar_time / count * 1e6:.2f} us/state")
+    print(f"    convertAbsToLocalBatch: {batch_time / count * 1e6:.3f} us/state ({scalar_time / batch_time:.0f}x)")
+    print(f"    max feature difference: {np.abs(features - batch_features).max():.3e}")
+
+
+def benchmarkTerminalCheck(count=10000):
+    """
+    Compare a rollout step with a full local state conversion for the terminal check against stepState().
+    """
+    rng = np.random.default_rng(0)
+    states = [State(rng.normal(0, 1e4, 2), rng.normal(0, 1e4, 2), rng.normal(0, 200, 2), rng.normal(0, 200, 2))
+              for _ in range(count)]
+
+    print("ROLLOUT STEP: getNewState + convertAbsToLocal vs stepState")
+    start = time.perf_counter()
+    for state in states:
+        local_state = convertAbsToLocal(getNewState(state, 'LEFT', TIME_INCREMENT))
+        if local_state.distance_ownship_destination <= DESTINATION_DIST_ERROR:
+            continue
+        if local_state.distance_ownship_destination > ABANDON_STATE_ERROR:
+            continue
+        if local_state.distance_int_own < DWC_DIST:
+            continue
+    local_state_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for state in states:
+        stepState(state, 'LEFT', TIME_INCREMENT)
+    fused_time = time.perf_counter() - start
+
+    print(f"    getNewState + convertAbsToLocal: {local_state_time / count * 1e6:.2f} us/step")
+    print(f"    stepState: {fused_time / count * 1e6:.2f} us/step ({local_state_time / fused_time:.1f}x)")
+
+
+def benchmarkEncounterState():
+    """
+    Initial state of the first encounter of Test_Encounter_Geometries.csv used to benchmark MCTS.
+    """
+    encounter_properties = {0: 90, 1: 30, 2: False, 3: 2000, 4: 100, 5: 10, 6: 0}
+    return computeInitialState(encounter_properties)
+
+
+def benchmarkMCTSTree(iterations=5000):
+    """
+    Compare time and memory of MCTS iterations with MCST (one object per node) and ArenaMCST (arrays).
+    """
+    print(f"MCTS TREE: MCST vs ArenaMCST ({iterations} iterations)")
+    for tree_type in [MCST, ArenaMCST]:
+        random.seed(0)
+        tracemalloc.start()
+        start = time.perf_counter()
+        mcts = tree_type(benchmarkEncounterState())
+        selection_time = 0
+        for i in range(iterations):
+            selection_start = time.perf_counter()
+            selected_state = mcts.selection()
+            selection_time += time.perf_counter() - selection_start
+            mcts.expansion(selected_state)
+            mcts.simulate()
+        elapsed = time.perf_counter() - start
+        tree_bytes = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+
+        print(f"    {tree_type.__name__}: {iterations / elapsed:.0f} iterations/sec, "
+              f"selection {selection_time / iterations * 1e6:.2f} us/iteration, "
+              f"{tree_bytes / (iterations + 1):.0f} bytes/node")
+        if tree_type is ArenaMCST:
+            print(f"    ArenaMCST memory report: {mcts.memoryReport()}")
+
+
+def benchmarkRollouts(count=16, repeats=100):
+    """
+    Compare count scalar rollouts against one batch of count lockstep rollouts from the same state.
+    """
+    state = benchmarkEncounterState()
+    random.seed(0)
+    np.random.seed(0)
+
+    print(f"ROLLOUTS: {count} x rollout vs batchRollouts of {count}")
+    start = time.perf_counter()
+    for _ in range(repeats):
+        scalar_values = [rollout(state) for _ in range(count)]
+    scalar_time = (time.perf_counter() - start) / repeats
+
+    states = StateBatch(np.tile(state.ownship_pos, (count, 1)), np.tile(state.intruder_pos, (count, 1)),
+                        np.tile(state.ownship_vel, (count, 1)), np.tile(state.intruder_vel, (count, 1)))
+    start = time.perf_counter()
+    for _ in range(repeats):
+        batch_values = batchRollouts(states)
+    batch_time = (time.perf_counter() - start) / repeats
+
+    print(f"    rollout: {scalar_time * 1e3:.2f} ms (mean reward {np.mean(scalar_values):.4f})")
+    print(f"    batchRollouts: {batch_time * 1e3:.2f} ms (mean reward {np.mean(batch_values):.4f}, "
+          f"{scalar_time / batch_time:.1f}x)")
+
+
+def benchmarkRolloutHorizon(horizons=(None, 20, 5, 0), count=1000):
+    """
+    Time rollouts that fly straight to their final state in closed form after ROLLOUT_TURN_HORIZON random actions
+    against fully random rollouts (None). The mean reward shows the bias of the straight flight policy.
+    """
+    import PPA.MCTS
+    state = benchmarkEncounterState()
+    default_horizon = PPA.MCTS.ROLLOUT_TURN_HORIZON
+
+    print(f"ROLLOUT TURN HORIZON: {count} rollouts")
+    for horizon in horizons:
+        PPA.MCTS.ROLLOUT_TURN_HORIZON = horizon
+        random.seed(0)
+        start = time.perf_counter()
+        values = [rollout(state) for _ in range(count)]
+        elapsed = (time.perf_counter() - start) / count
+        print(f"    horizon {horizon}: {elapsed * 1e6:.1f} us per rollout (mean reward {np.mean(values):.4f})")
+    PPA.MCTS.ROLLOUT_TURN_HORIZON = default_horizon
+
+
+def benchmarkMacroSteps(macro_steps=(5, 10, 30), repeats=2000):
+    """
+    Compare a macro-action taken in closed form with stepMacroState() against the same action stepped k times
+    with stepState().
+    """
+    state = benchmarkEncounterState()
+
+    print("MACRO STEPS: stepMacroState vs stepState x k (LEFT)")
+    for steps in macro_steps:
+        start = time.perf_counter()
+        for _ in range(repeats):
+            stepMacroState(state, 'LEFT', TIME_INCREMENT, steps)
+        macro_time = (time.perf_counter() - start) / repeats
+
+        start = time.perf_counter()
+        for _ in range(repeats):
+            new_state = state
+            for _ in range(steps):
+                new_state, terminal_code = stepState(new_state, 'LEFT', TIME_INCREMENT)
+                if terminal_code != 0:
+                    break
+        step_time = (time.perf_counter() - start) / repeats
+
+        print(f"    k = {steps}: stepMacroState {macro_time * 1e6:.1f} us, stepState x k {step_time * 1e6:.1f} us "
+              f"({step_time / macro_time:.1f}x)")
+
+
+def benchmarkAdaptiveTimeStep(times_to_CPA=(60, 120, 240), count=500):
+    """
+    Time rollouts with fixed and adaptive time steps (refer to ADAPTIVE_TIME_STEP) for encounters with the
+    intruder closer and farther away.
+    """
+    import PPA.MCTS
+    default_adaptive = PPA.MCTS.ADAPTIVE_TIME_STEP
+
+    print(f"ADAPTIVE TIME STEP: {count} rollouts, fixed vs adaptive (max {ADAPTIVE_MAX_STEPS} steps)")
+    for time_to_CPA in times_to_CPA:
+        state = computeInitialState({0: time_to_CPA, 1: 30, 2: False, 3: 2000, 4: 100, 5: 10, 6: 0})
+        rollout_times = []
+        for adaptive in (False, True):
+            PPA.MCTS.ADAPTIVE_TIME_STEP = adaptive
+            random.seed(0)
+            start = time.perf_counter()
+            values = [rollout(state) for _ in range(count)]
+            rollout_times.append((time.perf_counter() - start) / count)
+        print(f"    time to CPA {time_to_CPA} s: fixed {rollout_times[0] * 1e6:.1f} us, adaptive "
+              f"{rollout_times[1] * 1e6:.1f} us per rollout ({rollout_times[0] / rollout_times[1]:.1f}x, "
+              f"first step {adaptiveStepCount(state, TIME_INCREMENT)} steps)")
+    PPA.MCTS.ADAPTIVE_TIME_STEP = default_adaptive
+
+
+def benchmarkLockstep(tree_counts=(1, 16, 64, 256), iterations=100):
+    """
+    Compare growing count trees one after the other (ArenaMCST) against growing them in lockstep (LockstepMCTS).
+    """
+    from PPA.LockstepMCTS import LockstepMCTS
+    state = benchmarkEncounterState()
+
+    print(f"LOCKSTEP: {iterations} iterations of count trees, ArenaMCST one by one vs LockstepMCTS")
+    for count in tree_counts:
+        random.seed(0)
+        np.random.seed(0)
+        start = time.perf_counter()
+        for _ in range(count):
+            mcts = ArenaMCST(state)
+            for _ in range(iterations):
+                mcts.expansion(mcts.selection())
+                mcts.simulate()
+        sequential_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        trees = LockstepMCTS([state] * count)
+        for _ in range(iterations):
+            trees.iterate()
+        lockstep_time = time.perf_counter() - start
+
+        per_iteration = 1e6 / (count * iterations)
+        print(f"    {count} trees: ArenaMCST {sequential_time * per_iteration:.1f} us, LockstepMCTS "
+              f"{lockstep_time * per_iteration:.1f} us per tree iteration ({sequential_time / lockstep_time:.1f}x)")
+
+
+def benchmarkTranspositionTable(table_sizes=(None, 1000, 100), trees=4, iterations=2000):
+    """
+    Grow trees one after the other without a transposition table and with tables of several sizes shared by all
+    the trees (refer to TranspositionTable.py).
+    """
+    from PPA.TranspositionTable import TranspositionTable
+    state = benchmarkEncounterState()
+
+    print(f"TRANSPOSITION TABLE: {trees} trees of {iterations} iterations, min visits = {TRANSPOSITION_MIN_VISITS}")
+    for table_size in ('no table',) + tuple(table_sizes):
+        random.seed(0)
+        np.random.seed(0)
+        table = None if table_size == 'no table' else TranspositionTable(max_size=table_size)
+        start = time.perf_counter()
+        for _ in range(trees):
+            mcts = ArenaMCST(state, transposition_table=table)
+            for _ in range(iterations):
+                mcts.expansion(mcts.selection())
+                mcts.simulate()
+        elapsed = time.perf_counter() - start
+
+        usage = ''
+        if table is not None:
+            report = table.report()
+            usage = (f", hit rate {report['hit_rate']:.2f}, {report['skipped_rollouts']} rollouts skipped, "
+                     f"{report['evictions']} evictions")
+        print(f"    {table_size}: {1e6 * elapsed / (trees * iterations):.1f} us per iteration{usage}")
+
+
+def benchmarkNodeBudget(node_budgets=(None, 2000, 500), iterations=6000):
+    """
+    Peak memory of a MCST harvested every MCTS_CUT iterations without a node budget and with several budgets
+    (refer to MCST.prune()).
+    """
+    state = benchmarkEncounterState()
+
+    print(f"NODE BUDGET: {iterations} iterations of a MCST, harvested and pruned every {MCTS_CUT} iterations")
+    for node_budget in node_budgets:
+        random.seed(0)
+        np.random.seed(0)
+        tracemalloc.start()
+        start = time.perf_counter()
+        mcts = MCST(state, node_budget=node_budget)
+        for i in range(iterations):
+            if i % MCTS_CUT == 0:
+                mcts.state_action_reward = []
+                mcts.getStateActionRewards(mcts.root)
+                mcts.prune()
+            mcts.expansion(mcts.selection())
+            mcts.simulate()
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        report = mcts.memoryReport()
+        print(f"    budget {node_budget}: peak {report['peak_nodes']} nodes, {report['evicted_nodes']} evicted, "
+              f"traced peak {peak / 1e6:.1f} MB, {1e6 * elapsed / iterations:.1f} us per iteration")
+
+
+class RejectionSamplingMCST(MCST):
+    """
+    The previous MCST selection, expansion and back-propagation: UCB1 computed child by child with its own log(N)
+    and expansion by drawing random numbers until one lands on a non expanded child.
+    """
+
+    def selection(self):
+        mcst_node = self.root
+        while mcst_node.expanded == ALL_EXPANDED:
+            left, no_turn, right = mcst_node.children
+            UCB1_left = left.Q + UCB1_C * math.sqrt((math.log(mcst_node.N) / left.N))
+            UCB1_right = right.Q + UCB1_C * math.sqrt((math.log(mcst_node.N) / right.N))
+            UCB1_no_turn = no_turn.Q + UCB1_C * math.sqrt((math.log(mcst_node.N) / no_turn.N))
+            values = [UCB1_no_turn, UCB1_left, UCB1_right]
+            mcst_node = (no_turn, left, right)[values.index(max(UCB1_no_turn, UCB1_left, UCB1_right))]
+            self.visitedStatesPath.append(mcst_node)
+        return mcst_node
+
+    def expansion(self, mcst_node):
+        while True:
+            rand_num = random.random()
+            if rand_num < 0.33 and mcst_node.children[1] is None:
+                action = 1
+                break
+            elif rand_num < 0.66 and mcst_node.children[0] is None:
+                action = 0
+                break
+            elif rand_num < 0.99 and mcst_node.children[2] is None:
+                action = 2
+                break
+        mcst_node.expanded |= 1 << action
+        new_state = getNewMacroState(mcst_node.state, ACTION_NAMES[action], TIME_INCREMENT, TRAINING_MACRO_STEPS)
+        mcst_node.children[action] = MCST_State(new_state)
+        self.lastExpandedState = mcst_node.children[action]
+        self.node_count += 1
+
+    def backpropagate(self, Q):
+        # No log(N) to keep up to date.
+        self.lastExpandedState.Q += Q
+        self.lastExpandedState.N += 1
+        self.lastExpandedState.dirty_bit = 1
+        for mcst_state in self.visitedStatesPath:
+            mcst_state.updateQN(Q)
+            mcst_state.N += 1
+            mcst_state.dirty_bit = 1
+        self.clearStatesPath()
+
+
+def benchmarkMCSTIterations(iterations=20000, repeats=5):
+    """
+    Iterations per second of the MCST tree operations (selection, expansion and back-propagation of a random
+    simulation value, no rollouts) with rejection sampling against the expanded bit mask and cached log(N).
+    The best of repeats runs of every tree type, run alternately.
+    """
+    state = benchmarkEncounterState()
+    values = np.random.default_rng(0).uniform(-1, 1, size=iterations).tolist()
+    tree_types = {'rejection sampling': RejectionSamplingMCST, 'expanded mask': MCST}
+
+    print(f"MCST ITERATIONS: {iterations} iterations without rollouts, best of {repeats}")
+    best = {name: float('inf') for name in tree_types}
+    for _ in range(repeats):
+        for name, tree_type in tree_types.items():
+            random.seed(0)
+            mcts = tree_type(state)
+            start = time.perf_counter()
+            for value in values:
+                mcts.expansion(mcts.selection())
+                mcts.backpropagate(value)
+            best[name] = min(best[name], time.perf_counter() - start)
+
+    for name, elapsed in best.items():
+        print(f"    {name}: {iterations / elapsed:,.0f} iterations/s")
+
+
+def recursiveStateActionRewards(mcts, current_state):
+    """
+    The previous MCST.getStateActionRewards(): A recursive walk of the dirty nodes from the root.
+    """
+    if current_state is None:
+        return 0
+    if current_state.dirty_bit == 0:
+        return current_state.Q
+
+    left, no_turn, right = current_state.children
+    for action, child in (('LEFT', left), ('RIGHT', right), ('NO_TURN', no_turn)):
+        mcts.state_action_reward.append((current_state.state, action, recursiveStateActionRewards(mcts, child)))
+    current_state.clean()
+    return current_state.Q
+
+
+class RecursiveHarvestMCST(MCST):
+    """
+    The previous MCST harvest: A recursive walk of the dirty nodes from the root.
+    """
+
+    def getStateActionRewards(self, current_state=None):
+        recursiveStateActionRewards(self, self.root if current_state is None else current_state)
+
+
+def benchmarkHarvest(iterations=20000, repeats=3):
+    """
+    Compare harvesting the (state, action, reward) tuples every MCTS_CUT iterations with the recursive walk
+    of the dirty nodes against the walk with an explicit stack. Every harvest is timed repeats times on copies of
+    the dirty flags (best time), and the deepest tree the recursion limit allows is reported.
+    """
+    print(f"HARVEST: RECURSIVE WALK vs EXPLICIT STACK ({iterations} iterations, cut every {MCTS_CUT})")
+    random.seed(0)
+    np.random.seed(0)
+    mcts = MCST(benchmarkEncounterState())
+    harvest_times = {'recursive': 0, 'explicit stack': 0}
+    same_tuples = True
+    for i in range(iterations + 1):
+        if i % MCTS_CUT == 0:
+            # Dirty nodes of this cut: Restored before every timed harvest.
+            nodes = []
+            stack = [mcts.root]
+            while stack:
+                mcst_node = stack.pop()
+                nodes.append(mcst_node)
+                stack.extend(child for child in mcst_node.children if child is not None)
+            dirty_bits = [mcst_node.dirty_bit for mcst_node in nodes]
+
+            tuples = {}
+            for harvest_type, harvest in [('recursive', RecursiveHarvestMCST.getStateActionRewards),
+                                          ('explicit stack', MCST.getStateActionRewards)]:
+                best = float('inf')
+                for _ in range(repeats):
+                    for mcst_node, dirty_bit in zip(nodes, dirty_bits):
+                        mcst_node.dirty_bit = dirty_bit
+                    mcts.state_action_reward = []
+                    start = time.perf_counter()
+                    harvest(mcts)
+                    best = min(best, time.perf_counter() - start)
+                harvest_times[harvest_type] += best
+                tuples[harvest_type] = sorted((tuple(state.ownship_pos), tuple(state.ownship_vel), action, reward)
+                                              for state, action, reward in mcts.state_action_reward)
+            same_tuples = same_tuples and tuples['recursive'] == tuples['explicit stack']
+        if i < iterations:
+            mcts.expansion(mcts.selection())
+            mcts.simulate()
+
+    harvests = iterations // MCTS_CUT + 1
+    for harvest_type, harvest_time in harvest_times.items():
+        print(f"    {harvest_type}: {harvest_time / harvests * 1e3:.2f} ms/harvest")
+    print(f"    same tuples: {same_tuples}")
+
+    # A chain of dirty nodes deeper than the recursion limit.
+    depth = sys.getrecursionlimit() + 100
+    mcts = MCST(benchmarkEncounterState())
+    mcst_node = mcts.root
+    for _ in range(depth):
+        mcst_node.children[ACTION_INDEX['NO_TURN']] = MCST_State(mcst_node.state)
+        mcst_node.dirty_bit = 1
+        mcst_node = mcst_node.children[ACTION_INDEX['NO_TURN']]
+    mcts.getStateActionRewards()
+    print(f"    {depth} deep chain: {len(mcts.state_action_reward)} tuples with the explicit stack")
+
+
+def randomModelStore(count, rng):
+    """
+    Generate a ModelStore of count random discrete states with random Q values and N counts.
+    """
+    model_store = ModelStore()
+    codes = np.unique(rng.integers(0, np.prod(STATE_RADICES), size=count))
+    model_store.bulkUpdate(codes, rng.uniform(-1, 0, size=(len(codes), 3)),
+                           rng.integers(1, 20, size=(len(codes), 3)))
+    return model_store
+
+
+def benchmarkParallelMerge(partial_sizes=(1000, 10000), model_size=10**5):
+    """
+    Cost the main process and the pipes pay for learning in parallel (-w): Per encounter, pickling and unpickling
+    the partial model of a worker and merging it into the model. Per batch (refer to PARALLEL_BATCH_SIZE), saving
+    the snapshot of the model to a model file and opening it in every worker.
+    """
+    rng = np.random.default_rng(0)
+    model = randomModelStore(model_size, rng)
+
+    print(f"PARALLEL MERGE: partial models merged into a {len(model):,} states model")
+    for partial_size in partial_sizes:
+        partial_model = randomModelStore(partial_size, rng)
+        start = time.perf_counter()
+        data = pickle.dumps(partial_model)
+        pickle_time = time.perf_counter() - start
+        start = time.perf_counter()
+        partial_model = pickle.loads(data)
+        unpickle_time = time.perf_counter() - start
+        start = time.perf_counter()
+        model.merge(partial_model)
+        merge_time = time.perf_counter() - start
+        print(f"    {len(partial_model):,} states: {len(data) / 1e6:.2f} MB, pickle {pickle_time * 1e3:.1f} ms, "
+              f"unpickle {unpickle_time * 1e3:.1f} ms, merge {merge_time * 1e3:.1f} ms")
+
+    with tempfile.TemporaryDirectory() as directory:
+        snapshot_path = os.path.join(directory, 'snapshot.ppa')
+        start = time.perf_counter()
+        saveModelFile(model, snapshot_path)
+        save_time = time.perf_counter() - start
+        start = time.perf_counter()
+        ColumnarModel(snapshot_path)
+        open_time = time.perf_counter() - start
+        print(f"    model snapshot per batch: {os.path.getsize(snapshot_path) / 1e6:.1f} MB, save "
+              f"{save_time * 1e3:.0f} ms, open per worker {open_time * 1e3:.2f} ms")
+
+
+def benchmarkBulkUpdate(iterations=5000):
+    """
+    Compare adding the (state, action, reward) tuples of an MCTS harvest to a model one tuple at a time
+    (the previous addModelObjects) against the vectorized bulk update.
+    """
+    random.seed(0)
+    mcts = MCST(benchmarkEncounterState())
+    for i in range(iterations):
+        mcts.expansion(mcts.selection())
+        mcts.simulate()
+    mcts.getStateActionRewards(mcts.root)
+    state_action_reward = [t for t in mcts.state_action_reward if t[2] != 0]
+    discretizers = setUpdiscretizers()[:3]
+
+    print(f"BULK UPDATE: {len(state_action_reward):,} TUPLES")
+    start = time.perf_counter()
+    scalar_model = ModelStore()
+    for state, action, reward in state_action_reward:
+        scalar_model.update(discretizeLocalStateCode(convertAbsToLocal(state), *discretizers), action, reward)
+    scalar_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    bulk_model = ModelStore()
+    states = StateBatch.fromStates([state for state, _, _ in state_action_reward])
+    actions = np.array([ACTION_INDEX[action] for _, action, _ in state_action_reward])
+    rewards = np.array([reward for _, _, reward in state_action_reward])
+    features = convertAbsToLocalBatch(states.ownship_pos, states.intruder_pos, states.ownship_vel, states.intruder_vel)
+    bulk_model.bulkUpdate(*groupedMeans(discretizeFeatureCodes(features, *discretizers), actions, rewards))
+    bulk_time = time.perf_counter() - start
+
+    same_states = sorted(scalar_model) == sorted(bulk_model)
+    same_N = same_states and all((s.LEFT_N, s.NO_TURN_N, s.RIGHT_N) == (b.LEFT_N, b.NO_TURN_N, b.RIGHT_N)
+                                 for s, b in ((scalar_model.get(c), bulk_model.get(c)) for c in scalar_model))
+    max_delta = max((abs(getattr(scalar_model.get(c), action + '_Q') - getattr(bulk_model.get(c), action + '_Q'))
+                     for c in scalar_model for action in ACTION_NAMES), default=0) if same_states else float('nan')
+    print(f"    per tuple: {scalar_time * 1e3:.1f} ms ({len(scalar_model):,} states)")
+    print(f"    bulk: {bulk_time * 1e3:.1f} ms ({scalar_time / bulk_time:.1f}x), same states: {same_states}, "
+          f"same N: {same_N}, max Q difference: {max_delta:.2e}")
+
+
+def benchmarkModelFile(size=10**6, lookups=10000):
+    """
+    Compare loading a model of size states and looking up states in it: Pickle file vs columnar model file.
+    """
+    rng = np.random.default_rng(0)
+    actions = ['LEFT', 'NO_TURN', 'RIGHT']
+    model_store = ModelStore()
+    for i, state_code in enumerate(randomStateCodes(size, rng)):
+        model_store.update(state_code, actions[i % 3], -0.1)
+    lookup_codes = rng.choice(model_store.stateCodes(), size=lookups).tolist()
+
+    print(f"MODEL FILE: LOAD AND {lookups:,} LOOKUPS ({len(model_store):,} states)")
+    with tempfile.TemporaryDirectory() as directory:
+        pickle_path = os.path.join(directory, 'model.pickle')
+        model_file_path = os.path.join(directory, 'model.ppa')
+        saveModel(model_store, pickle_path)
+        saveModelFile(model_store, model_file_path)
+        del model_store
+
+        for name, model_path in [('columnar', model_file_path), ('pickle', pickle_path)]:
+            # Do not time the collection of the previous model.
+            gc.collect()
+            tracemalloc.start()
+            start = time.perf_counter()
+            model = loadModel(model_path)
+            load_time = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            for state_code in lookup_codes:
+                model.get(state_code).getBestAction()
+            lookup_time = time.perf_counter() - start
+
+            print(f"    {name}: {os.path.getsize(model_path) / 2**20:.1f} MB on disk, load {load_time * 1e3:.1f} ms "
+                  f"(peak {peak / 2**20:.1f} MB), lookup {lookup_time / lookups * 1e6:.2f} us")
+            del model
+
+
+# Benchmark name -> function that runs it given the command line arguments.
+BENCHMARKS = {
+    'model-store': lambda args: benchmarkModelStore(args.MAX_SIZE),
+    'state-keys': lambda args: benchmarkStateKeys(),
+    'discretizer': lambda args: benchmarkDiscretizer(),
+    'propagation': lambda args: benchmarkPropagation(),
+    'local-state': lambda args: benchmarkLocalState(),
+    'terminal-check': lambda args: benchmarkTerminalCheck(),
+    'mcts-tree': lambda args: benchmarkMCTSTree(),
+    'rollouts': lambda args: benchmarkRollouts(),
+    'rollout-horizon': lambda args: benchmarkRolloutHorizon(),
+    'macro-steps': lambda args: benchmarkMacroSteps(),
+    'adaptive-time-step': lambda args: benchmarkAdaptiveTimeStep(),
+    'lockstep': lambda args: benchmarkLockstep(),
+    'transposition-table': lambda args: benchmarkTranspositionTable(),
+    'node-budget': lambda args: benchmarkNodeBudget(),
+    'mcst-iterations': lambda args: benchmarkMCSTIterations(),
+    'parallel-merge': lambda args: benchmarkParallelMerge(),
+    'model-file': lambda args: benchmarkModelFile(args.MAX_SIZE),
+    'bulk-update': lambda args: benchmarkBulkUpdate(),
+    'harvest': lambda args: benchmarkHarvest(),
+}
+
+"""
+Main method.
+"""
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser(description="Run the PPA micro-benchmarks.")
+    parser.add_argument('-b', action="store", dest="BENCHMARK", default="all",
+                        choices=['all'] + list(BENCHMARKS.keys()))
+    parser.add_argument('-n', action="store", dest="MAX_SIZE", type=int, default=10**6,
+                        help="Largest model size for the model-store and model-file benchmarks (e.g. 10000000).")
+    args = parser.parse_args()
+
+    for name, benchmark in BENCHMARKS.items():
+        if args.BENCHMARK in ('all', name):
+            benchmark(args)
@@ -1,11 +1,11 @@
 # libraries
 import matplotlib.pyplot as plt
-import pickle
+from PPA.ModelStore import *
 from PPA.Global_constants import *
 
 options_prompt = f"""
     ************************************************************************************************
-    MODEL_DIR: Path to the model pickle file.
+    MODEL_DIR: Path to the model file.
     ************************************************************************************************
     """
 print(options_prompt)
@@ -21,27 +21,13 @@ while True:
 
 x = ['D-O-D', 'T-D-O', 'O-V', 'I-V', 'D-I-O', 'T-I-O', 'A-R-N-P']
 
-D_O_Dbin = []
-T_D_Obin = []
-O_Vbin = []
-I_Vbin = []
-D_I_Obin = []
-T_I_Obin = []
-A_R_N_Pbin = []
-
-with open(MODEL_DIR, 'rb') as f:
-    # Pickle the 'data' dictionary using the highest protocol available.
-    Learned_Model = pickle.load(f)
-
-for states_in_model_list in Learned_Model.values():
-    for state_in_model in states_in_model_list:
-        D_O_Dbin.append(state_in_model.discrete_state.dis_ownship_destBIN)
-        T_D_Obin.append(state_in_model.discrete_state.theta_destintation_ownshipBIN)
-        O_Vbin.append(state_in_model.discrete_state.ownship_velBIN)
-        I_Vbin.append(state_in_model.discrete_state.intruder_velBIN)
-        D_I_Obin.append(state_in_model.discrete_state.dis_int_ownBIN)
-        T_I_Obin.append(state_in_model.discrete_state.theta_int_own_trackBIN)
-        A_R_N_Pbin.append(state_in_model.discrete_state.angle_rel_vel_neg_rel_posBIN)
+Learned_Model = loadModel(MODEL_DIR)
+
+# Unpack the codes of all the modeled discrete states at once: One row of 7 bins per state.
+state_codes = np.asarray(Learned_Model.stateCodes(), dtype=np.int64)
+state_bins = unpackStateCode(state_codes).reshape(-1, 7)
+
+D_O_Dbin, T_D_Obin, O_Vbin, I_Vbin, D_I_Obin, T_I_Obin, A_R_N_Pbin = state_bins.T
 
 # multiple line plot
 plt.plot([x[0]]*len(D_I_Obin), D_O_Dbin, marker='o', markerfacecolor='blue', markersize=12, color='skyblue', linewidth=4)
@@ -10,10 +10,16 @@ info_str = f'''
         *                                               
         *    # MCTS ITERATIONS = {MCTS_ITERATIONS}  
         *    MCTS CUT = {MCTS_CUT}
+        *    ROLLOUTS PER SIMULATION = {ROLLOUTS_PER_SIMULATION}
+        *    ROLLOUT TURN HORIZON = {ROLLOUT_TURN_HORIZON}
         *    GAMMA = {GAMMA}                        
         *    EPISODE LENGTH = {EPISODE_LENGTH}      
         *    EXPLORATION FACTOR (C) = {UCB1_C}      
         *    TIME INCREMENT = {TIME_INCREMENT}     
+        *    MACRO STEPS = {TRAINING_MACRO_STEPS}
+        *    ADAPTIVE TIME STEP = {ADAPTIVE_TIME_STEP} (MAX STEPS = {ADAPTIVE_MAX_STEPS})
+        *    TRANSPOSITION TABLE SIZE = {TRANSPOSITION_TABLE_SIZE} (MIN VISITS = {TRANSPOSITION_MIN_VISITS})
+        *    MCTS NODE BUDGET = {MCTS_NODE_BUDGET}
         *    TRAINING SET = {TRAINING_SET}          
         *                                           
         *               DISCRETE BINS                